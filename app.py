@@ -1,4 +1,8 @@
-import re, math, os
+import re, math, os, sys, time, json, uuid
+import hashlib
+import functools
+import threading
+import weakref
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
@@ -6,8 +10,17 @@ import streamlit as st
 import html
 import streamlit.components.v1 as components
 import oracledb
+from contextlib import contextmanager
 from datetime import date
 from pathlib import Path
+import bench_store
+import ora_async
+import result_cache
+import sql_replay
+from bench_store import (
+    BENCH_FILES, BENCH_MAP_FILE, BENCH_SHEET_DEFAULT,
+    load_bench_map, _norm_str, _norm_upper, _ensure_file, _read_index_file, _read_index_month_end,
+)
 # =========================
 #  CONFIG: ORACLE / POSTGRES
 # =========================
@@ -17,11 +30,36 @@ SID  = st.secrets.get("ORACLE_SID",  os.getenv("ORACLE_SID",  "DESA2"))
 USER = st.secrets.get("ORACLE_USER", os.getenv("ORACLE_USER", "HUB_USER"))
 PWD  = st.secrets.get("ORACLE_PWD",  os.getenv("ORACLE_PWD",  ""))
 
+# Pool Oracle (compartido por todas las sesiones del proceso)
+ORA_POOL_MIN        = int(st.secrets.get("ORACLE_POOL_MIN",        os.getenv("ORACLE_POOL_MIN",        "1")))
+ORA_POOL_MAX        = int(st.secrets.get("ORACLE_POOL_MAX",        os.getenv("ORACLE_POOL_MAX",        "8")))
+ORA_POOL_INCREMENT  = int(st.secrets.get("ORACLE_POOL_INCREMENT",  os.getenv("ORACLE_POOL_INCREMENT",  "1")))
+ORA_POOL_WAIT_MS    = int(st.secrets.get("ORACLE_POOL_WAIT_MS",    os.getenv("ORACLE_POOL_WAIT_MS",    "30000")))
+ORA_STMT_CACHE_SIZE = int(st.secrets.get("ORACLE_STMT_CACHE_SIZE", os.getenv("ORACLE_STMT_CACHE_SIZE", "50")))
+# Consultas vía la capa async de oracledb (un event loop + pool async compartido); 0 = pool síncrono
+ORA_ASYNC = str(st.secrets.get("ORACLE_ASYNC", os.getenv("ORACLE_ASYNC", "0"))).strip().lower() in ("1", "true", "yes")
+# Con ORACLE_ASYNC, las consultas del plan del reporte que llegan dentro de esta ventana salen juntas (un gather)
+ORA_ASYNC_BATCH_MS = int(st.secrets.get("ORACLE_ASYNC_BATCH_MS", os.getenv("ORACLE_ASYNC_BATCH_MS", "5")))
+# Fetch columnar (Arrow, fetch_df_all) en vez de pd.read_sql, con los mismos dtypes; 0 = pd.read_sql
+ORA_FETCH_ARROW = str(st.secrets.get("ORACLE_FETCH_ARROW", os.getenv("ORACLE_FETCH_ARROW", "1"))).strip().lower() in ("1", "true", "yes")
+# Catálogo de columnas (ALL_TAB_COLUMNS) de las vistas SIAPII; se recarga cada N segundos
+SCHEMA_CATALOG_TTL = int(st.secrets.get("SCHEMA_CATALOG_TTL", os.getenv("SCHEMA_CATALOG_TTL", "86400")))
+# Consultas del reporte en paralelo (1 = secuencial); no conviene pasar de ORACLE_POOL_MAX
+REPORT_QUERY_WORKERS = int(st.secrets.get("REPORT_QUERY_WORKERS", os.getenv("REPORT_QUERY_WORKERS", "6")))
+# Dimensiones en memoria (emisoras / productos / core_issuer): recarga forzada cada DIM_REFRESH_TTL s;
+# entre recargas se revisa su watermark (conteos / id máximo) cada DIM_WATERMARK_TTL s
+DIM_REFRESH_TTL   = int(st.secrets.get("DIM_REFRESH_TTL",   os.getenv("DIM_REFRESH_TTL",   "21600")))
+DIM_WATERMARK_TTL = int(st.secrets.get("DIM_WATERMARK_TTL", os.getenv("DIM_WATERMARK_TTL", "300")))
+# Sink JSON-lines de tiempos por consulta / sección (vacío = solo panel ?perf=1)
+PERF_LOG_PATH = st.secrets.get("PERF_LOG_PATH", os.getenv("PERF_LOG_PATH", ""))
+
 PG_HOST = st.secrets.get("PG_HOST", os.getenv("PG_HOST", "34.134.141.229"))
 PG_PORT = int(st.secrets.get("PG_PORT", os.getenv("PG_PORT", "6543")))
 PG_DB   = st.secrets.get("PG_DB",   os.getenv("PG_DB",   "columbus_databroker_prod"))
 PG_USER = st.secrets.get("PG_USER", os.getenv("PG_USER", "columbus_databroker_user"))
 PG_PWD  = st.secrets.get("PG_PWD",  os.getenv("PG_PWD",  ""))
+# Postgres vía COPY + parseo columnar con tipos declarados (pg_type) en vez de pd.read_sql; 0 = pd.read_sql
+PG_FETCH_ARROW = str(st.secrets.get("PG_FETCH_ARROW", os.getenv("PG_FETCH_ARROW", "1"))).strip().lower() in ("1", "true", "yes")
 
 DEFAULT_ALIAS   = st.secrets.get("DEFAULT_ALIAS", os.getenv("DEFAULT_ALIAS", "UNIB"))
 DEFAULT_INFL    = float(st.secrets.get("INFLACION_ANUAL", os.getenv("INFLACION_ANUAL", "0.035")))
@@ -33,14 +71,35 @@ REPORTO_RV_CSV = ",".join(str(i) for i in REPORTO_RV_PRODUCTS)
 APP_DIR = Path(__file__).resolve().parent
 DATA_DIR = APP_DIR / "data"
 
-BENCH_FILES = {
-    "PIP":    DATA_DIR / "Indices Pip.xlsx",
-    "RV":     DATA_DIR / "Indices RV.xlsx",
-    "BOLSAS": DATA_DIR / "Indices Bolsas.xlsx",
-    "SP":     DATA_DIR / "Indices SP.xlsx",
-}
-BENCH_MAP_FILE = DATA_DIR / "Mapa_Benchmarks.xlsx"
-BENCH_SHEET_DEFAULT = "indices"  # índices
+# Benchmarks: archivos de índices, mapa, cache Parquet y store versionado viven en bench_store.py
+# (también corre como CLI offline: python bench_store.py build)
+bench_store.configure(
+    cache_dir=st.secrets.get("BENCH_CACHE_DIR", os.getenv("BENCH_CACHE_DIR")),
+    store_dir=st.secrets.get("BENCH_STORE_DIR", os.getenv("BENCH_STORE_DIR")),
+)
+bench_store.open_store()  # mapea en memoria la versión vigente del store (si existe)
+# Backend de consultas: live | record (graba resultados) | replay (sirve grabaciones, sin credenciales)
+sql_replay.configure(
+    mode=st.secrets.get("SQL_BACKEND", os.getenv("SQL_BACKEND")),
+    replay_dir=st.secrets.get("SQL_REPLAY_DIR", os.getenv("SQL_REPLAY_DIR")),
+)
+ORA_AVAILABLE = bool(PWD) or sql_replay.is_replay()
+# Cache en disco de resultados Oracle: meses cerrados no expiran, el mes en curso vive RESULT_CACHE_OPEN_TTL s;
+# un mes cierra RESULT_CACHE_CLOSE_GRACE_DAYS días después de su fin (cargas tardías del último día).
+# RESULT_CACHE_SCHEMA_VERSION se sube si cambian las vistas de origen; el directorio se poda a
+# RESULT_CACHE_MAX_MB y a entradas usadas en los últimos RESULT_CACHE_MAX_AGE_DAYS días
+result_cache.configure(
+    cache_dir=st.secrets.get("RESULT_CACHE_DIR", os.getenv("RESULT_CACHE_DIR")),
+    open_ttl=int(st.secrets.get("RESULT_CACHE_OPEN_TTL", os.getenv("RESULT_CACHE_OPEN_TTL", "600"))),
+    close_grace_days=int(st.secrets.get("RESULT_CACHE_CLOSE_GRACE_DAYS", os.getenv("RESULT_CACHE_CLOSE_GRACE_DAYS", "5"))),
+    namespace=f"{HOST}:{PORT}/{SID}/{USER}/{sql_replay.MODE}",
+    schema_version=st.secrets.get("RESULT_CACHE_SCHEMA_VERSION", os.getenv("RESULT_CACHE_SCHEMA_VERSION", "")),
+    max_bytes=int(st.secrets.get("RESULT_CACHE_MAX_MB", os.getenv("RESULT_CACHE_MAX_MB", "2048"))) << 20,
+    max_age_days=float(st.secrets.get("RESULT_CACHE_MAX_AGE_DAYS", os.getenv("RESULT_CACHE_MAX_AGE_DAYS", "90"))),
+    enabled=str(st.secrets.get("RESULT_CACHE", os.getenv("RESULT_CACHE", "1"))).strip().lower() in ("1", "true", "yes"),
+)
+# Workers del precalentado de benchmarks en segundo plano (0 = desactivado)
+BENCH_PREWARM_WORKERS = int(st.secrets.get("BENCH_PREWARM_WORKERS", os.getenv("BENCH_PREWARM_WORKERS", "4")))
 
 def add_datapoints_to_fig(fig, decimals=1):
     """
@@ -82,13 +141,18 @@ def get_bench_map_rows(bm: pd.DataFrame, alias_cdm: str, nombre_corto_focus: str
     """Filtra filas del Mapa_Benchmarks para (alias, contrato) y opcionalmente producto.
     `modo` aquí es el MODO del mapa (p.ej. BLEND / MULTI), NO es 'ANUALIZADO/EFECTIVO'.
     """
+    if modo:
+        idx = bench_map_index(bm)
+        key = (_norm_upper(alias_cdm), _norm_str(nombre_corto_focus))
+        if producto is None:
+            rows = idx["contract_mode"].get(key + (_norm_upper(modo),))
+        else:
+            rows = idx["mode"].get(key + (_norm_prod_key(producto), _norm_upper(modo)))
+        return pd.DataFrame() if rows is None else rows.copy()
+
     rows = get_bench_rows(bm, alias_cdm, nombre_corto_focus, producto)
     if rows is None or len(rows) == 0:
         return pd.DataFrame()
-    if modo:
-        m = str(modo).strip().upper()
-        if "MODO" in rows.columns:
-            rows = rows[rows["MODO"].astype(str).str.upper().eq(m)].copy()
     return rows
 
 # =========================
@@ -672,10 +736,245 @@ def render_print_block(title: str, fig: go.Figure, print_mode: bool, break_after
         st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
 
 
+# =========================
+#  INSTRUMENTACIÓN (panel: ?perf=1 en la URL; sink JSONL: PERF_LOG_PATH)
+# =========================
+_PERF_SKIP = {"run_sql", "pg_run_sql", "wrapper", "_cache_body", "run", "<lambda>"}
+_perf_tls = threading.local()
+
+@st.cache_resource(show_spinner=False)
+def _perf_state() -> dict:
+    """Eventos de la última corrida de cada sesión + lock (también serializa el sink JSONL)."""
+    return {"lock": threading.Lock(), "runs": {}}
+
+def _perf_session() -> str | None:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx(suppress_warning=True)  # los workers del plan heredan el ctx
+    return ctx.session_id if ctx is not None else None
+
+def perf_begin_run(**tags):
+    """Abre la corrida actual de la sesión; descarta corridas de sesiones inactivas > 1 h."""
+    state = _perf_state()
+    now = time.time()
+    with state["lock"]:
+        runs = state["runs"]
+        for sid in [s for s, r in runs.items() if now - r["wall"] > 3600]:
+            del runs[sid]
+        runs[_perf_session()] = {"run_id": uuid.uuid4().hex[:12], "t0": time.perf_counter(),
+                                 "wall": now, "tags": tags, "events": []}
+
+def perf_record(kind: str, name: str, t_start: float, elapsed: float, **extra):
+    """Agrega un evento (sql / pg / cache / task / render / disk_cache) a la corrida de la sesión y al sink."""
+    state = _perf_state()
+    sid = _perf_session()
+    with state["lock"]:
+        run = state["runs"].get(sid)
+        if run is None:
+            return  # hilo sin sesión (p.ej. precalentado de benchmarks)
+        ev = {"kind": kind, "name": name, "start_s": round(t_start - run["t0"], 4),
+              "elapsed_s": round(elapsed, 4), "thread": threading.current_thread().name, **extra}
+        run["events"].append(ev)
+        if PERF_LOG_PATH:
+            try:
+                with open(PERF_LOG_PATH, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"ts": round(time.time(), 3), "session": sid, "run_id": run["run_id"],
+                                        **run["tags"], **ev}, default=str) + "\n")
+            except OSError:
+                pass
+
+def perf_tag(**tags):
+    """Etiquetas de la corrida (alias, periodo…) que se copian a cada línea del sink."""
+    state = _perf_state()
+    with state["lock"]:
+        run = state["runs"].get(_perf_session())
+        if run is not None:
+            run["tags"].update(tags)
+
+def perf_events() -> list:
+    state = _perf_state()
+    with state["lock"]:
+        run = state["runs"].get(_perf_session())
+        return list(run["events"]) if run else []
+
+def _perf_caller() -> str:
+    """Primera función de la app arriba de run_sql / pg_run_sql (la consulta 'dueña')."""
+    f = sys._getframe(2)
+    while f is not None and (f.f_code.co_name in _PERF_SKIP or f.f_code.co_filename != __file__):
+        f = f.f_back
+    return f.f_code.co_name if f is not None else "?"
+
+def perf_query(kind: str, st_cached: bool = False):
+    """
+    Mide una función (sql, params) -> DataFrame: tiempo, filas, bytes, hit/miss y función que llama.
+    st_cached=True: fn es st.cache_data y su cuerpo marca _perf_tls.executed; si no corrió, fue hit.
+    """
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(sql: str, params: dict | None = None):
+            _perf_tls.executed = False if st_cached else None
+            t0 = time.perf_counter()
+            try:
+                df = fn(sql, params)
+            except Exception as e:
+                perf_record(kind, _perf_caller(), t0, time.perf_counter() - t0,
+                            sql_id=hashlib.sha1(sql.encode()).hexdigest()[:8], error=type(e).__name__)
+                raise
+            executed = getattr(_perf_tls, "executed", None)
+            perf_record(kind, _perf_caller(), t0, time.perf_counter() - t0,
+                        sql_id=hashlib.sha1(sql.encode()).hexdigest()[:8], rows=len(df),
+                        bytes=int(df.memory_usage(index=False).sum()),
+                        cache=None if executed is None else ("miss" if executed else "hit"))
+            return df
+        return wrapper
+    return deco
+
+def perf_cache_data(**cache_kwargs):
+    """
+    st.cache_data de una función de consulta + evento "cache" (hit / miss) por llamada.
+    El cuerpo solo corre en miss y lo marca en una pila por hilo (cada llamada anidada tiene su marca).
+    """
+    def deco(fn):
+        @functools.wraps(fn)
+        def _cache_body(*args, **kwargs):
+            _perf_tls.cache_marks[-1][0] = True
+            return fn(*args, **kwargs)
+        cached = st.cache_data(**cache_kwargs)(_cache_body)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            marks = getattr(_perf_tls, "cache_marks", None)
+            if marks is None:
+                marks = _perf_tls.cache_marks = []
+            mark = [False]
+            marks.append(mark)
+            t0 = time.perf_counter()
+            try:
+                return cached(*args, **kwargs)
+            finally:
+                marks.pop()
+                perf_record("cache", fn.__name__, t0, time.perf_counter() - t0, cache="miss" if mark[0] else "hit")
+        wrapper.clear = cached.clear
+        return wrapper
+    return deco
+
+def perf_timed(fn):
+    """Tiempo de una sección render_* del reporte."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            perf_record("render", fn.__name__, t0, time.perf_counter() - t0)
+    return wrapper
+
+def _perf_disk_cache_hook(name: str, outcome: str, t_start: float, elapsed: float):
+    perf_record("disk_cache", name, t_start, elapsed, cache=outcome)
+
+result_cache.HOOK = _perf_disk_cache_hook
+perf_begin_run()
+
+def render_perf_panel():
+    ev = pd.DataFrame(perf_events())
+    if ev.empty:
+        st.caption("Sin eventos en esta corrida.")
+        return
+    ev = ev.sort_values("start_s").reset_index(drop=True)
+    colors = {"sql": "#2563EB", "pg": "#7C3AED", "cache": "#0EA5E9", "task": "#94A3B8", "render": "#16A34A",
+              "disk_cache": "#F59E0B", "fanout": "#1E3A8A"}
+    labels = ev["kind"] + " · " + ev["name"]
+    fig = go.Figure(go.Bar(
+        y=labels, x=ev["elapsed_s"], base=ev["start_s"], orientation="h",
+        marker_color=[colors.get(k, "#64748B") for k in ev["kind"]],
+        hovertemplate="%{y}<br>inicio %{base:.3f}s · %{x:.3f}s<extra></extra>",
+    ))
+    fig.update_layout(height=max(240, 18 * len(ev)), margin=dict(l=0, r=0, t=10, b=0),
+                      yaxis=dict(autorange="reversed", tickfont=dict(size=9)), xaxis_title="s")
+    st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
+    q = ev[ev["kind"].isin(["sql", "pg", "cache"])]
+    if not q.empty:
+        st.dataframe(q.drop(columns=["kind"]).sort_values("elapsed_s", ascending=False),
+                     use_container_width=True, hide_index=True)
+    st.caption(f"Disco: {result_cache.STATS}")
+
+# =========================
+#  POOL ORACLE
+# =========================
+@st.cache_resource(show_spinner=False)
+def get_pool():
+    if not PWD:
+        raise RuntimeError("Falta ORACLE_PWD en secrets o variable de entorno.")
+    dsn = oracledb.makedsn(HOST, PORT, sid=SID)
+    oracledb.defaults.arraysize = 1000
+    oracledb.defaults.prefetchrows = 1000
+    return oracledb.create_pool(
+        user=USER, password=PWD, dsn=dsn,
+        min=ORA_POOL_MIN, max=ORA_POOL_MAX, increment=ORA_POOL_INCREMENT,
+        getmode=oracledb.POOL_GETMODE_TIMEDWAIT, wait_timeout=ORA_POOL_WAIT_MS,
+        stmtcachesize=ORA_STMT_CACHE_SIZE,
+        ping_interval=60,
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_async_db() -> ora_async.AsyncOracle:
+    """Capa async compartida por todas las sesiones (un solo hilo de event loop)."""
+    if not PWD:
+        raise RuntimeError("Falta ORACLE_PWD en secrets o variable de entorno.")
+    return ora_async.AsyncOracle(
+        user=USER, password=PWD, dsn=oracledb.makedsn(HOST, PORT, sid=SID),
+        min=ORA_POOL_MIN, max=ORA_POOL_MAX, increment=ORA_POOL_INCREMENT,
+        wait_timeout_ms=ORA_POOL_WAIT_MS, stmtcachesize=ORA_STMT_CACHE_SIZE,
+        arrow=ORA_FETCH_ARROW,
+    )
+
+@st.cache_resource(show_spinner=False)
+def _pool_wait_stats() -> dict:
+    """Acumulados de espera al pedir conexión al pool (oracledb no los expone)."""
+    return {"lock": threading.Lock(), "acquires": 0, "wait_s": 0.0, "wait_max_s": 0.0, "errors": 0}
+
+@contextmanager
+def pooled_conn():
+    """Conexión del pool; se regresa al pool al salir. Mide el tiempo de espera del acquire."""
+    pool = get_pool()
+    stats = _pool_wait_stats()
+    t0 = time.perf_counter()
+    try:
+        conn = pool.acquire()
+    except Exception:
+        with stats["lock"]:
+            stats["errors"] += 1
+        raise
+    wait = time.perf_counter() - t0
+    with stats["lock"]:
+        stats["acquires"] += 1
+        stats["wait_s"] += wait
+        stats["wait_max_s"] = max(stats["wait_max_s"], wait)
+    with conn:
+        yield conn
+
+def pool_stats() -> dict:
+    """Salud del pool: abiertas / ocupadas / límites + espera promedio y máxima del acquire."""
+    pool = get_pool()
+    w = _pool_wait_stats()
+    with w["lock"]:
+        acquires, wait_s, wait_max_s, errors = w["acquires"], w["wait_s"], w["wait_max_s"], w["errors"]
+    return {
+        "open": pool.opened,
+        "busy": pool.busy,
+        "min": pool.min,
+        "max": pool.max,
+        "increment": pool.increment,
+        "stmt_cache": pool.stmtcachesize,
+        "acquires": acquires,
+        "acquire_errors": errors,
+        "wait_avg_ms": 1000.0 * wait_s / acquires if acquires else 0.0,
+        "wait_max_ms": 1000.0 * wait_max_s,
+    }
+
 # =========================
 #  HELPER: CONTRATOS POR ALIAS
 # =========================
-@st.cache_data(ttl=600, show_spinner=False)
+@perf_cache_data(ttl=600, show_spinner=False)
 def get_contratos_por_alias(alias: str) -> pd.DataFrame:
     """
     Regresa un DataFrame con los contratos del alias:
@@ -686,23 +985,19 @@ def get_contratos_por_alias(alias: str) -> pd.DataFrame:
     pero la lógica interna sigue trabajando con ID_CLIENTE.
     """
     alias = (alias or "").strip()
-    if not alias or not PWD:
+    if not alias or not ORA_AVAILABLE:
         return pd.DataFrame(columns=["ID_CLIENTE", "NOMBRE_CORTO"])
 
     try:
-        dsn = oracledb.makedsn(HOST, PORT, sid=SID)
-        conn = oracledb.connect(user=USER, password=PWD, dsn=dsn)
-        df = pd.read_sql(
+        df = run_sql(
             """
             SELECT DISTINCT ID_CLIENTE, NOMBRE_CORTO
             FROM SIAPII.V_M_CONTRATO_CDM
             WHERE ALIAS_CDM = :alias
             ORDER BY NOMBRE_CORTO
             """,
-            conn,
-            params={"alias": alias},
+            {"alias": alias},
         )
-        conn.close()
     except Exception:
         return pd.DataFrame(columns=["ID_CLIENTE", "NOMBRE_CORTO"])
 
@@ -841,6 +1136,14 @@ with st.sidebar:
 
     st.markdown("</div>", unsafe_allow_html=True)  # cierra sb-card
 
+    # Salud del pool Oracle (diagnóstico: ?pool=1 en la URL)
+    if st.query_params.get("pool") == "1" and PWD:
+        with st.expander("Pool Oracle", expanded=True):
+            try:
+                st.json(get_async_db().stats() if ORA_ASYNC else pool_stats())
+            except Exception as e:
+                st.caption(f"Pool no disponible: {e}")
+
 
 # =========================
 #  PARÁMETROS ACTIVOS (USADOS EN EL REPORTE)
@@ -852,6 +1155,7 @@ INFLACION_ANUAL = float(st.session_state.get("INFL_APPLIED", DEFAULT_INFL))
 
 CONTRATOS_SELECCIONADOS = st.session_state.get("CONTRATOS_APPLIED", [])
 CONTRATOS_KEY = tuple(sorted(CONTRATOS_SELECCIONADOS))  # para cache
+perf_tag(alias=ALIAS_CDM, anio=y, mes=m, n_contratos=len(CONTRATOS_KEY), print_mode=bool(st.session_state.get("PRINT_MODE", False)))
 
 NOMBRE_CORTO_FOCUS = st.session_state.get("NOMBRE_CORTO_FOCUS", "")
 
@@ -875,168 +1179,93 @@ LEGEND_RIGHT = dict(orientation="v", yanchor="top", y=1.0, xanchor="left", x=1.0
 #  BENCHMARKS: LOAD + BUILD
 # =========================
 
-import unicodedata
+PORT_TOT_ALIASES = ("PORTAFOLIO TOTAL", "PORTAFOLIO", "TOTAL", "TOTAL PORTAFOLIO")
 
-REQUIRED_MAP_COLS = [
-    "ALIAS_CDM", "NOMBRE_CORTO", "PRODUCTO",
-    "BENCHMARK_LABEL", "FILE_KEY", "SHEET_NAME", "COL_NAME",
-    "PESO", "MODO"
-]
-
-def _norm_colname(s: str) -> str:
-    """
-    Normaliza headers del Excel:
-    - strip
-    - upper
-    - sin acentos
-    - espacios/guiones -> _
-    - colapsa __
-    """
-    if s is None:
-        return ""
-    s = str(s).strip()
-    s = unicodedata.normalize("NFKD", s)
-    s = "".join(ch for ch in s if not unicodedata.combining(ch))  # quita acentos
-    s = s.upper()
-    for ch in [" ", "-", ".", "/", "\\", "(", ")", "[", "]", "{", "}", ":"]:
-        s = s.replace(ch, "_")
-    while "__" in s:
-        s = s.replace("__", "_")
-    return s.strip("_")
-
-def load_bench_map(map_path: Path, sheet_name=None) -> pd.DataFrame:
+def build_bench_map_index(df_map: pd.DataFrame) -> dict:
     """
-    Carga Mapa_Benchmarks.xlsx tolerando headers "sucios".
-    - Normaliza nombres de columna
-    - Acepta sinónimos comunes
-    - Luego aplica tus normalizaciones de valores
+    Índice en memoria del mapa (ya normalizado por load_bench_map), armado en una sola pasada.
+    Cada entrada apunta a las filas del mapa en su orden original:
+      contract      : (ALIAS_CDM, NOMBRE_CORTO)
+      product       : (ALIAS_CDM, NOMBRE_CORTO, PRODUCTO-key)
+      mode          : (ALIAS_CDM, NOMBRE_CORTO, PRODUCTO-key, MODO)
+      contract_mode : (ALIAS_CDM, NOMBRE_CORTO, MODO)
+      total         : (ALIAS_CDM, NOMBRE_CORTO) -> filas tipo PORTAFOLIO TOTAL
+    PRODUCTO-key = strip + upper (_norm_prod_key).
     """
-    _ensure_file(map_path, "Mapa_Benchmarks.xlsx")
-    df = pd.read_excel(map_path, sheet_name=sheet_name) if sheet_name else pd.read_excel(map_path)
-    df = df.copy()
-
-    # 1) Normaliza headers
-    orig_cols = list(df.columns)
-    df.columns = [_norm_colname(c) for c in df.columns]
-
-    # 2) Sinónimos / variantes (ajusta aquí si tu archivo usa otros nombres)
-    synonyms = {
-        # alias / contrato
-        "ALIAS": "ALIAS_CDM",
-        "ALIASCDM": "ALIAS_CDM",
-        "ALIAS_CDM_": "ALIAS_CDM",
-
-        "NOMBRECORTO": "NOMBRE_CORTO",
-        "NOMBRE_CORTO_": "NOMBRE_CORTO",
-        "CONTRATO": "NOMBRE_CORTO",
-
-        # producto
-        "ESTRATEGIA": "PRODUCTO",
-        "PRODUCTO_": "PRODUCTO",
-
-        # benchmark
-        "BENCHMARK": "BENCHMARK_LABEL",
-        "BENCHMARKS": "BENCHMARK_LABEL",
-        "BENCHMARK_LABEL_": "BENCHMARK_LABEL",
-        "INDICE": "BENCHMARK_LABEL",
-        "INDICE_LABEL": "BENCHMARK_LABEL",
-
-        # file
-        "ARCHIVO": "FILE_KEY",
-        "FILE": "FILE_KEY",
-        "FILEKEY": "FILE_KEY",
-
-        # sheet/col
-        "HOJA": "SHEET_NAME",
-        "SHEET": "SHEET_NAME",
-        "SHEETNAME": "SHEET_NAME",
-
-        "COLUMNA": "COL_NAME",
-        "COL": "COL_NAME",
-        "COLNAME": "COL_NAME",
-
-        # peso/modo
-        "WEIGHT": "PESO",
-        "PESOS": "PESO",
-
-        "TIPO": "MODO",
+    df = df_map.reset_index(drop=True)
+    alias = df["ALIAS_CDM"].map(_norm_upper).rename("A")
+    nombre = df["NOMBRE_CORTO"].map(_norm_str).rename("N")
+    prod = df["PRODUCTO"].map(_norm_prod_key).rename("P")
+    modo = df["MODO"].map(_norm_upper).rename("M")
+
+    def _group(keys, mask=None):
+        d = df if mask is None else df[mask]
+        keys = [k if mask is None else k[mask] for k in keys]
+        return {k: d.loc[pos_idx] for k, pos_idx in d.groupby(keys, sort=False).groups.items()}
+
+    return {
+        "contract": _group([alias, nombre]),
+        "product": _group([alias, nombre, prod]),
+        "mode": _group([alias, nombre, prod, modo]),
+        "contract_mode": _group([alias, nombre, modo]),
+        "total": _group([alias, nombre], mask=prod.isin(PORT_TOT_ALIASES)),
     }
 
-    # Aplica synonyms SOLO si la columna destino no existe ya
-    rename_map = {}
-    for c in df.columns:
-        if c in synonyms and synonyms[c] not in df.columns:
-            rename_map[c] = synonyms[c]
-    if rename_map:
-        df = df.rename(columns=rename_map)
-
-    # 3) Valida requeridas
-    missing = [c for c in REQUIRED_MAP_COLS if c not in df.columns]
-    if missing:
-        # Debug útil: muestra qué columnas sí detectó
-        raise ValueError(
-            "[BENCH] Mapa_Benchmarks no trae columnas requeridas.\n"
-            f"Faltan: {missing}\n"
-            f"Columnas detectadas (normalizadas): {list(df.columns)}\n"
-            f"Columnas originales: {orig_cols}"
-        )
-
-    # 4) Normalizaciones de valores (igual que ya tenías)
-    df["ALIAS_CDM"] = df["ALIAS_CDM"].apply(_norm_upper)
-    df["NOMBRE_CORTO"] = df["NOMBRE_CORTO"].apply(_norm_str)
-    df["PRODUCTO"] = df["PRODUCTO"].apply(_norm_str)
-    df["BENCHMARK_LABEL"] = df["BENCHMARK_LABEL"].apply(_norm_str)
-    df["FILE_KEY"] = df["FILE_KEY"].apply(_norm_upper)
-    df["SHEET_NAME"] = df["SHEET_NAME"].apply(_norm_str)
-    df["COL_NAME"] = df["COL_NAME"].apply(_norm_str)
-    df["MODO"] = df["MODO"].apply(_norm_upper)
-    df["PESO"] = pd.to_numeric(df["PESO"], errors="coerce").fillna(0.0)
-
-    return df
-
-
-def _norm_str(x):
-    return "" if pd.isna(x) else str(x).strip()
-
-def _norm_upper(x):
-    return _norm_str(x).upper()
-
-def _ensure_file(path: Path, label: str):
-    if path is None:
-        raise FileNotFoundError(f"[BENCH] Path None para {label}")
-    if not Path(path).exists():
-        raise FileNotFoundError(f"[BENCH] No existe el archivo {label}: {path}")
-
-def _read_index_file(file_path: Path, sheet_name: str):
+@st.cache_resource(show_spinner=False)
+def _bench_map_index_registry() -> dict:
+    """id(DataFrame del mapa) -> índice; vive en el proceso (sobrevive reruns)."""
+    return {}
+
+def bench_map_index(df_map: pd.DataFrame) -> dict:
+    """Índice del mapa, construido una vez por instancia de DataFrame (se libera junto con el DF)."""
+    registry = _bench_map_index_registry()
+    key = id(df_map)
+    idx = registry.get(key)
+    if idx is None:
+        idx = build_bench_map_index(df_map)
+        registry[key] = idx
+        weakref.finalize(df_map, registry.pop, key, None)
+    return idx
+
+@st.cache_resource(show_spinner=False)
+def _bench_map_state() -> dict:
+    """Mapa vigente compartido por todas las sesiones del proceso."""
+    return {"lock": threading.Lock(), "current": None}  # current = (llave archivo, DF)
+
+def get_bench_map(map_path: Path | None = None) -> pd.DataFrame:
     """
-    Lee archivo de índices (xlsx/xlsb) y devuelve DF con:
-      - columna 'FECHA' (datetime)
-      - columnas de índices numéricas (float)
+    Mapa_Benchmarks único por proceso. En cada rerun solo se hace stat() del archivo;
+    se recarga únicamente si cambió (ruta + mtime + tamaño): desde el store versionado si el
+    archivo es el mismo del build (bench_store.store_bench_map), si no, parseando el Excel.
+    La recarga publica (llave, DF) en un solo swap bajo lock: los lectores ven el mapa viejo
+    o el nuevo completo (con su índice ya armado), nunca uno a medias.
+    Si la recarga falla (p.ej. archivo a medio guardar) se sigue sirviendo el mapa anterior.
     """
-    _ensure_file(file_path, f"bench file {file_path.name}")
-
-    suffix = file_path.suffix.lower()
-
-    if suffix == ".xlsb":
-        df = pd.read_excel(file_path, sheet_name=sheet_name, engine="pyxlsb")
-    else:
-        df = pd.read_excel(file_path, sheet_name=sheet_name)
-
-    if df.shape[1] < 2:
-        raise ValueError(f"[BENCH] Hoja {sheet_name} en {file_path.name} no tiene columnas suficientes.")
-
-    # Primera columna es FECHA (diaria)
-    fecha_col = df.columns[0]
-    df = df.rename(columns={fecha_col: "FECHA"}).copy()
-    df["FECHA"] = pd.to_datetime(df["FECHA"], errors="coerce")
-    df = df.dropna(subset=["FECHA"]).sort_values("FECHA")
-    df = df.drop_duplicates(subset=["FECHA"], keep="last")
-
-    # Convertir columnas de índices a numérico
-    for c in df.columns[1:]:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
-
-    return df
+    path = Path(map_path or BENCH_MAP_FILE)
+    _ensure_file(path, "Mapa_Benchmarks.xlsx")
+    stat = path.stat()
+    key = (str(path.resolve()), stat.st_mtime_ns, stat.st_size)
+
+    state = _bench_map_state()
+    cur = state["current"]
+    if cur is not None and cur[0] == key:
+        return cur[1]
+
+    with state["lock"]:
+        cur = state["current"]
+        if cur is not None and cur[0] == key:
+            return cur[1]
+        try:
+            df = bench_store.store_bench_map(path)
+            if df is None:
+                df = load_bench_map(path)
+        except Exception:
+            if cur is None:
+                raise
+            return cur[1]
+        bench_map_index(df)
+        state["current"] = (key, df)
+        return df
 
 def get_bench_rows(df_map: pd.DataFrame, alias_cdm: str, nombre_corto: str, producto: str | None = None) -> pd.DataFrame:
     """
@@ -1044,22 +1273,28 @@ def get_bench_rows(df_map: pd.DataFrame, alias_cdm: str, nombre_corto: str, prod
     - Si producto es None: trae todas las filas del contrato (útil para benchmark de portafolio).
     - Si producto se pasa: filtra por ese producto.
     """
-    alias_u = _norm_upper(alias_cdm)
-    nombre = _norm_str(nombre_corto)
+    idx = bench_map_index(df_map)
+    key = (_norm_upper(alias_cdm), _norm_str(nombre_corto))
 
-    sub = df_map[(df_map["ALIAS_CDM"] == alias_u) & (df_map["NOMBRE_CORTO"] == nombre)].copy()
-
-    if producto is not None:
-        prod = _norm_str(producto)
-        sub = sub[sub["PRODUCTO"] == prod].copy()
+    if producto is None:
+        sub = idx["contract"].get(key)
+    else:
+        sub = idx["product"].get(key + (_norm_prod_key(producto),))
 
-    return sub
+    return df_map.iloc[0:0].copy() if sub is None else sub.copy()
 
-def build_benchmark_series(df_map_rows: pd.DataFrame, bench_files: dict) -> pd.DataFrame:
+def build_benchmark_series(df_map_rows: pd.DataFrame, bench_files: dict, month_end: bool = False,
+                           loaded: dict | None = None) -> pd.DataFrame:
     """
     Construye serie benchmark (compuesta por pesos) a partir de las filas del mapa ya filtradas.
     Devuelve DF:
       FECHA, BENCH (compuesto), y columnas individuales opcionales (por BENCHMARK_LABEL)
+
+    month_end=True: compone sobre las tablas precalculadas de cierre de mes
+    (FECHA = fin de mes, cada componente con su último nivel del mes) en vez de la serie diaria.
+
+    loaded: cache opcional (FILE_KEY, SHEET_NAME) -> DF de índices (del mismo tipo que month_end),
+    para compartir lecturas entre varias llamadas (ver build_bench_packs_for_contract).
     """
     if df_map_rows.empty:
         return pd.DataFrame(columns=["FECHA", "BENCH"])
@@ -1069,85 +1304,80 @@ def build_benchmark_series(df_map_rows: pd.DataFrame, bench_files: dict) -> pd.D
     if missing_keys:
         raise KeyError(f"[BENCH] FILE_KEY no existe en BENCH_FILES: {missing_keys}")
 
-    # Cargar archivos necesarios (cacheable por archivo+hoja)
-    # Nota: aquí lo hacemos simple. En Streamlit, cachea _read_index_file.
-    loaded = {}  # (FILE_KEY, SHEET_NAME) -> DF indices
-
-    parts = []
-    for _, r in df_map_rows.iterrows():
-        file_key = _norm_upper(r["FILE_KEY"])
-        sheet = _norm_str(r["SHEET_NAME"]) or "indices"
-        col = _norm_str(r["COL_NAME"])
-        label = _norm_str(r["BENCHMARK_LABEL"]) or col
-        peso = float(r["PESO"])
+    # Normalización de columnas del mapa (vectorizada, sin iterrows)
+    file_keys = df_map_rows["FILE_KEY"].map(_norm_upper).tolist()
+    sheets = [s or "indices" for s in df_map_rows["SHEET_NAME"].map(_norm_str)]
+    cols = df_map_rows["COL_NAME"].map(_norm_str).tolist()
+    labels = [l or c for l, c in zip(df_map_rows["BENCHMARK_LABEL"].map(_norm_str), cols)]
+    pesos = df_map_rows["PESO"].astype(float).tolist()
+
+    # Una etiqueta = una serie; pesos de etiquetas repetidas se suman (blend MULTI)
+    label_order = list(dict.fromkeys(labels))
+    label_pos = {l: i for i, l in enumerate(label_order)}
+    w = np.zeros(len(label_order))
+    for l, p in zip(labels, pesos):
+        w[label_pos[l]] += p
+
+    # (FILE_KEY, SHEET_NAME) -> {label: COL_NAME}  (primera aparición de cada etiqueta)
+    groups: dict[tuple, dict] = {}
+    seen = set()
+    for fk, sh, c, l in zip(file_keys, sheets, cols, labels):
+        if l in seen:
+            continue
+        seen.add(l)
+        groups.setdefault((fk, sh), {})[l] = c
 
+    # Una lectura + una selección de columnas por archivo/hoja, indexada por FECHA
+    frames = []
+    for (file_key, sheet), lab_cols in groups.items():
         file_path = bench_files[file_key] if file_key in bench_files else bench_files[file_key.upper()]
-        k = (file_key, sheet)
-
-        if k not in loaded:
-            loaded[k] = _read_index_file(Path(file_path), sheet)
-
-        df_idx = loaded[k]
-
-        if col not in df_idx.columns:
-            # A veces el encabezado trae espacios raros: intentamos match por strip
-            cols_strip = {str(c).strip(): c for c in df_idx.columns}
-            if col in cols_strip:
-                col_real = cols_strip[col]
-            else:
+        df_idx = loaded.get((file_key, sheet)) if loaded is not None else None
+        if df_idx is None:
+            reader = _read_index_month_end if month_end else _read_index_file
+            df_idx = reader(Path(file_path), sheet, usecols=list(lab_cols.values()))
+
+        # A veces el encabezado trae espacios raros: match exacto y luego por strip
+        cols_strip = {str(c).strip(): c for c in df_idx.columns}
+        real = {}
+        for label, col in lab_cols.items():
+            col_real = col if col in df_idx.columns else cols_strip.get(col)
+            if col_real is None:
                 raise KeyError(
                     f"[BENCH] COL_NAME '{col}' no existe en {file_key}:{Path(file_path).name} hoja '{sheet}'. "
-                    f"Ejemplo columnas: {list(df_idx.columns)[:8]}"
+                    f"Ejemplo columnas: {df_idx.attrs.get('ALL_COLUMNS', list(df_idx.columns))[:8]}"
                 )
-        else:
-            col_real = col
+            real[label] = col_real
+
+        sub = df_idx.set_index("FECHA")[list(real.values())]
+        sub.columns = list(real.keys())
+        frames.append(sub)
 
-        tmp = df_idx[["FECHA", col_real]].rename(columns={col_real: label}).copy()
-        tmp[label] = tmp[label].astype(float)
-        tmp["_PESO_"] = peso
-        tmp["_LABEL_"] = label
-        parts.append(tmp)
+    # Índice de fechas alineado (unión de todas las hojas) y matriz fechas x series
+    fechas = frames[0].index
+    for f in frames[1:]:
+        fechas = fechas.union(f.index)
+    fechas = fechas.sort_values()
 
-    # Unir por FECHA todas las series individuales
-    # Creamos un DF master con fechas
-    df_all = None
-    for tmp in parts:
-        label = tmp["_LABEL_"].iloc[0]
-        tmp2 = tmp[["FECHA", label]].copy()
-        df_all = tmp2 if df_all is None else df_all.merge(tmp2, on="FECHA", how="outer")
+    mat = np.full((len(fechas), len(label_order)), np.nan)
+    for f in frames:
+        pos = [label_pos[l] for l in f.columns]
+        mat[:, pos] = f.reindex(fechas).to_numpy(dtype=float)
 
-    df_all = df_all.sort_values("FECHA")
+    df_all = pd.DataFrame(mat, columns=label_order)
+    df_all.insert(0, "FECHA", fechas)
 
     # Cálculo del BENCH compuesto por pesos:
     # - Si hay MULTI con varias líneas 100, se suman (equivalente a promediar o sumar? -> aquí blend por pesos)
     # - Si pesos no suman 100, normalizamos por suma de pesos > 0.
-    weights = {}
-    for _, r in df_map_rows.iterrows():
-        label = _norm_str(r["BENCHMARK_LABEL"]) or _norm_str(r["COL_NAME"])
-        weights[label] = weights.get(label, 0.0) + float(r["PESO"])
-
-    # normaliza pesos
-    total_w = sum(w for w in weights.values() if w > 0)
+    total_w = w[w > 0].sum()
     if total_w <= 0:
         # si todo viene en 0 (error de mapa), devolvemos vacío
         df_all["BENCH"] = np.nan
         return df_all[["FECHA", "BENCH"]]
 
-    for k in list(weights.keys()):
-        weights[k] = weights[k] / total_w
-
-    # BENCH = suma(w_i * serie_i)
-    bench = None
-    for label, w in weights.items():
-        if label not in df_all.columns:
-            # por si label era col_name pero en df_all se guardó con BENCHMARK_LABEL
-            continue
-        s = df_all[label]
-        bench = (s * w) if bench is None else (bench + s * w)
-
-    df_all["BENCH"] = bench
-
-    return df_all[["FECHA", "BENCH"] + [c for c in df_all.columns if c not in ["FECHA", "BENCH"]]]
+    # BENCH = suma(w_i * serie_i) en un solo producto matriz-vector
+    df_all.insert(1, "BENCH", mat @ (w / total_w))
+    return df_all
 
 def _is_portafolio_total(x: str) -> bool:
     return str(x or "").strip().upper() == "PORTAFOLIO TOTAL"
@@ -1168,45 +1398,25 @@ def build_bench_pack_from_map(
       - str  => usa SOLO filas del mapa con PRODUCTO = <producto> (y excluye portafolio total)
     """
 
-    def _is_portafolio_total(x: str) -> bool:
-        s = str(x).strip().upper()
-        return s in ("PORTAFOLIO TOTAL", "PORTAFOLIO", "TOTAL", "TOTAL PORTAFOLIO")
-
     # base checks
     if bench_map_df is None or bench_map_df.empty:
         return pd.DataFrame(columns=["FECHA","ANIO","MES","BENCH_M","BENCH_YTD","BENCH_M_ANUAL","BENCH_YTD_ANUAL"])
 
-    a = str(alias_cdm).strip().upper()
-    nc = str(nombre_corto).strip()
-
-    dfm = bench_map_df.copy()
-
-    # normaliza columnas relevantes
-    for c in ["ALIAS_CDM", "NOMBRE_CORTO", "PRODUCTO", "FILE_KEY", "SHEET_NAME", "COL_NAME", "MODO"]:
-        if c in dfm.columns:
-            dfm[c] = dfm[c].astype(str).str.strip()
-
-    if "ALIAS_CDM" in dfm.columns:
-        dfm["ALIAS_CDM"] = dfm["ALIAS_CDM"].str.upper()
-    if "FILE_KEY" in dfm.columns:
-        dfm["FILE_KEY"] = dfm["FILE_KEY"].str.upper()
-    if "MODO" in dfm.columns:
-        dfm["MODO"] = dfm["MODO"].str.upper()
-
-    # 1) filtra por alias + nombre_corto
-    rows = dfm[(dfm["ALIAS_CDM"] == a) & (dfm["NOMBRE_CORTO"] == nc)].copy()
-    if rows.empty:
-        return pd.DataFrame(columns=["FECHA","ANIO","MES","BENCH_M","BENCH_YTD","BENCH_M_ANUAL","BENCH_YTD_ANUAL"])
-
-    # 2) filtra por producto según regla
+    # 1) + 2) lookup en el índice del mapa por alias + nombre_corto (+ producto según regla)
+    idx = bench_map_index(bench_map_df)
+    key = (_norm_upper(alias_cdm), _norm_str(nombre_corto))
     if producto is None:
-        rows = rows[rows["PRODUCTO"].apply(_is_portafolio_total)].copy()
+        rows = idx["total"].get(key)
     else:
-        prod_u = str(producto).strip().upper()
-        rows = rows[~rows["PRODUCTO"].apply(_is_portafolio_total)].copy()
-        rows["__PROD_U__"] = rows["PRODUCTO"].astype(str).str.strip().str.upper()
-        rows = rows[rows["__PROD_U__"] == prod_u].copy()
-        rows = rows.drop(columns=["__PROD_U__"], errors="ignore")
+        prod_u = _norm_prod_key(producto)
+        rows = None if prod_u in PORT_TOT_ALIASES else idx["product"].get(key + (prod_u,))
+    if rows is None or rows.empty:
+        return pd.DataFrame(columns=["FECHA","ANIO","MES","BENCH_M","BENCH_YTD","BENCH_M_ANUAL","BENCH_YTD_ANUAL"])
+
+    return _bench_pack_from_rows(rows.copy(), bench_files)
+
+def _bench_pack_from_rows(rows: pd.DataFrame, bench_files: dict, loaded: dict | None = None) -> pd.DataFrame:
+    """Pack mensual (ver build_bench_pack_from_map) a partir de filas del mapa ya filtradas."""
 
     # ===============================
     # BENCH_LABEL (post-filtro producto)
@@ -1286,20 +1496,16 @@ def build_bench_pack_from_map(
         # opcional: loguea warning
         return pd.DataFrame(columns=["FECHA","ANIO","MES","BENCH_M","BENCH_YTD","BENCH_M_ANUAL","BENCH_YTD_ANUAL"])
 
-    # 4) construir niveles diarios compuestos
-    bench_levels = build_benchmark_series(rows, bench_files)  # FECHA diaria, BENCH nivel
+    # 4) niveles compuestos a cierre de mes (desde la tabla month-end precalculada)
+    bench_levels = build_benchmark_series(rows, bench_files, month_end=True, loaded=loaded)  # FECHA fin de mes, BENCH nivel
     if bench_levels is None or bench_levels.empty or "BENCH" not in bench_levels.columns:
         return pd.DataFrame(columns=["FECHA","ANIO","MES","BENCH_M","BENCH_YTD","BENCH_M_ANUAL","BENCH_YTD_ANUAL"])
 
-    b = bench_levels.copy()
-    b["FECHA"] = pd.to_datetime(b["FECHA"], errors="coerce")
-    b = b.dropna(subset=["FECHA"]).sort_values("FECHA")
-    b["MES"] = b["FECHA"].dt.to_period("M").dt.to_timestamp("M")  # month-end
-
-    # 5) último nivel de cada mes (cierre de mes)
-    me = (b.groupby("MES", as_index=False)["BENCH"].last()
+    # 5) último nivel de cada mes (cierre de mes): ya viene uno por mes
+    me = (bench_levels[["FECHA", "BENCH"]].rename(columns={"FECHA": "MES"})
             .dropna(subset=["BENCH"])
-            .sort_values("MES"))
+            .sort_values("MES")
+            .reset_index(drop=True))
 
     # 6) rendimientos
     me["BENCH_M"] = me["BENCH"].pct_change()
@@ -1327,13 +1533,103 @@ def build_bench_pack_from_map(
     
     return out
 
+def build_bench_packs_for_contract(
+    bench_map_df: pd.DataFrame,
+    alias_cdm: str,
+    nombre_corto: str,
+    bench_files: dict,
+) -> dict:
+    """
+    Packs de benchmark de un contrato en una sola pasada:
+      {None: pack PORTAFOLIO TOTAL, "<PRODUCTO-key>": pack del producto, ...}
+    Las tablas month-end se leen una vez por (archivo, hoja) con la unión de columnas del contrato
+    y se comparten entre todos los productos.
+    Si un producto falla, su valor es la excepción (los demás se construyen igual).
+    """
+    idx = bench_map_index(bench_map_df)
+    key = (_norm_upper(alias_cdm), _norm_str(nombre_corto))
+    rows_all = idx["contract"].get(key)
+    if rows_all is None or rows_all.empty:
+        return {}
+
+    # precarga compartida: (FILE_KEY, SHEET_NAME) -> tabla month-end con todas las columnas del contrato
+    loaded = {}
+    sheets = rows_all["SHEET_NAME"].map(lambda x: _norm_str(x) or "indices")
+    for (file_key, sheet), cols in rows_all["COL_NAME"].map(_norm_str).groupby(
+        [rows_all["FILE_KEY"].map(_norm_upper), sheets], sort=False
+    ):
+        if file_key not in bench_files:
+            continue
+        try:
+            loaded[(file_key, sheet)] = _read_index_month_end(Path(bench_files[file_key]), sheet, usecols=list(cols.unique()))
+        except Exception:
+            # el error se reporta en el pack del producto que use esa hoja
+            pass
+
+    scopes = [(None, idx["total"].get(key))]
+    for prod_key in dict.fromkeys(rows_all["PRODUCTO"].map(_norm_prod_key)):
+        if prod_key not in PORT_TOT_ALIASES:
+            scopes.append((prod_key, idx["product"].get(key + (prod_key,))))
+
+    packs = {}
+    for prod_key, rows in scopes:
+        if rows is None or rows.empty:
+            packs[prod_key] = pd.DataFrame(columns=["FECHA","ANIO","MES","BENCH_M","BENCH_YTD","BENCH_M_ANUAL","BENCH_YTD_ANUAL"])
+            continue
+        try:
+            packs[prod_key] = _bench_pack_from_rows(rows.copy(), bench_files, loaded=loaded)
+        except Exception as e:
+            packs[prod_key] = e
+    return packs
+
+@st.cache_resource(show_spinner=False)
+def _bench_pack_store() -> dict:
+    """(ALIAS_CDM, NOMBRE_CORTO) -> (versión de fuentes, packs); compartido por todas las sesiones."""
+    return {}
+
+def _bench_sources_version(bench_files: dict) -> tuple:
+    """Llave de vigencia: mapa vigente + (tamaño, mtime) de cada archivo de índices."""
+    get_bench_map()
+    cur = _bench_map_state()["current"]
+    files = []
+    for k, p in sorted(bench_files.items()):
+        try:
+            stat = Path(p).stat()
+            files.append((k, stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            files.append((k, None, None))
+    return (cur[0] if cur else None, tuple(files))
+
+def bench_packs_for_contract(alias_cdm: str, nombre_corto: str) -> dict:
+    """Packs del contrato (ver build_bench_packs_for_contract), calculados una vez por versión de fuentes."""
+    key = (_norm_upper(alias_cdm), _norm_str(nombre_corto))
+    version = _bench_sources_version(BENCH_FILES)
+    store = _bench_pack_store()
+    hit = store.get(key)
+    if hit is not None and hit[0] == version:
+        return hit[1]
+    packs = build_bench_packs_for_contract(get_bench_map(), key[0], key[1], BENCH_FILES)
+    store[key] = (version, packs)
+    return packs
+
+def get_bench_pack(alias_cdm: str, nombre_corto: str, producto: str | None) -> pd.DataFrame | None:
+    """
+    Lookup del pack (producto=None => PORTAFOLIO TOTAL). None si el producto no tiene benchmark;
+    re-lanza el error si su construcción falló.
+    """
+    packs = bench_packs_for_contract(alias_cdm, nombre_corto)
+    pack = packs.get(None if producto is None else _norm_prod_key(producto))
+    if isinstance(pack, Exception):
+        raise pack
+    return pack
+
 def get_bench_ficha_rows(alias_cdm: str, nombre_corto_focus: str | None, producto: str | None, modo: str | None = None) -> pd.DataFrame:
     """Devuelve las filas del Mapa_Benchmarks para construir la ficha del benchmark.
     - Para contrato (portafolio): producto=None
     - Para producto: producto=<nombre producto>
     """
     try:
-        bm = load_bench_map(BENCH_MAP_FILE)
+        bm = get_bench_map()
     except Exception:
         return pd.DataFrame()
     return get_bench_map_rows(bm, alias_cdm, nombre_corto_focus, producto, modo)
@@ -1561,6 +1857,11 @@ def _norm_prod_key(x: str) -> str:
 
 PORT_TOT_KEY = "PORTAFOLIO TOTAL"
 
+def _is_month_end_table(fechas: pd.Series) -> bool:
+    """True si FECHA ya es una fila por mes a cierre (p.ej. salida de build_benchmark_series(month_end=True))."""
+    f = pd.to_datetime(fechas)
+    return f.is_unique and bool((f == f.dt.normalize() + pd.offsets.MonthEnd(0)).all())
+
 def bench_levels_to_monthly_returns(df_levels: pd.DataFrame) -> pd.DataFrame:
     """
     Entrada: df_levels con FECHA diaria y columnas numéricas (BENCH y/o labels individuales)
@@ -1581,9 +1882,12 @@ def bench_levels_to_monthly_returns(df_levels: pd.DataFrame) -> pd.DataFrame:
     if not val_cols:
         return pd.DataFrame()
 
-    # month-end bucket y último nivel del mes
-    df["MES"] = df["FECHA"].dt.to_period("M").dt.to_timestamp("M")  # month-end
-    last = df.groupby("MES")[val_cols].last().reset_index().rename(columns={"MES": "FECHA"})
+    # month-end bucket y último nivel del mes (si ya viene a cierre de mes, solo se rebana)
+    if _is_month_end_table(df["FECHA"]):
+        last = df[["FECHA"] + val_cols].reset_index(drop=True)
+    else:
+        df["MES"] = df["FECHA"].dt.to_period("M").dt.to_timestamp("M")  # month-end
+        last = df.groupby("MES")[val_cols].last().reset_index().rename(columns={"MES": "FECHA"})
     last = last.dropna(subset=val_cols, how="all").sort_values("FECHA")
 
     # returns
@@ -1601,59 +1905,82 @@ def bench_levels_to_monthly_returns(df_levels: pd.DataFrame) -> pd.DataFrame:
 
     return out
 
-def get_bench_rows_scope(
-    df_map: pd.DataFrame,
-    alias_cdm: str,
-    nombre_corto: str,
-    producto: str | None
-) -> pd.DataFrame:
+@st.cache_resource(show_spinner=False)
+def _bench_prewarm_state() -> dict:
+    """Estado del precalentado de benchmarks (uno por proceso)."""
+    return {"lock": threading.Lock(), "thread": None, "version": None,
+            "total": 0, "done": 0, "errors": [], "started": None, "finished": None}
+
+def _bench_prewarm_run(state: dict, version: tuple, workers: int):
     """
-    - producto == None: trae TODO el contrato (raro, normalmente no lo usamos)
-    - producto == 'PORTAFOLIO TOTAL': trae solo esas filas
-    - producto == '<nombre producto>': trae solo ese producto
+    Recorre todo el Mapa_Benchmarks con un pool de workers:
+      1) tablas month-end por (archivo, hoja)  -> parseo del Excel + cache Parquet (lo caro)
+      2) packs por (ALIAS_CDM, NOMBRE_CORTO)   -> PORTAFOLIO TOTAL + cada PRODUCTO al store compartido
     """
-    sub = get_bench_rows(df_map, alias_cdm, nombre_corto, producto=None)
-    if sub.empty:
-        return sub
-
-    if producto is None:
-        return sub
+    from concurrent.futures import ThreadPoolExecutor, as_completed
 
-    pkey = _norm_prod_key(producto)
-    sub["_PRODKEY_"] = sub["PRODUCTO"].apply(_norm_prod_key)
-    return sub[sub["_PRODKEY_"] == pkey].drop(columns=["_PRODKEY_"], errors="ignore")
+    try:
+        bm = get_bench_map()
+        sheets = list(dict.fromkeys(
+            (fk, _norm_str(sh) or "indices")
+            for fk, sh in zip(bm["FILE_KEY"], bm["SHEET_NAME"]) if fk in BENCH_FILES
+        ))
+        contracts = list(dict.fromkeys(zip(bm["ALIAS_CDM"], bm["NOMBRE_CORTO"])))
+        state.update(total=len(sheets) + len(contracts), done=0, errors=[], started=time.time(), finished=None)
+
+        def _sheet(file_key, sheet):
+            _read_index_month_end(Path(BENCH_FILES[file_key]), sheet)
+            return []
+
+        def _contract(alias_cdm, nombre_corto):
+            packs = bench_packs_for_contract(alias_cdm, nombre_corto)
+            return [f"{alias_cdm} / {nombre_corto} / {p or PORT_TOT_KEY}: {e}"
+                    for p, e in packs.items() if isinstance(e, Exception)]
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bench-prewarm") as ex:
+            # la etapa 2 arranca cuando la 1 terminó: así ningún pack parsea un Excel en frío
+            for fn, keys in ((_sheet, sheets), (_contract, contracts)):
+                futs = [ex.submit(fn, *k) for k in keys]
+                for fut in as_completed(futs):
+                    try:
+                        state["errors"].extend(fut.result())
+                    except Exception as e:
+                        state["errors"].append(str(e))
+                    state["done"] += 1
+    except Exception as e:
+        state["errors"].append(str(e))
+    finally:
+        state["version"] = version
+        state["finished"] = time.time()
 
-@st.cache_data(show_spinner=False)
-def bench_monthly_pack_cached(
-    alias_cdm: str,
-    nombre_corto: str,
-    producto_scope: str
-) -> pd.DataFrame:
+def start_bench_prewarm(workers: int = BENCH_PREWARM_WORKERS) -> dict:
     """
-    producto_scope:
-      - 'PORTAFOLIO TOTAL'  -> benchmark para Resumen (contrato)
-      - '<PRODUCTO>'        -> benchmark para rendimientos por producto
-    Devuelve DF con FECHA month-end + columnas tipo:
-      BENCH_M, BENCH_YTD, <label>_M, <label>_YTD, etc.
+    Lanza en un hilo de fondo el precalentado de todos los benchmarks del mapa, una vez por
+    versión de fuentes (mapa + archivos de índices). No bloquea el rerun.
+    Devuelve el estado compartido (total / done / errors / finished) para mostrar progreso.
     """
-    rows = get_bench_rows_scope(bench_map_df, alias_cdm, nombre_corto, producto_scope)
-    if rows.empty:
-        return pd.DataFrame()
-
-    df_levels = build_benchmark_series(rows, BENCH_FILES)  # FECHA + BENCH + labels individuales
-    if df_levels.empty:
-        return pd.DataFrame()
-
-    df_pack = bench_levels_to_monthly_returns(df_levels)
-    return df_pack
-
-def get_conn():
-    if not PWD:
-        raise RuntimeError("Falta ORACLE_PWD en secrets o variable de entorno.")
-    dsn = oracledb.makedsn(HOST, PORT, sid=SID)
-    oracledb.defaults.arraysize = 1000
-    oracledb.defaults.prefetchrows = 1000
-    return oracledb.connect(user=USER, password=PWD, dsn=dsn)
+    state = _bench_prewarm_state()
+    if workers <= 0:
+        return state
+    try:
+        version = _bench_sources_version(BENCH_FILES)
+    except Exception:
+        # sin mapa no hay nada que precalentar; el error se verá en la sección de benchmarks
+        return state
+
+    with state["lock"]:
+        th = state["thread"]
+        if (th is not None and th.is_alive()) or state["version"] == version:
+            return state
+        th = threading.Thread(target=_bench_prewarm_run, args=(state, version, workers),
+                              name="bench-prewarm", daemon=True)
+        state["thread"] = th
+        th.start()
+    return state
+
+_bench_prewarm = start_bench_prewarm()
+if _bench_prewarm["thread"] is not None and _bench_prewarm["thread"].is_alive():
+    st.sidebar.caption(f"Precalculando benchmarks… {_bench_prewarm['done']}/{_bench_prewarm['total']}")
 
 @st.cache_data(ttl=600, show_spinner=True)
 
@@ -1664,6 +1991,8 @@ def bench_to_month_end_levels(df_levels: pd.DataFrame) -> pd.DataFrame:
     df = df_levels.copy()
     df["FECHA"] = pd.to_datetime(df["FECHA"])
     df = df.sort_values("FECHA")
+    if _is_month_end_table(df["FECHA"]):
+        return df[["FECHA", "LEVEL"]].reset_index(drop=True)
     df["FECHA_ME"] = df["FECHA"] + pd.offsets.MonthEnd(0)
     out = (df.groupby("FECHA_ME", as_index=False)
              .agg(LEVEL=("LEVEL", "last"))
@@ -1671,12 +2000,123 @@ def bench_to_month_end_levels(df_levels: pd.DataFrame) -> pd.DataFrame:
     return out
 
 
+@perf_query("sql")
 def run_sql(sql: str, params: dict | None = None) -> pd.DataFrame:
-    conn = get_conn()
-    return pd.read_sql(sql, conn, params=params or {})
+    return sql_replay.through("oracle", sql, params, lambda: _run_sql_live(sql, params))
+
+def _run_sql_live(sql: str, params: dict | None = None) -> pd.DataFrame:
+    if ORA_ASYNC:
+        # en un worker del plan, la consulta se junta con las de los otros workers (SqlFanOut)
+        return (getattr(_plan_tls, "fanout", None) or get_async_db()).read_sql(sql, params)
+    with pooled_conn() as conn:
+        if ORA_FETCH_ARROW:
+            return ora_async.read_sql_arrow(conn, sql, params)
+        return pd.read_sql(sql, conn, params=ora_async.bind_collections(conn, params))
+
+class SqlFanOut:
+    """
+    Fan-out de las consultas Oracle del plan en el loop async (ORACLE_ASYNC): lo que los workers mandan
+    a run_sql dentro de una ventana de window_s se ejecuta junto con db.read_sql_many (un asyncio.gather
+    sobre el pool async), no una llamada por consulta. El primer worker de la ventana la despacha y los
+    demás esperan su resultado; el error de una consulta solo lo recibe quien la pidió.
+    Lo que sale de st.cache_data / result_cache nunca llega a run_sql, así que no se consulta de más.
+    """
+    def __init__(self, db, window_s: float):
+        self.db = db
+        self.window_s = window_s
+        self.batches = []  # tamaño de cada despacho
+        self._lock = threading.Lock()
+        self._open = None  # ventana abierta: [{"query", "done", "result"}]
+
+    def read_sql(self, sql: str, params: dict | None = None) -> pd.DataFrame:
+        item = {"query": (sql, params), "done": threading.Event()}
+        with self._lock:
+            opener = self._open is None
+            if opener:
+                self._open = []
+            self._open.append(item)
+        if opener:
+            time.sleep(self.window_s)
+            with self._lock:
+                batch, self._open = self._open, None
+            self.batches.append(len(batch))
+            t0 = time.perf_counter()
+            try:
+                out = self.db.read_sql_many({i: it["query"] for i, it in enumerate(batch)}, return_exceptions=True)
+            except Exception as e:  # el loop / pool no respondió: el mismo error para toda la ventana
+                out = dict.fromkeys(range(len(batch)), e)
+            perf_record("fanout", f"{len(batch)} consultas", t0, time.perf_counter() - t0, batch=len(batch))
+            for i, it in enumerate(batch):
+                it["result"] = out[i]
+                it["done"].set()
+        item["done"].wait()
+        if isinstance(item["result"], BaseException):
+            raise item["result"]
+        return item["result"]
+
+_plan_tls = threading.local()  # fanout del plan en curso (solo en sus workers)
+
+def _plan_task(name: str, fn, kwargs: dict):
+    t0 = time.perf_counter()
+    try:
+        return fn(**kwargs)
+    finally:
+        perf_record("task", name, t0, time.perf_counter() - t0)
 
-@st.cache_data(ttl=600, show_spinner=True)
+def run_query_plan(plan: dict, max_workers: int = REPORT_QUERY_WORKERS) -> dict:
+    """
+    Ejecuta un plan de consultas {nombre: (fn, [dependencias])} en un pool de hilos.
+    Cada tarea arranca en cuanto terminan sus dependencias y recibe sus resultados como
+    kwargs (fn(**{dep: resultado})); las independientes corren en paralelo contra el pool Oracle.
+    Devuelve {nombre: resultado}. Si una tarea falla, no se lanzan más y se re-lanza su error.
+    Con ORACLE_ASYNC las consultas que los workers mandan a Oracle no van una por una: salen en
+    lotes por el loop async (SqlFanOut -> read_sql_many).
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+    unknown = {d for _, deps in plan.values() for d in deps} - set(plan)
+    if unknown:
+        raise KeyError(f"Dependencias no definidas en el plan: {sorted(unknown)}")
+
+    # los workers comparten la sesión (perf_record la usa); no escriben elementos: las funciones que
+    # corre el plan tienen show_spinner=False y el único spinner es el del hilo principal
+    ctx = get_script_run_ctx()
+    fanout = SqlFanOut(get_async_db(), ORA_ASYNC_BATCH_MS / 1000) if ORA_ASYNC and not sql_replay.is_replay() else None
+
+    def init_worker():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        _plan_tls.fanout = fanout
+
+    results, running = {}, {}
+    pending = dict(plan)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="report-query",
+                            initializer=init_worker) as ex:
+        while pending or running:
+            for name, (fn, deps) in list(pending.items()):
+                if all(d in results for d in deps):
+                    running[ex.submit(_plan_task, name, fn, {d: results[d] for d in deps})] = name
+                    del pending[name]
+            if not running:
+                raise RuntimeError(f"Plan de consultas con ciclo: {sorted(pending)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                try:
+                    results[name] = fut.result()
+                except Exception:
+                    for f in running:
+                        f.cancel()
+                    raise
+    return results
+
+@perf_query("pg", st_cached=True)
+@st.cache_data(ttl=600, show_spinner=False)
 def pg_run_sql(sql: str, params: dict | None = None) -> pd.DataFrame:
+    _perf_tls.executed = True  # solo corre en miss de st.cache_data
+    return sql_replay.through("pg", sql, params, lambda: _pg_run_sql_live(sql, params))
+
+def _pg_run_sql_live(sql: str, params: dict | None = None) -> pd.DataFrame:
     import psycopg2
     from psycopg2 import OperationalError
     try:
@@ -1684,11 +2124,72 @@ def pg_run_sql(sql: str, params: dict | None = None) -> pd.DataFrame:
     except OperationalError as e:
         raise RuntimeError(f"Error PG: {e}")
     try:
-        df = pd.read_sql(sql, conn, params=params or {})
+        df = _pg_copy_df(conn, sql, params) if PG_FETCH_ARROW else pd.read_sql(sql, conn, params=params or {})
     finally:
         conn.close()
     return df
 
+_pg_types_cache: dict = {}  # (SQL, tipos de params) -> [(columna, tipo Arrow)]
+_pg_types_lock = threading.Lock()
+
+def _pg_arrow_types(cur, sql: str, params: dict | None, query: str) -> list:
+    """
+    [(columna, tipo Arrow)] declarados a partir de cursor.description (OID de pg_type). Lo que no
+    está en el mapeo viaja como texto: nada se infiere del CSV (un VARCHAR '00123' sigue siendo '00123').
+    COPY no trae description: la primera vez por SQL (plantilla + tipos de los params) se hace un
+    LIMIT 0 del query y el resultado queda en cache del proceso; las siguientes no pagan ese round trip.
+    """
+    import pyarrow as pa
+    key = (sql, tuple(sorted((k, type(v).__name__) for k, v in (params or {}).items())))
+    with _pg_types_lock:
+        types = _pg_types_cache.get(key)
+    if types is not None:
+        return types
+    by_oid = {
+        16: pa.bool_(),
+        20: pa.int64(), 21: pa.int64(), 23: pa.int64(), 26: pa.int64(),
+        700: pa.float64(), 701: pa.float64(), 1700: pa.float64(),  # numeric -> float (= coerce_float)
+        1082: pa.date32(),
+        1114: pa.timestamp("us"), 1184: pa.timestamp("us", tz="UTC"),
+    }
+    cur.execute(f"SELECT * FROM ({query}) AS q LIMIT 0")
+    types = [(d.name, by_oid.get(d.type_code, pa.string())) for d in cur.description]
+    with _pg_types_lock:
+        if len(_pg_types_cache) >= 256:
+            _pg_types_cache.clear()
+        _pg_types_cache[key] = types
+    return types
+
+def _pg_copy_df(conn, sql: str, params: dict | None = None) -> pd.DataFrame:
+    """
+    SELECT vía COPY ... TO STDOUT (CSV) y parseo columnar con pyarrow (multihilo), sin tuplas por fila.
+    Los tipos de columna vienen declarados del servidor (_pg_arrow_types), no inferidos del texto, y
+    los dtypes resultantes son los de pd.read_sql (ora_async.arrow_table_to_pandas). timestamptz llega
+    en UTC; con la sesión en una zona con horario de verano pd.read_sql lo dejaría como object.
+    NULL sin comillas -> null; "" entre comillas -> cadena vacía (misma semántica que el CSV de COPY).
+    """
+    import io
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    with conn.cursor() as cur:
+        query = cur.mogrify(sql, params or None).decode("utf-8").strip().rstrip(";")  # COPY no acepta binds
+        types = _pg_arrow_types(cur, sql, params, query)
+        buf = io.BytesIO()
+        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, ENCODING 'UTF8')", buf)
+    if not buf.getbuffer().nbytes:  # 0 filas: read_csv no acepta un CSV vacío
+        tbl = pa.Table.from_arrays([pa.array([], type=t) for _, t in types], names=[name for name, _ in types])
+        return ora_async.arrow_table_to_pandas(tbl)
+    buf.seek(0)
+    tbl = pacsv.read_csv(
+        buf,
+        read_options=pacsv.ReadOptions(column_names=[name for name, _ in types]),
+        convert_options=pacsv.ConvertOptions(
+            column_types=dict(types), strings_can_be_null=True, quoted_strings_can_be_null=False,
+            true_values=["t"], false_values=["f"],
+        ),
+    )
+    return ora_async.arrow_table_to_pandas(tbl)
+
 def money_to_float_series(serie: pd.Series) -> pd.Series:
     if pd.api.types.is_numeric_dtype(serie):
         return serie.astype(float).fillna(0.0)
@@ -1722,8 +2223,13 @@ CASE_ACTIVO = f"""
 # =========================
 def build_contrato_filter_sql(contratos, col_qualified: str, param_prefix: str):
     """
-    Construye fragmento 'AND col_qualified IN (:p0, :p1, ...)' + diccionario de parámetros
-    a partir de la lista de contratos seleccionados.
+    Construye fragmento 'AND col_qualified IN (SELECT COLUMN_VALUE FROM TABLE(:param_prefix))' +
+    parámetros a partir de la lista de contratos seleccionados. Los ids viajan en un solo bind de
+    colección (ora_async.IdList): no aplica el límite de 1000 expresiones del IN.
+    Sin estadísticas de la colección el optimizador supone ~8k filas (tamaño de bloque) y con uno o
+    diez contratos elige hash joins / full scans; el hint CARDINALITY le da el orden de magnitud,
+    redondeado a potencia de 10 para que cada consulta tenga pocas variantes de texto (statement
+    cache / shared pool): 1-10 ids comparten SQL, 11-100 otro, etc.
     """
     if not contratos:
         return "", {}
@@ -1741,32 +2247,82 @@ def build_contrato_filter_sql(contratos, col_qualified: str, param_prefix: str):
         unique.append(v)
     if not unique:
         return "", {}
-    placeholders = []
-    params = {}
-    for i, cid in enumerate(unique):
-        key = f"{param_prefix}{i}"
-        placeholders.append(f":{key}")
-        params[key] = cid
-    clause = f" AND {col_qualified} IN ({', '.join(placeholders)}) "
-    return clause, params
+    card = 10 ** max(1, math.ceil(math.log10(len(unique))))
+    clause = (f" AND {col_qualified} IN (SELECT /*+ CARDINALITY(t {card}) */ t.COLUMN_VALUE"
+              f" FROM TABLE(:{param_prefix}) t) ")
+    return clause, {param_prefix: ora_async.IdList(unique)}
+
+def build_day_range_sql(col_qualified: str, d_ini, d_fin_next, param_prefix: str):
+    """
+    Días completos [d_ini, d_fin_next) como rango medio abierto sobre la columna tal cual:
+    'AND col >= :p_ini AND col < :p_fin'. Nunca TRUNC(col) = ..., que impide usar el índice.
+    """
+    clause = (f" AND {col_qualified} >= TO_DATE(:{param_prefix}_ini,'YYYY-MM-DD')"
+              f" AND {col_qualified} <  TO_DATE(:{param_prefix}_fin,'YYYY-MM-DD') ")
+    return clause, {f"{param_prefix}_ini": pd.Timestamp(d_ini).strftime("%Y-%m-%d"),
+                    f"{param_prefix}_fin": pd.Timestamp(d_fin_next).strftime("%Y-%m-%d")}
+
+def build_ym_range_sql(anio_col: str, mes_col: str, start, end, param_prefix: str):
+    """
+    Meses [start, end] sobre columnas ANIO / MES sin armar una fecha por renglón:
+    'AND anio BETWEEN :p_y0 AND :p_y1 AND anio*100+mes BETWEEN :p_ym0 AND :p_ym1'.
+    El rango de ANIO usa el índice; la segunda condición solo recorta los meses de los años extremos.
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    clause = (f" AND {anio_col} BETWEEN :{param_prefix}_y0 AND :{param_prefix}_y1"
+              f" AND {anio_col} * 100 + {mes_col} BETWEEN :{param_prefix}_ym0 AND :{param_prefix}_ym1 ")
+    return clause, {f"{param_prefix}_y0": start.year, f"{param_prefix}_y1": end.year,
+                    f"{param_prefix}_ym0": start.year * 100 + start.month,
+                    f"{param_prefix}_ym1": end.year * 100 + end.month}
 
 # =========================
 #  UTILIDADES EXTRA
 # =========================
-@st.cache_data(ttl=900, show_spinner=True)
+@perf_cache_data(ttl=900, show_spinner=True)
 def get_num_contratos(alias: str) -> int:
     q = """SELECT COUNT(DISTINCT ID_CLIENTE) AS N FROM SIAPII.V_M_CONTRATO_CDM WHERE ALIAS_CDM = :a"""
     df = run_sql(q, {"a": alias})
     return int(df.iloc[0,0]) if not df.empty else 0
 
-def _col_exists(owner:str, table:str, col:str) -> bool:
-    q = """
-    SELECT COUNT(*) AS N
-    FROM ALL_TAB_COLUMNS
-    WHERE OWNER = :o AND TABLE_NAME = :t AND COLUMN_NAME = :c
+# =========================
+#  CATÁLOGO DE ESQUEMA (ALL_TAB_COLUMNS)
+# =========================
+SCHEMA_OWNER = "SIAPII"
+SCHEMA_VIEWS = (
+    "V_CLIENTE_ESTADISTICAS", "V_HIS_POSICION_CLIENTE", "V_M_CONTRATO_CDM", "V_M_EMISORA",
+    "V_M_PRODUCTO", "V_RENDIMIENTO_CTO", "V_RENDIMIENTO_PROD", "V_TASAS_REFERENCIA",
+)
+
+@st.cache_resource(ttl=SCHEMA_CATALOG_TTL, show_spinner=False)
+def schema_catalog() -> dict:
+    """
+    {(TABLE_NAME, COLUMN_NAME): DATA_TYPE} de todas las vistas de SCHEMA_VIEWS en una sola consulta.
+    Compartido por todas las sesiones; las banderas de capacidad (_col_exists / _col_type) son lookups.
     """
-    df = run_sql(q, {"o": owner.upper(), "t": table.upper(), "c": col.upper()})
-    return (not df.empty) and (int(df.iloc[0,0]) > 0)
+    binds = {f"t{i}": t for i, t in enumerate(SCHEMA_VIEWS)}
+    df = run_sql(f"""
+        SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE
+        FROM ALL_TAB_COLUMNS
+        WHERE OWNER = :o
+          AND TABLE_NAME IN ({", ".join(":" + k for k in binds)})
+    """, {"o": SCHEMA_OWNER, **binds})
+    return {(str(t).upper(), str(c).upper()): str(d).strip().upper()
+            for t, c, d in df[["TABLE_NAME", "COLUMN_NAME", "DATA_TYPE"]].itertuples(index=False)}
+
+def _col_type(owner: str, table: str, col: str) -> str | None:
+    """DATA_TYPE de la columna (None si no existe). Fuera del catálogo cae a ALL_TAB_COLUMNS."""
+    owner, table, col = owner.upper(), table.upper(), col.upper()
+    if owner == SCHEMA_OWNER and table in SCHEMA_VIEWS:
+        return schema_catalog().get((table, col))
+    df = run_sql("""
+        SELECT DATA_TYPE
+        FROM ALL_TAB_COLUMNS
+        WHERE OWNER = :o AND TABLE_NAME = :t AND COLUMN_NAME = :c
+    """, {"o": owner, "t": table, "c": col})
+    return None if df.empty else str(df.iloc[0, 0]).strip().upper()
+
+def _col_exists(owner:str, table:str, col:str) -> bool:
+    return _col_type(owner, table, col) is not None
 
 def _to_dec(x):
     if pd.isna(x): return np.nan
@@ -1879,15 +2435,48 @@ def build_yearly_accum_series(
     return x_labels, y_vals
 
 # =========================
-#  Rendimientos contrato 12m
+#  Rendimientos: ventana única por nivel (12m / n años / mes de corte son rebanadas)
 # =========================
-@st.cache_data(ttl=900, show_spinner=True)
-def rend_bruto_contrato_hist_12m(alias: str, anio: int, mes: int, contratos_key: tuple[int, ...] | None = None) -> pd.DataFrame:
+REND_HIST_YEARS = 5  # años que baja cada loader; la vista de n años y la de 12m salen de aquí
+
+def _rend_window(anio: int, mes: int, n_years: int) -> tuple[pd.Timestamp, pd.Timestamp]:
     ref = pd.Timestamp(year=int(anio), month=int(mes), day=1)
-    start = (ref - pd.DateOffset(months=11)).replace(day=1)
-    end   = (ref + pd.offsets.MonthEnd(0))
+    start = pd.Timestamp(year=int(anio) - (n_years - 1), month=1, day=1)
+    return start, ref + pd.offsets.MonthEnd(0)
 
-    filtro_cts, extra_params = build_contrato_filter_sql(contratos_key, "ID_CLIENTE", "cid_rc")
+def _rend_slice(df: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+    """Filas con (ANIO, MES) dentro de los meses [start, end]."""
+    if df.empty:
+        return df
+    per = pd.to_numeric(df["ANIO"], errors="coerce") * 12 + pd.to_numeric(df["MES"], errors="coerce")
+    return df[per.between(start.year * 12 + start.month, end.year * 12 + end.month)]
+
+@perf_cache_data(ttl=900, show_spinner=False)
+@result_cache.persist("rend_cto_window", last_day=lambda a: _rend_window(a["anio"], a["mes"], 1)[1],
+                      deps=(build_contrato_filter_sql, build_ym_range_sql))
+def rend_cto_window(alias: str, anio: int, mes: int, n_years: int = REND_HIST_YEARS,
+                    contratos_key: tuple[int, ...] | None = None) -> pd.DataFrame:
+    """
+    V_RENDIMIENTO_CTO (GESTION BRUTA, todos los niveles) de enero de anio-(n_years-1) al mes de corte.
+    Una sola consulta por (alias, corte, contratos): de aquí salen el histórico 12m, el de n años
+    (NIVEL = 'CONTRATO') y el mes de corte de rend_bruto_contrato_y_producto.
+    """
+    start, end = _rend_window(anio, mes, n_years)
+    sel_cols = """
+        r.ANIO, r.MES, r.ID_CDM, r.ID_CLIENTE,
+        r.MODALIDAD, r.NIVEL, r.PERIODO, r.MONEDA_ORIGEN, r.NIVEL_PRODUCTO,
+        r.TIPO_RENDIMIENTO,
+        r.TASA, r.TASA_ACUMULADO,
+        r.TASA_EFECTIVA, r.PLAZO,
+        r.TASA_EFECTIVA_ACUMULADO, r.PLAZO_ACUMULADO
+    """
+    if _col_exists('SIAPII','V_RENDIMIENTO_CTO','ID_PRODUCTO'):
+        sel_cols += ", r.ID_PRODUCTO"
+    if _col_exists('SIAPII','V_RENDIMIENTO_CTO','DESCRIPCION_PRODUCTO'):
+        sel_cols += ", r.DESCRIPCION_PRODUCTO"
+
+    filtro_cts, extra_params = build_contrato_filter_sql(contratos_key, "ID_CLIENTE", "cid_rcw")
+    filtro_ym, ym_params = build_ym_range_sql("r.ANIO", "r.MES", start, end, "rcw")
 
     sql = f"""
     WITH CTS AS (
@@ -1896,61 +2485,35 @@ def rend_bruto_contrato_hist_12m(alias: str, anio: int, mes: int, contratos_key:
       WHERE ALIAS_CDM = :alias
       {filtro_cts}
     )
-    SELECT
-        r.ANIO,
-        r.MES,
-        r.TASA,
-        r.TASA_ACUMULADO,
-        r.TASA_EFECTIVA,
-        r.TASA_EFECTIVA_ACUMULADO
+    SELECT {sel_cols}
     FROM SIAPII.V_RENDIMIENTO_CTO r
     JOIN CTS c ON c.ID_CLIENTE = r.ID_CLIENTE
     WHERE UPPER(r.TIPO_RENDIMIENTO) LIKE 'GESTION BRUTA'
-      AND r.NIVEL = 'CONTRATO'
-      AND TRUNC(TO_DATE(r.ANIO || '-' || LPAD(r.MES,2,'0') || '-01', 'YYYY-MM-DD'))
-          BETWEEN TO_DATE(:d_ini,'YYYY-MM-DD') AND TO_DATE(:d_fin,'YYYY-MM-DD')
+      {filtro_ym}
     """
-    params = {
-        "alias": alias,
-        "d_ini": start.strftime("%Y-%m-%d"),
-        "d_fin": end.strftime("%Y-%m-%d"),
-    }
+    params = {"alias": alias, **ym_params}
     params.update(extra_params)
+    return run_sql(sql, params)
 
-    df = run_sql(sql, params)
-    if df.empty:
-        return pd.DataFrame(columns=[
-            "ANIO","MES",
-            "TASA_M_ANUAL","TASA_ACUM_ANUAL",
-            "TASA_M_EFEC","TASA_ACUM_EFEC"
-        ])
-    df = df.sort_values(["ANIO","MES"]).groupby(["ANIO","MES"], as_index=False).last()
-    df["TASA_M_ANUAL"]    = df["TASA"].apply(_to_dec)
-    df["TASA_ACUM_ANUAL"] = df["TASA_ACUMULADO"].apply(_to_dec)
-    df["TASA_M_EFEC"]     = df["TASA_EFECTIVA"].apply(_to_dec)
-    df["TASA_ACUM_EFEC"]  = df["TASA_EFECTIVA_ACUMULADO"].apply(_to_dec)
-    return df[[
-        "ANIO","MES",
-        "TASA_M_ANUAL","TASA_ACUM_ANUAL",
-        "TASA_M_EFEC","TASA_ACUM_EFEC"
-    ]]
-
-# =========================
-#  Rendimientos por producto 12m (V_RENDIMIENTO_PROD)
-# =========================
-@st.cache_data(ttl=900, show_spinner=True)
-def rend_bruto_producto_hist_12m(alias: str, anio: int, mes: int, contratos_key: tuple[int, ...] | None = None) -> pd.DataFrame:
-    ref = pd.Timestamp(year=int(anio), month=int(mes), day=1)
-    start = (ref - pd.DateOffset(months=11)).replace(day=1)
-    end = (ref + pd.offsets.MonthEnd(0))
+@perf_cache_data(ttl=900, show_spinner=False)
+@result_cache.persist("rend_prod_window", last_day=lambda a: _rend_window(a["anio"], a["mes"], 1)[1],
+                      deps=(build_contrato_filter_sql, build_ym_range_sql))
+def rend_prod_window(alias: str, anio: int, mes: int, n_years: int = REND_HIST_YEARS,
+                     contratos_key: tuple[int, ...] | None = None) -> pd.DataFrame:
+    """
+    V_RENDIMIENTO_PROD (GESTION BRUTA) de enero de anio-(n_years-1) al mes de corte, una sola consulta;
+    los históricos por producto 12m y de n años son rebanadas de este frame.
+    """
+    start, end = _rend_window(anio, mes, n_years)
     tiene_nivel_prod = _col_exists('SIAPII', 'V_RENDIMIENTO_PROD', 'NIVEL_PRODUCTO')
     filtro_nivel = "AND r.NIVEL_PRODUCTO = 'SI'" if tiene_nivel_prod else ""
+    filtro_ym, ym_params = build_ym_range_sql("r.ANIO", "r.MES", start, end, "rpw")
 
     has_idcdm_cto = _col_exists('SIAPII', 'V_M_CONTRATO_CDM', 'ID_CDM')
     has_idcdm_rp  = _col_exists('SIAPII', 'V_RENDIMIENTO_PROD', 'ID_CDM')
 
     if has_idcdm_cto and has_idcdm_rp:
-        filtro_cts, extra_params = build_contrato_filter_sql(contratos_key, "ID_CLIENTE", "cid_rp1")
+        filtro_cts, extra_params = build_contrato_filter_sql(contratos_key, "ID_CLIENTE", "cid_rpwa")
         sql = f"""
         WITH CTS AS (
             SELECT DISTINCT ID_CDM
@@ -1962,7 +2525,6 @@ def rend_bruto_producto_hist_12m(alias: str, anio: int, mes: int, contratos_key:
             r.ANIO,
             r.MES,
             r.ID_PRODUCTO,
-            COALESCE(p.DESCRIPCION, 'SIN_DESCRIPCION') AS PRODUCTO,
             r.TASA,
             r.TASA_EFECTIVA,
             r.TASA_ACUMULADO,
@@ -1970,21 +2532,12 @@ def rend_bruto_producto_hist_12m(alias: str, anio: int, mes: int, contratos_key:
         FROM SIAPII.V_RENDIMIENTO_PROD r
         JOIN CTS c
           ON c.ID_CDM = r.ID_CDM
-        LEFT JOIN SIAPII.V_M_PRODUCTO p
-          ON p.ID_PRODUCTO = r.ID_PRODUCTO
         WHERE UPPER(r.TIPO_RENDIMIENTO) = 'GESTION BRUTA'
           {filtro_nivel}
-          AND TRUNC(TO_DATE(r.ANIO || '-' || LPAD(r.MES,2,'0') || '-01', 'YYYY-MM-DD'))
-              BETWEEN TO_DATE(:d_ini,'YYYY-MM-DD') AND TO_DATE(:d_fin,'YYYY-MM-DD')
+          {filtro_ym}
         """
-        params = {
-            "alias": alias,
-            "d_ini": start.strftime("%Y-%m-%d"),
-            "d_fin": end.strftime("%Y-%m-%d"),
-        }
-        params.update(extra_params)
     else:
-        filtro_pa, extra_params = build_contrato_filter_sql(contratos_key, "c.ID_CLIENTE", "cid_rp2")
+        filtro_pa, extra_params = build_contrato_filter_sql(contratos_key, "c.ID_CLIENTE", "cid_rpwb")
         sql = f"""
         WITH PROD_ALIAS AS (
             SELECT DISTINCT e.ID_PRODUCTO
@@ -1998,7 +2551,6 @@ def rend_bruto_producto_hist_12m(alias: str, anio: int, mes: int, contratos_key:
             r.ANIO,
             r.MES,
             r.ID_PRODUCTO,
-            COALESCE(p.DESCRIPCION, 'SIN_DESCRIPCION') AS PRODUCTO,
             r.TASA,
             r.TASA_EFECTIVA,
             r.TASA_ACUMULADO,
@@ -2006,178 +2558,38 @@ def rend_bruto_producto_hist_12m(alias: str, anio: int, mes: int, contratos_key:
         FROM SIAPII.V_RENDIMIENTO_PROD r
         JOIN PROD_ALIAS pa
           ON pa.ID_PRODUCTO = r.ID_PRODUCTO
-        LEFT JOIN SIAPII.V_M_PRODUCTO p
-          ON p.ID_PRODUCTO = r.ID_PRODUCTO
         WHERE UPPER(r.TIPO_RENDIMIENTO) = 'GESTION BRUTA'
           {filtro_nivel}
-          AND TRUNC(TO_DATE(r.ANIO || '-' || LPAD(r.MES,2,'0') || '-01', 'YYYY-MM-DD'))
-              BETWEEN TO_DATE(:d_ini,'YYYY-MM-DD') AND TO_DATE(:d_fin,'YYYY-MM-DD')
+          {filtro_ym}
         """
-        params = {
-            "alias": alias,
-            "d_ini": start.strftime("%Y-%m-%d"),
-            "d_fin": end.strftime("%Y-%m-%d"),
-        }
-        params.update(extra_params)
-
-    df = run_sql(sql, params)
-    if df.empty:
-        return pd.DataFrame(columns=[
-            "ANIO","MES","ID_PRODUCTO","PRODUCTO",
-            "TASA_M_ANUAL","TASA_ACUM_ANUAL",
-            "TASA_M_EFEC","TASA_ACUM_EFEC"
-        ])
-    df = (
-        df.sort_values(["ANIO", "MES", "ID_PRODUCTO"])
-          .groupby(["ANIO", "MES", "ID_PRODUCTO", "PRODUCTO"], as_index=False)
-          .last()
-    )
-    df["TASA_M_ANUAL"]    = df["TASA"].apply(_to_dec)
-    df["TASA_M_EFEC"]     = df["TASA_EFECTIVA"].apply(_to_dec)
-    df["TASA_ACUM_ANUAL"] = df["TASA_ACUMULADO"].apply(_to_dec)
-    df["TASA_ACUM_EFEC"]  = df["TASA_EFECTIVA_ACUMULADO"].apply(_to_dec)
-    return df[[
-        "ANIO","MES","ID_PRODUCTO","PRODUCTO",
-        "TASA_M_ANUAL","TASA_ACUM_ANUAL",
-        "TASA_M_EFEC","TASA_ACUM_EFEC"
-    ]]
-
-# =========================
-#  Rendimientos 5 años (para acumulado anual por año)
-# =========================
-@st.cache_data(ttl=900, show_spinner=True)
-def rend_bruto_contrato_hist_n_years(alias: str, anio: int, mes: int, n_years: int = 5,
-                                    contratos_key: tuple[int, ...] | None = None) -> pd.DataFrame:
-    ref = pd.Timestamp(year=int(anio), month=int(mes), day=1)
-    start = pd.Timestamp(year=int(anio) - (n_years - 1), month=1, day=1)
-    end   = (ref + pd.offsets.MonthEnd(0))
-
-    filtro_cts, extra_params = build_contrato_filter_sql(contratos_key, "ID_CLIENTE", "cid_rc5")
-
-    sql = f"""
-    WITH CTS AS (
-      SELECT ID_CLIENTE
-      FROM SIAPII.V_M_CONTRATO_CDM
-      WHERE ALIAS_CDM = :alias
-      {filtro_cts}
-    )
-    SELECT
-        r.ANIO,
-        r.MES,
-        r.TASA,
-        r.TASA_ACUMULADO,
-        r.TASA_EFECTIVA,
-        r.TASA_EFECTIVA_ACUMULADO
-    FROM SIAPII.V_RENDIMIENTO_CTO r
-    JOIN CTS c ON c.ID_CLIENTE = r.ID_CLIENTE
-    WHERE UPPER(r.TIPO_RENDIMIENTO) LIKE 'GESTION BRUTA'
-      AND r.NIVEL = 'CONTRATO'
-      AND TRUNC(TO_DATE(r.ANIO || '-' || LPAD(r.MES,2,'0') || '-01', 'YYYY-MM-DD'))
-          BETWEEN TO_DATE(:d_ini,'YYYY-MM-DD') AND TO_DATE(:d_fin,'YYYY-MM-DD')
-    """
-    params = {"alias": alias, "d_ini": start.strftime("%Y-%m-%d"), "d_fin": end.strftime("%Y-%m-%d")}
+    params = {"alias": alias, **ym_params}
     params.update(extra_params)
+    return run_sql(sql, params)
 
-    df = run_sql(sql, params)
+def _rend_cto_hist(df: pd.DataFrame) -> pd.DataFrame:
+    """Serie mensual nivel CONTRATO (último registro por ANIO/MES) con tasas en decimal."""
+    cols_out = ["ANIO","MES","TASA_M_ANUAL","TASA_ACUM_ANUAL","TASA_M_EFEC","TASA_ACUM_EFEC"]
+    if not df.empty:
+        df = df[df["NIVEL"] == "CONTRATO"]
     if df.empty:
-        return pd.DataFrame(columns=[
-            "ANIO","MES",
-            "TASA_M_ANUAL","TASA_ACUM_ANUAL",
-            "TASA_M_EFEC","TASA_ACUM_EFEC"
-        ])
-
-    df = df.sort_values(["ANIO","MES"]).groupby(["ANIO","MES"], as_index=False).last()
+        return pd.DataFrame(columns=cols_out)
+    df = (df[["ANIO","MES","TASA","TASA_ACUMULADO","TASA_EFECTIVA","TASA_EFECTIVA_ACUMULADO"]]
+            .sort_values(["ANIO","MES"]).groupby(["ANIO","MES"], as_index=False).last())
     df["TASA_M_ANUAL"]    = df["TASA"].apply(_to_dec)
     df["TASA_ACUM_ANUAL"] = df["TASA_ACUMULADO"].apply(_to_dec)
     df["TASA_M_EFEC"]     = df["TASA_EFECTIVA"].apply(_to_dec)
     df["TASA_ACUM_EFEC"]  = df["TASA_EFECTIVA_ACUMULADO"].apply(_to_dec)
-    return df[["ANIO","MES","TASA_M_ANUAL","TASA_ACUM_ANUAL","TASA_M_EFEC","TASA_ACUM_EFEC"]]
-
-
-@st.cache_data(ttl=900, show_spinner=True)
-def rend_bruto_producto_hist_n_years(alias: str, anio: int, mes: int, n_years: int = 5,
-                                     contratos_key: tuple[int, ...] | None = None) -> pd.DataFrame:
-    ref = pd.Timestamp(year=int(anio), month=int(mes), day=1)
-    start = pd.Timestamp(year=int(anio) - (n_years - 1), month=1, day=1)
-    end   = (ref + pd.offsets.MonthEnd(0))
-
-    tiene_nivel_prod = _col_exists('SIAPII', 'V_RENDIMIENTO_PROD', 'NIVEL_PRODUCTO')
-    filtro_nivel = "AND r.NIVEL_PRODUCTO = 'SI'" if tiene_nivel_prod else ""
-
-    has_idcdm_cto = _col_exists('SIAPII', 'V_M_CONTRATO_CDM', 'ID_CDM')
-    has_idcdm_rp  = _col_exists('SIAPII', 'V_RENDIMIENTO_PROD', 'ID_CDM')
-
-    if has_idcdm_cto and has_idcdm_rp:
-        filtro_cts, extra_params = build_contrato_filter_sql(contratos_key, "ID_CLIENTE", "cid_rp5a")
-        sql = f"""
-        WITH CTS AS (
-            SELECT DISTINCT ID_CDM
-            FROM SIAPII.V_M_CONTRATO_CDM
-            WHERE ALIAS_CDM = :alias
-            {filtro_cts}
-        )
-        SELECT
-            r.ANIO,
-            r.MES,
-            r.ID_PRODUCTO,
-            COALESCE(p.DESCRIPCION, 'SIN_DESCRIPCION') AS PRODUCTO,
-            r.TASA,
-            r.TASA_EFECTIVA,
-            r.TASA_ACUMULADO,
-            r.TASA_EFECTIVA_ACUMULADO
-        FROM SIAPII.V_RENDIMIENTO_PROD r
-        JOIN CTS c
-          ON c.ID_CDM = r.ID_CDM
-        LEFT JOIN SIAPII.V_M_PRODUCTO p
-          ON p.ID_PRODUCTO = r.ID_PRODUCTO
-        WHERE UPPER(r.TIPO_RENDIMIENTO) = 'GESTION BRUTA'
-          {filtro_nivel}
-          AND TRUNC(TO_DATE(r.ANIO || '-' || LPAD(r.MES,2,'0') || '-01', 'YYYY-MM-DD'))
-              BETWEEN TO_DATE(:d_ini,'YYYY-MM-DD') AND TO_DATE(:d_fin,'YYYY-MM-DD')
-        """
-        params = {"alias": alias, "d_ini": start.strftime("%Y-%m-%d"), "d_fin": end.strftime("%Y-%m-%d")}
-        params.update(extra_params)
-    else:
-        filtro_pa, extra_params = build_contrato_filter_sql(contratos_key, "c.ID_CLIENTE", "cid_rp5b")
-        sql = f"""
-        WITH PROD_ALIAS AS (
-            SELECT DISTINCT e.ID_PRODUCTO
-            FROM SIAPII.V_CLIENTE_ESTADISTICAS e
-            JOIN SIAPII.V_M_CONTRATO_CDM c
-              ON c.ID_CLIENTE = e.ID_CLIENTE
-            WHERE c.ALIAS_CDM = :alias
-              {filtro_pa}
-        )
-        SELECT
-            r.ANIO,
-            r.MES,
-            r.ID_PRODUCTO,
-            COALESCE(p.DESCRIPCION, 'SIN_DESCRIPCION') AS PRODUCTO,
-            r.TASA,
-            r.TASA_EFECTIVA,
-            r.TASA_ACUMULADO,
-            r.TASA_EFECTIVA_ACUMULADO
-        FROM SIAPII.V_RENDIMIENTO_PROD r
-        JOIN PROD_ALIAS pa
-          ON pa.ID_PRODUCTO = r.ID_PRODUCTO
-        LEFT JOIN SIAPII.V_M_PRODUCTO p
-          ON p.ID_PRODUCTO = r.ID_PRODUCTO
-        WHERE UPPER(r.TIPO_RENDIMIENTO) = 'GESTION BRUTA'
-          {filtro_nivel}
-          AND TRUNC(TO_DATE(r.ANIO || '-' || LPAD(r.MES,2,'0') || '-01', 'YYYY-MM-DD'))
-              BETWEEN TO_DATE(:d_ini,'YYYY-MM-DD') AND TO_DATE(:d_fin,'YYYY-MM-DD')
-        """
-        params = {"alias": alias, "d_ini": start.strftime("%Y-%m-%d"), "d_fin": end.strftime("%Y-%m-%d")}
-        params.update(extra_params)
+    return df[cols_out]
 
-    df = run_sql(sql, params)
+def _rend_prod_hist(df: pd.DataFrame) -> pd.DataFrame:
+    """Serie mensual por producto (último registro por ANIO/MES/producto) con tasas en decimal."""
+    cols_out = ["ANIO","MES","ID_PRODUCTO","PRODUCTO","TASA_M_ANUAL","TASA_ACUM_ANUAL","TASA_M_EFEC","TASA_ACUM_EFEC"]
     if df.empty:
-        return pd.DataFrame(columns=[
-            "ANIO","MES","ID_PRODUCTO","PRODUCTO",
-            "TASA_M_ANUAL","TASA_ACUM_ANUAL",
-            "TASA_M_EFEC","TASA_ACUM_EFEC"
-        ])
-
+        return pd.DataFrame(columns=cols_out)
+    # descripción desde dim_productos (la ventana persistida solo trae ids)
+    df = df.drop(columns=["PRODUCTO"], errors="ignore").assign(ID_PRODUCTO=pd.to_numeric(df["ID_PRODUCTO"], errors="coerce"))
+    df = df.merge(map_productos(), on="ID_PRODUCTO", how="left")
+    df["PRODUCTO"] = df["PRODUCTO"].fillna("SIN_DESCRIPCION")
     df = (
         df.sort_values(["ANIO","MES","ID_PRODUCTO"])
           .groupby(["ANIO","MES","ID_PRODUCTO","PRODUCTO"], as_index=False)
@@ -2187,7 +2599,41 @@ def rend_bruto_producto_hist_n_years(alias: str, anio: int, mes: int, n_years: i
     df["TASA_M_EFEC"]     = df["TASA_EFECTIVA"].apply(_to_dec)
     df["TASA_ACUM_ANUAL"] = df["TASA_ACUMULADO"].apply(_to_dec)
     df["TASA_ACUM_EFEC"]  = df["TASA_EFECTIVA_ACUMULADO"].apply(_to_dec)
-    return df[["ANIO","MES","ID_PRODUCTO","PRODUCTO","TASA_M_ANUAL","TASA_ACUM_ANUAL","TASA_M_EFEC","TASA_ACUM_EFEC"]]
+    return df[cols_out]
+
+# =========================
+#  Rendimientos contrato / producto 12m
+# =========================
+@perf_cache_data(ttl=900, show_spinner=False)
+def rend_bruto_contrato_hist_12m(alias: str, anio: int, mes: int, contratos_key: tuple[int, ...] | None = None) -> pd.DataFrame:
+    ref = pd.Timestamp(year=int(anio), month=int(mes), day=1)
+    start = (ref - pd.DateOffset(months=11)).replace(day=1)
+    df = rend_cto_window(alias, anio, mes, REND_HIST_YEARS, contratos_key)
+    return _rend_cto_hist(_rend_slice(df, start, ref))
+
+@perf_cache_data(ttl=900, show_spinner=False)
+def rend_bruto_producto_hist_12m(alias: str, anio: int, mes: int, contratos_key: tuple[int, ...] | None = None) -> pd.DataFrame:
+    ref = pd.Timestamp(year=int(anio), month=int(mes), day=1)
+    start = (ref - pd.DateOffset(months=11)).replace(day=1)
+    df = rend_prod_window(alias, anio, mes, REND_HIST_YEARS, contratos_key)
+    return _rend_prod_hist(_rend_slice(df, start, ref))
+
+# =========================
+#  Rendimientos n años (para acumulado anual por año)
+# =========================
+@perf_cache_data(ttl=900, show_spinner=False)
+def rend_bruto_contrato_hist_n_years(alias: str, anio: int, mes: int, n_years: int = 5,
+                                    contratos_key: tuple[int, ...] | None = None) -> pd.DataFrame:
+    start, end = _rend_window(anio, mes, n_years)
+    df = rend_cto_window(alias, anio, mes, max(n_years, REND_HIST_YEARS), contratos_key)
+    return _rend_cto_hist(_rend_slice(df, start, end))
+
+@perf_cache_data(ttl=900, show_spinner=False)
+def rend_bruto_producto_hist_n_years(alias: str, anio: int, mes: int, n_years: int = 5,
+                                     contratos_key: tuple[int, ...] | None = None) -> pd.DataFrame:
+    start, end = _rend_window(anio, mes, n_years)
+    df = rend_prod_window(alias, anio, mes, max(n_years, REND_HIST_YEARS), contratos_key)
+    return _rend_prod_hist(_rend_slice(df, start, end))
 
 
 def _annualize_from_effective(tef_dec, plazo_dias):
@@ -2198,50 +2644,14 @@ def _annualize_from_effective(tef_dec, plazo_dias):
     out[mask] = (1.0 + tef[mask])**(360.0/plazo[mask]) - 1.0
     return out
 
-@st.cache_data(ttl=900, show_spinner=True)
+@perf_cache_data(ttl=900, show_spinner=False)
 def rend_bruto_contrato_y_producto(alias: str, anio: int, mes: int, contratos_key: tuple[int, ...] | None = None):
-    ids = run_sql("""
-        SELECT ID_CLIENTE FROM SIAPII.V_M_CONTRATO_CDM
-        WHERE ALIAS_CDM = :alias
-    """, {"alias": alias})
-    if ids.empty:
-        return np.nan, np.nan, pd.DataFrame(columns=["Producto","Mensual Anualizado","Acum Anualizado"])
-
     has_id_producto = _col_exists('SIAPII','V_RENDIMIENTO_CTO','ID_PRODUCTO')
     has_desc_producto = _col_exists('SIAPII','V_RENDIMIENTO_CTO','DESCRIPCION_PRODUCTO')
 
-    sel_cols = """
-        r.ANIO, r.MES, r.ID_CDM, r.ID_CLIENTE,
-        r.MODALIDAD, r.NIVEL, r.PERIODO, r.MONEDA_ORIGEN, r.NIVEL_PRODUCTO,
-        r.TIPO_RENDIMIENTO,
-        r.TASA_EFECTIVA, r.PLAZO,
-        r.TASA_EFECTIVA_ACUMULADO, r.PLAZO_ACUMULADO
-    """
-    if has_id_producto:
-        sel_cols += ", r.ID_PRODUCTO"
-    if has_desc_producto:
-        sel_cols += ", r.DESCRIPCION_PRODUCTO"
-
-    filtro_cts, extra_params = build_contrato_filter_sql(contratos_key, "ID_CLIENTE", "cid_rcp")
-
-    base_sql = f"""
-        WITH CTS AS (
-          SELECT ID_CLIENTE
-          FROM SIAPII.V_M_CONTRATO_CDM
-          WHERE ALIAS_CDM = :alias
-          {filtro_cts}
-        )
-        SELECT {sel_cols}
-        FROM SIAPII.V_RENDIMIENTO_CTO r
-        JOIN CTS c ON c.ID_CLIENTE = r.ID_CLIENTE
-        WHERE r.ANIO = :anio
-          AND r.MES  = :mes
-          AND UPPER(r.TIPO_RENDIMIENTO) LIKE 'GESTION BRUTA'
-    """
-    params = {"alias": alias, "anio": int(anio), "mes": int(mes)}
-    params.update(extra_params)
-
-    df = run_sql(base_sql, params)
+    # Mes de corte = rebanada de la ventana ya cargada (sin contratos del alias la ventana viene vacía)
+    ref = pd.Timestamp(year=int(anio), month=int(mes), day=1)
+    df = _rend_slice(rend_cto_window(alias, anio, mes, REND_HIST_YEARS, contratos_key), ref, ref)
     if df.empty:
         return np.nan, np.nan, pd.DataFrame(columns=["Producto","Mensual Anualizado","Acum Anualizado"])
 
@@ -2270,12 +2680,12 @@ def rend_bruto_contrato_y_producto(alias: str, anio: int, mes: int, contratos_ke
             if has_desc_producto:
                 df_p["Producto"] = df_p["DESCRIPCION_PRODUCTO"].fillna("")
             elif has_id_producto:
-                mp = run_sql("SELECT ID_PRODUCTO, COALESCE(DESCRIPCION,'SIN_DESCRIPCION') AS PRODUCTO FROM SIAPII.V_M_PRODUCTO")
-                df_p = df_p.merge(mp, on="ID_PRODUCTO", how="left")
+                df_p["ID_PRODUCTO"] = pd.to_numeric(df_p["ID_PRODUCTO"], errors="coerce")
+                df_p = df_p.merge(map_productos(), on="ID_PRODUCTO", how="left")
                 df_p["Producto"] = df_p["PRODUCTO"].fillna(df_p.get("ID_PRODUCTO").astype(str))
 
-            m_an = _annualize_from_effective(_to_dec(df_p["TASA_EFECTIVA"]), df_p["PLAZO"])
-            a_an = _annualize_from_effective(_to_dec(df_p["TASA_EFECTIVA_ACUMULADO"]), df_p["PLAZO_ACUMULADO"])
+            m_an = _annualize_from_effective(df_p["TASA_EFECTIVA"].apply(_to_dec), df_p["PLAZO"])
+            a_an = _annualize_from_effective(df_p["TASA_EFECTIVA_ACUMULADO"].apply(_to_dec), df_p["PLAZO_ACUMULADO"])
 
             out = pd.DataFrame({
                 "Producto": df_p["Producto"].astype(str),
@@ -2291,7 +2701,7 @@ def rend_bruto_contrato_y_producto(alias: str, anio: int, mes: int, contratos_ke
 # =========================
 #  NOMBRE CLIENTE (título)
 # =========================
-@st.cache_data(ttl=3600, show_spinner=True)
+@perf_cache_data(ttl=3600, show_spinner=True)
 def get_nombre_cliente(alias: str) -> str:
     sql = "SELECT NOMBRE_CLIENTE FROM SIAPII.V_M_CONTRATO_CDM WHERE ALIAS_CDM = :alias FETCH FIRST 1 ROWS ONLY"
     df = run_sql(sql, {"alias": alias})
@@ -2303,6 +2713,8 @@ def get_nombre_cliente(alias: str) -> str:
 # =========================
 def build_query_base_unfiltered(alias: str, fecha: str, contratos_key: tuple[int, ...] | None = None):
     filtro_contratos, extra_params = build_contrato_filter_sql(contratos_key, "e.ID_CLIENTE", "cid_aa")
+    filtro_fecha, fecha_params = build_day_range_sql(
+        "e.FECHA_ESTADISTICA", fecha, pd.Timestamp(fecha) + pd.Timedelta(days=1), "fe")
     sql = f"""
     SELECT
       COALESCE(p.DESCRIPCION, 'SIN_DESCRIPCION') AS PRODUCTO,
@@ -2311,18 +2723,24 @@ def build_query_base_unfiltered(alias: str, fecha: str, contratos_key: tuple[int
     FROM SIAPII.V_CLIENTE_ESTADISTICAS e
     LEFT JOIN SIAPII.V_M_PRODUCTO p ON p.ID_PRODUCTO = e.ID_PRODUCTO
     WHERE e.ALIAS_CDM = :alias
-      AND TRUNC(e.FECHA_ESTADISTICA) = TO_DATE(:fecha, 'YYYY-MM-DD')
+      {filtro_fecha}
       {filtro_contratos}
     GROUP BY COALESCE(p.DESCRIPCION, 'SIN_DESCRIPCION'), {CASE_ACTIVO}
     """
-    params = {"alias": alias, "fecha": fecha}
+    params = {"alias": alias, **fecha_params}
     params.update(extra_params)
     return sql, params
 
-@st.cache_data(ttl=3600, show_spinner=True)
+@perf_cache_data(ttl=3600, show_spinner=True)
+@result_cache.persist("aa_hist_5y", last_day=lambda a: a["cutoff_next"] - pd.Timedelta(days=1),
+                      deps=(build_contrato_filter_sql, build_day_range_sql))
 def aa_hist_ultimo_5_anios(alias: str, cutoff_next: pd.Timestamp,
                            contratos_key: tuple[int, ...] | None = None):
     filtro_contratos, extra_params = build_contrato_filter_sql(contratos_key, "c.ID_CLIENTE", "cid_aa_hist")
+    cutoff_next = pd.to_datetime(cutoff_next)
+    # desde el 1 de enero de hace 5 años: ADD_MONTHS(TRUNC(cutoff_next,'YYYY'), -60)
+    filtro_fecha, fecha_params = build_day_range_sql(
+        "e.FECHA_ESTADISTICA", pd.Timestamp(year=cutoff_next.year - 5, month=1, day=1), cutoff_next, "aah")
 
     SQL = f"""
     WITH A AS (
@@ -2337,14 +2755,13 @@ def aa_hist_ultimo_5_anios(alias: str, cutoff_next: pd.Timestamp,
       LEFT JOIN SIAPII.V_M_PRODUCTO p ON p.ID_PRODUCTO = e.ID_PRODUCTO
       WHERE c.ALIAS_CDM = :alias
         {filtro_contratos}
-        AND e.FECHA_ESTADISTICA <  TO_DATE(:cutoff_next,'YYYY-MM-DD')
-        AND e.FECHA_ESTADISTICA >= ADD_MONTHS(TRUNC(TO_DATE(:cutoff_next,'YYYY-MM-DD'),'YYYY'), -12*5)
+        {filtro_fecha}
 
       GROUP BY EXTRACT(YEAR FROM TRUNC(e.FECHA_ESTADISTICA)), {CASE_ACTIVO}, COALESCE(p.DESCRIPCION, 'SIN_DESCRIPCION')
     )
     SELECT * FROM A
     """
-    params = {"alias": alias, "cutoff_next": pd.to_datetime(cutoff_next).strftime("%Y-%m-%d")}
+    params = {"alias": alias, **fecha_params}
     params.update(extra_params)
 
     df = run_sql(SQL, params)
@@ -2368,28 +2785,68 @@ def aa_hist_ultimo_5_anios(alias: str, cutoff_next: pd.Timestamp,
 # =========================
 FALLBACK_IDS = [37, 3]
 ids_csv = ",".join(str(i) for i in FALLBACK_IDS)
-DTYPE_Q = """
-SELECT DATA_TYPE
-FROM ALL_TAB_COLUMNS
-WHERE OWNER = 'SIAPII'
-  AND TABLE_NAME = 'V_TASAS_REFERENCIA'
-  AND COLUMN_NAME = 'FECHA'
-"""
+def _vtr_fechas(s: pd.Series) -> pd.Series:
+    """Día de r.FECHA: DATE/TIMESTAMP directo; texto 'YYYY-MM-DD…' o 'DD/MM/YYYY…' (lo demás, NaT)."""
+    if isinstance(s.dtype, pd.DatetimeTZDtype):
+        s = s.dt.tz_localize(None)
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s.dt.normalize()
+    txt = s.astype("string")
+    head = txt.str.slice(0, 10)
+    iso = pd.to_datetime(head.where(txt.str.match(r"^[0-9]{4}-[0-9]{2}-[0-9]{2}", na=False)),
+                         format="%Y-%m-%d", errors="coerce")
+    dmy = pd.to_datetime(head.where(txt.str.match(r"^[0-9]{2}/[0-9]{2}/[0-9]{4}", na=False)),
+                         format="%d/%m/%Y", errors="coerce")
+    return iso.fillna(dmy)
+
+def _load_tasas_ref() -> dict:
+    df = run_sql(f"""
+        SELECT ID_TASA_REFERENCIA, TASA_REFERENCIA, TASA, FECHA
+        FROM SIAPII.V_TASAS_REFERENCIA
+        WHERE ID_TASA_REFERENCIA IN ({ids_csv})
+    """)
+    if df.empty:
+        return {}
+    df = (df.assign(ID=pd.to_numeric(df["ID_TASA_REFERENCIA"], errors="coerce"), DIA=_vtr_fechas(df["FECHA"]))
+            .dropna(subset=["ID", "DIA"]))
+    # varias filas el mismo día: MAX(TASA) / MAX(TASA_REFERENCIA), como el MAX(vtr.*) del snapshot
+    g = (df.groupby(["ID", "DIA"], as_index=False, sort=True)
+           .agg(TASA=("TASA", "max"), NOMBRE=("TASA_REFERENCIA", "max")))
+    return {
+        int(k): (grp["DIA"].to_numpy(dtype="datetime64[ns]"), grp["TASA"].to_numpy(), grp["NOMBRE"].to_numpy())
+        for k, grp in g.groupby("ID", sort=False)
+    }
 
-@st.cache_data(ttl=3600, show_spinner=True)
-def build_snapshot_params(alias: str, f_ini: pd.Timestamp, f_fin_next: pd.Timestamp):
-    params = {"alias_up": alias, "f_ini_dt": f_ini.strftime("%Y-%m-%d"), "f_fin_dt": f_fin_next.strftime("%Y-%m-%d")}
-    dt = run_sql(DTYPE_Q).DATA_TYPE.iloc[0].strip().upper()
-    if dt in ("DATE","TIMESTAMP","TIMESTAMP(6)","TIMESTAMP WITH TIME ZONE","TIMESTAMP WITH LOCAL TIME ZONE"):
-        date_expr = "TRUNC(CAST(r.FECHA AS DATE))"
-    else:
-        date_expr = (
-            "CASE\n"
-            "  WHEN REGEXP_LIKE(r.FECHA,'^[0-9]{4}-[0-9]{2}-[0-9]{2}') THEN TRUNC(TO_DATE(SUBSTR(r.FECHA,1,10),'YYYY-MM-DD'))\n"
-            "  WHEN REGEXP_LIKE(r.FECHA,'^[0-9]{2}/[0-9]{2}/[0-9]{4}') THEN TRUNC(TO_DATE(SUBSTR(r.FECHA,1,10),'DD/MM/YYYY'))\n"
-            "  ELSE NULL\nEND"
-        )
-    return params, date_expr
+def tasas_ref_series() -> dict:
+    """Serie de FALLBACK_IDS en memoria: {id: (días ordenados, TASA, TASA_REFERENCIA)}."""
+    return _dim_get(
+        "tasas_ref",
+        lambda: _watermark(run_sql(
+            f"SELECT COUNT(*) AS N FROM SIAPII.V_TASAS_REFERENCIA WHERE ID_TASA_REFERENCIA IN ({ids_csv})")),
+        _load_tasas_ref,
+    )
+
+def tasas_ref_asof(ids: pd.Series, fechas: pd.Series) -> pd.DataFrame:
+    """
+    TASA_BASE / TASA_REF_NAME por renglón: la tasa del id en el día exacto o, si no hay, la última previa
+    (as-of con searchsorted). Ids fuera de FALLBACK_IDS o sin historia previa quedan en NaN.
+    """
+    n = len(ids)
+    tasa = np.full(n, np.nan, dtype=object)
+    nombre = np.full(n, np.nan, dtype=object)
+    ids_n = pd.to_numeric(pd.Series(ids), errors="coerce").to_numpy()
+    dias = pd.to_datetime(pd.Series(fechas), errors="coerce").dt.normalize().to_numpy(dtype="datetime64[ns]")
+    for k, (serie_dias, serie_tasa, serie_nombre) in tasas_ref_series().items():
+        rows = np.flatnonzero((ids_n == k) & ~np.isnat(dias))
+        if not len(rows):
+            continue
+        pos = np.searchsorted(serie_dias, dias[rows], side="right") - 1
+        ok = pos >= 0
+        tasa[rows[ok]] = serie_tasa[pos[ok]]
+        nombre[rows[ok]] = serie_nombre[pos[ok]]
+    idx = pd.Series(ids).index
+    return pd.DataFrame({"TASA_BASE": pd.Series(tasa, index=idx).infer_objects(),
+                         "TASA_REF_NAME": pd.Series(nombre, index=idx)})
 
 def where_filters_for_his(contratos_key: tuple[int, ...] | None = None):
     base_sql = (
@@ -2399,20 +2856,156 @@ def where_filters_for_his(contratos_key: tuple[int, ...] | None = None):
     filtro, params = build_contrato_filter_sql(contratos_key, "c.ID_CLIENTE", "cid_his")
     return base_sql + filtro + " )", params
 
-@st.cache_data(ttl=1200, show_spinner=True)
-def query_snapshot_deuda(
-    alias: str,
-    f_ini: pd.Timestamp,
-    f_fin_next: pd.Timestamp,
-    contratos_key: tuple[int, ...] | None = None
-) -> pd.DataFrame:
-    params, DATE_EXPR = build_snapshot_params(alias, f_ini, f_fin_next)
+# =========================
+#  DIMENSIONES (V_M_EMISORA / V_M_PRODUCTO / core_issuer)
+# =========================
+@st.cache_resource(show_spinner=False)
+def _dim_state() -> dict:
+    """Dimensiones vigentes compartidas por las sesiones: {nombre: (watermark, DF, cargado, revisado)}."""
+    return {"lock": threading.Lock(), "locks": {}, "dims": {}}
 
-    # Filtro de contratos sobre V_M_CONTRATO_CDM
-    filtro_fc, params_fc = build_contrato_filter_sql(contratos_key, "c1.ID_CLIENTE", "cid_fc")
-    params.update(params_fc)
+def _dim_get(name: str, watermark_fn, load_fn) -> pd.DataFrame:
+    """
+    Dimensión cargada una vez por proceso. Cada DIM_WATERMARK_TTL s se consulta su watermark (conteos /
+    id máximo) y solo si cambió se recarga; cada DIM_REFRESH_TTL s se recarga de todos modos.
+    Si la recarga falla se sigue sirviendo la versión anterior. El DF es compartido: no modificarlo.
+    """
+    state = _dim_state()
+    with state["lock"]:
+        lock = state["locks"].setdefault(name, threading.Lock())
+
+    def _fresh(cur, now):
+        return cur is not None and now - cur[3] < DIM_WATERMARK_TTL and now - cur[2] < DIM_REFRESH_TTL
+
+    cur = state["dims"].get(name)
+    if _fresh(cur, time.time()):
+        return cur[1]
+    with lock:
+        cur = state["dims"].get(name)
+        now = time.time()
+        if _fresh(cur, now):
+            return cur[1]
+        try:
+            wm = watermark_fn()
+            if cur is not None and wm == cur[0] and now - cur[2] < DIM_REFRESH_TTL:
+                state["dims"][name] = (wm, cur[1], cur[2], now)
+                return cur[1]
+            df = load_fn()
+        except Exception:
+            if cur is not None:
+                return cur[1]
+            raise
+        state["dims"][name] = (wm, df, now, now)
+        return df
+
+def _watermark(df: pd.DataFrame) -> tuple:
+    return tuple(df.iloc[0].tolist()) if not df.empty else ()
+
+def _as_category(df: pd.DataFrame, cols) -> pd.DataFrame:
+    return df.astype({c: "category" for c in cols if c in df.columns})
+
+def _decat(df: pd.DataFrame) -> pd.DataFrame:
+    """Categóricas -> object, para las vistas que hacen fillna / concatenan texto sobre esas columnas."""
+    cats = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+    return df.astype({c: object for c in cats}) if cats else df
+
+EMISORA_DIM_COLS = ["ID_EMISORA", "ID_TIPO_ACTIVO", "NOMBRE_EMISORA", "SERIE", "TIPO_PAPEL", "TIPO_INSTRUMENTO",
+                    "PLAZO_CUPON", "FECHA_VTO_EM", "ID_TASA_REFERENCIA", "ID_DIVISA_TV"]
+
+def _load_dim_emisoras() -> pd.DataFrame:
+    df = run_sql(f"SELECT {', '.join(EMISORA_DIM_COLS)} FROM SIAPII.V_M_EMISORA")
+    if df.empty:
+        return pd.DataFrame(columns=EMISORA_DIM_COLS)
+    df["ID_EMISORA"] = pd.to_numeric(df["ID_EMISORA"], errors="coerce")
+    if df["ID_EMISORA"].duplicated().any():
+        # mismo criterio que el MAX(e.*) ... GROUP BY e.ID_EMISORA de las consultas anteriores
+        df = df.groupby("ID_EMISORA", as_index=False).max()
+    df["FECHA_VTO_EM"] = pd.to_datetime(df["FECHA_VTO_EM"], errors="coerce")
+    df = _as_category(df, ["NOMBRE_EMISORA", "SERIE", "TIPO_PAPEL", "TIPO_INSTRUMENTO"])
+    return df.sort_values("ID_EMISORA").reset_index(drop=True)
+
+def dim_emisoras() -> pd.DataFrame:
+    """V_M_EMISORA completa (una fila por ID_EMISORA), texto como categórico."""
+    return _dim_get(
+        "emisora",
+        lambda: _watermark(run_sql("SELECT COUNT(*) AS N, MAX(ID_EMISORA) AS MAX_ID FROM SIAPII.V_M_EMISORA")),
+        _load_dim_emisoras,
+    )
+
+def _load_dim_productos() -> pd.DataFrame:
+    df = run_sql("""
+        SELECT ID_PRODUCTO, COALESCE(DESCRIPCION,'SIN_DESCRIPCION') AS PRODUCTO
+        FROM SIAPII.V_M_PRODUCTO
+    """)
+    df["ID_PRODUCTO"] = pd.to_numeric(df["ID_PRODUCTO"], errors="coerce")
+    return _as_category(df, ["PRODUCTO"])
+
+def dim_productos() -> pd.DataFrame:
+    return _dim_get(
+        "producto",
+        lambda: _watermark(run_sql("SELECT COUNT(*) AS N, MAX(ID_PRODUCTO) AS MAX_ID FROM SIAPII.V_M_PRODUCTO")),
+        _load_dim_productos,
+    )
 
-    SQL_SNAPSHOT = f"""
+def _mode_by(df: pd.DataFrame, key: str, col: str) -> pd.Series:
+    """Valor no nulo más frecuente de col por key (vectorizado; empates sin orden garantizado, como value_counts)."""
+    cnt = df[[key, col]].dropna(subset=[col]).groupby([key, col], sort=False).size()
+    top = cnt.sort_values(ascending=False, kind="stable").reset_index().drop_duplicates(key)
+    return top.set_index(key)[col]
+
+def _load_dim_core_issuer() -> pd.DataFrame:
+    cols = ["issuer_name", "Nombre Completo", "sector", "industry"]
+    core = pg_run_sql("""
+        SELECT issuer_name, ticker_symbol, sector, industry
+        FROM core_issuer
+        WHERE issuer_name IS NOT NULL
+    """)
+    if core.empty:
+        return pd.DataFrame(columns=cols)
+    core = pd.DataFrame({
+        "issuer_name": core["issuer_name"].astype(str),
+        **{c: (core[c] if c in core.columns else None) for c in ("ticker_symbol", "sector", "industry")},
+    })
+    agg = pd.DataFrame(index=pd.Index(core["issuer_name"].unique(), name="issuer_name").sort_values())
+    for c in ("ticker_symbol", "sector", "industry"):
+        agg[c] = _mode_by(core, "issuer_name", c)
+    agg = agg.reset_index()
+    ticker = agg["ticker_symbol"]
+    has_ticker = ticker.notna() & (ticker.astype(str).str.strip() != "")
+    nombre = pd.Series(np.where(has_ticker, ticker.astype(str), agg["issuer_name"].astype(str)), index=agg.index)
+    agg["Nombre Completo"] = nombre.str.split(",", n=1).str[0].str.strip()
+    agg["sector"] = agg["sector"].fillna("SIN SECTOR")
+    agg["industry"] = agg["industry"].fillna("SIN INDUSTRIA")
+    return _as_category(agg[cols], ["sector", "industry"])
+
+def dim_core_issuer() -> pd.DataFrame:
+    """core_issuer (Postgres) agregado a un renglón por issuer_name: ticker / sector / industria modales."""
+    return _dim_get(
+        "core_issuer",
+        lambda: _watermark(pg_run_sql("""
+            SELECT COUNT(*) AS n, COUNT(ticker_symbol) AS n_ticker, COUNT(sector) AS n_sector, COUNT(industry) AS n_industry
+            FROM core_issuer
+            WHERE issuer_name IS NOT NULL
+        """)),
+        _load_dim_core_issuer,
+    )
+
+# =========================
+#  CUBO DE POSICIONES (una lectura de V_HIS_POSICION_CLIENTE)
+# =========================
+POS_CUBE_START = pd.Timestamp("2020-01-01")  # inicio del histórico trimestral
+
+@result_cache.persist("position_facts", last_day=lambda a: a["cutoff_next"] - pd.Timedelta(days=1),
+                      deps=(build_contrato_filter_sql, build_day_range_sql))
+def _position_facts(alias: str, f_ini: pd.Timestamp, cutoff_next: pd.Timestamp,
+                    contratos_key: tuple[int, ...] | None = None) -> pd.DataFrame:
+    """Hechos del cubo: solo ids, calificaciones de la posición y sumas (emisora se une en memoria)."""
+    filtro_fc, params = build_contrato_filter_sql(contratos_key, "c1.ID_CLIENTE", "cid_pc")
+    rango_h1, rango_params = build_day_range_sql("h1.REGISTRO_CONTROL", f_ini, cutoff_next, "pc")
+    rango_h, _ = build_day_range_sql("h.REGISTRO_CONTROL", f_ini, cutoff_next, "pc")
+    params.update({"alias_up": alias, **rango_params})
+
+    SQL_CUBE = f"""
 WITH
 CLIENTES AS (
   SELECT /*+ MATERIALIZE */ DISTINCT c1.ID_CLIENTE
@@ -2421,101 +3014,22 @@ CLIENTES AS (
   {filtro_fc}
 ),
 
-/* 1) fecha de corte: MAX(REGISTRO_CONTROL) para esos clientes y rango */
-FECHA_C AS (
+/* 1) fecha de corte por mes: MAX(REGISTRO_CONTROL) de cada mes del rango */
+FECHAS_C AS (
   SELECT /*+ MATERIALIZE */
-    MAX(h1.REGISTRO_CONTROL)        AS FECHA_CORTE_TS,
-    TRUNC(MAX(h1.REGISTRO_CONTROL)) AS FECHA_CORTE_DAY
+    TRUNC(h1.REGISTRO_CONTROL, 'MM') AS MES,
+    TRUNC(MAX(h1.REGISTRO_CONTROL))  AS FECHA_CORTE_DAY
   FROM SIAPII.V_HIS_POSICION_CLIENTE h1
   JOIN CLIENTES c ON c.ID_CLIENTE = h1.ID_CLIENTE
-  WHERE h1.REGISTRO_CONTROL >= TO_DATE(:f_ini_dt,'YYYY-MM-DD')
-    AND h1.REGISTRO_CONTROL <  TO_DATE(:f_fin_dt,'YYYY-MM-DD')
-),
-
-/* 2) snapshot del día de corte: TRAER SOLO COLUMNAS NECESARIAS */
-H_CORTE AS (
-  SELECT /*+ MATERIALIZE */
-    h.ID_CLIENTE,
-    h.ID_PRODUCTO,
-    h.ID_EMISORA,
-    h.CALIFICACION_HOMOLOGADA,
-    h.CALIFICACION_S_P,
-    h.CALIFICACION_MDYS,
-    h.CALIFICACION_HRRATING,
-    h.CALIFICACION_FITCH,
-    h.EMIS_TASA,
-    h.VALOR_NOMINAL,
-    h.VALOR_REAL,
-    NVL(h.PLAZO_REPORTO,0) AS PLAZO_REPORTO,
-    h.REGISTRO_CONTROL
-  FROM SIAPII.V_HIS_POSICION_CLIENTE h
-  JOIN CLIENTES c ON c.ID_CLIENTE = h.ID_CLIENTE
-  CROSS JOIN FECHA_C fc
-  WHERE h.REGISTRO_CONTROL >= fc.FECHA_CORTE_DAY
-    AND h.REGISTRO_CONTROL <  fc.FECHA_CORTE_DAY + 1
-),
-
-/* 3) Tasas referencia: FILTRAR DESDE EL ORIGEN por ids_csv */
-VTR_BASE AS (
-  SELECT
-    r.ID_TASA_REFERENCIA,
-    r.TASA_REFERENCIA,
-    r.TASA,
-    {DATE_EXPR} AS FECHA_TRUNC
-  FROM SIAPII.V_TASAS_REFERENCIA r
-  WHERE r.ID_TASA_REFERENCIA IN ({ids_csv})
-),
-
-VTR_EXACT AS (
-  SELECT v.ID_TASA_REFERENCIA, v.TASA, v.TASA_REFERENCIA
-  FROM VTR_BASE v
-  CROSS JOIN FECHA_C fc
-  WHERE v.FECHA_TRUNC = fc.FECHA_CORTE_DAY
-),
-
-VTR_FALL AS (
-  SELECT x.ID_TASA_REFERENCIA, x.TASA, x.TASA_REFERENCIA
-  FROM (
-    SELECT
-      v.ID_TASA_REFERENCIA,
-      v.TASA,
-      v.TASA_REFERENCIA,
-      v.FECHA_TRUNC,
-      ROW_NUMBER() OVER (
-        PARTITION BY v.ID_TASA_REFERENCIA
-        ORDER BY v.FECHA_TRUNC DESC
-      ) AS RN
-    FROM VTR_BASE v
-    CROSS JOIN FECHA_C fc
-    WHERE v.FECHA_TRUNC IS NOT NULL
-      AND v.FECHA_TRUNC <= fc.FECHA_CORTE_DAY
-  ) x
-  WHERE x.RN = 1
-),
-
-VTR_REF AS (
-  SELECT e.ID_TASA_REFERENCIA, e.TASA, e.TASA_REFERENCIA
-  FROM VTR_EXACT e
-  UNION ALL
-  SELECT f.ID_TASA_REFERENCIA, f.TASA, f.TASA_REFERENCIA
-  FROM VTR_FALL f
-  WHERE NOT EXISTS (
-    SELECT 1 FROM VTR_EXACT e
-    WHERE e.ID_TASA_REFERENCIA = f.ID_TASA_REFERENCIA
-  )
+  WHERE h1.REGISTRO_CONTROL IS NOT NULL
+    {rango_h1}
+  GROUP BY TRUNC(h1.REGISTRO_CONTROL, 'MM')
 )
 
 SELECT
+    fc.MES,
     h.ID_PRODUCTO,
-    e.ID_EMISORA,
-    MAX(e.NOMBRE_EMISORA)           AS NOMBRE_EMISORA,
-    MAX(e.SERIE)                    AS SERIE,
-    MAX(e.TIPO_PAPEL)               AS TIPO_PAPEL,
-    MAX(e.TIPO_INSTRUMENTO)         AS TIPO_INSTRUMENTO,
-    MAX(e.PLAZO_CUPON)              AS PLAZO_CUPON,
-    MAX(e.FECHA_VTO_EM)             AS FECHA_VTO_EM,
-    MAX(e.ID_TASA_REFERENCIA)       AS ID_TASA_REFERENCIA,
-    MAX(e.ID_DIVISA_TV)             AS ID_DIVISA_TV,
+    h.ID_EMISORA,
     MAX(h.CALIFICACION_HOMOLOGADA)  AS CALIFICACION_HOMOLOGADA,
     MAX(h.CALIFICACION_S_P)         AS CALIFICACION_S_P,
     MAX(h.CALIFICACION_MDYS)        AS CALIFICACION_MDYS,
@@ -2526,21 +3040,117 @@ SELECT
     SUM(h.VALOR_REAL)               AS VALOR_REAL,
     CASE
       WHEN SUM(h.VALOR_REAL) IS NULL OR SUM(h.VALOR_REAL) = 0 THEN NULL
-      ELSE SUM(h.PLAZO_REPORTO * h.VALOR_REAL) / SUM(h.VALOR_REAL)
+      ELSE SUM(NVL(h.PLAZO_REPORTO,0) * h.VALOR_REAL) / SUM(h.VALOR_REAL)
     END                             AS DURACION_DIAS,
-    TRUNC(MAX(e.FECHA_VTO_EM)) - TRUNC(MAX(h.REGISTRO_CONTROL)) AS DIAS_X_V,
-    MAX(TRUNC(h.REGISTRO_CONTROL)) AS FECHA_CORTE,
-    MAX(vtr.TASA)                   AS TASA_BASE,
-    MAX(vtr.TASA_REFERENCIA)        AS TASA_REF_NAME
-FROM H_CORTE h
-LEFT JOIN SIAPII.V_M_EMISORA e ON e.ID_EMISORA = h.ID_EMISORA
-LEFT JOIN VTR_REF vtr ON vtr.ID_TASA_REFERENCIA = e.ID_TASA_REFERENCIA
-WHERE e.ID_TIPO_ACTIVO = 1
-  AND h.ID_PRODUCTO NOT IN ({REPORTO_RV_CSV})
-GROUP BY h.ID_PRODUCTO, e.ID_EMISORA
-ORDER BY SUM(h.VALOR_REAL) DESC NULLS LAST, MAX(e.NOMBRE_EMISORA)
+    MAX(fc.FECHA_CORTE_DAY)         AS FECHA_CORTE
+FROM SIAPII.V_HIS_POSICION_CLIENTE h
+JOIN CLIENTES c ON c.ID_CLIENTE = h.ID_CLIENTE
+JOIN FECHAS_C fc
+  ON h.REGISTRO_CONTROL >= fc.FECHA_CORTE_DAY
+ AND h.REGISTRO_CONTROL <  fc.FECHA_CORTE_DAY + 1
+WHERE h.REGISTRO_CONTROL IS NOT NULL
+  {rango_h}
+GROUP BY fc.MES, h.ID_PRODUCTO, h.ID_EMISORA
+ORDER BY fc.MES
 """
-    return run_sql(SQL_SNAPSHOT, params=params)
+    return run_sql(SQL_CUBE, params=params)
+
+@st.cache_resource(ttl=1200, max_entries=16, show_spinner=False)
+def position_cube(alias: str, f_ini: pd.Timestamp, cutoff_next: pd.Timestamp,
+                  contratos_key: tuple[int, ...] | None = None) -> pd.DataFrame:
+    """
+    Posiciones de cierre de cada mes de [f_ini, cutoff_next): por mes, el día de su último
+    REGISTRO_CONTROL, agregado a (MES, ID_PRODUCTO, ID_EMISORA). De aquí salen el snapshot de deuda,
+    el de RV, la mezcla trimestral papel/instrumento, la duración 12m y la evolución de RV por sector.
+    Los atributos de emisora vienen de dim_emisoras() (JOIN interno, como antes en SQL) y quedan
+    categóricos. Compartido entre sesiones (cache_resource): las vistas no lo modifican.
+    """
+    df = _position_facts(alias, f_ini, cutoff_next, contratos_key)
+    if df.empty:
+        return pd.DataFrame(columns=["MES", "ID_PRODUCTO", "ID_ACTIVO_LOGICO", *EMISORA_DIM_COLS,
+                                     "VALOR_NOMINAL", "VALOR_REAL", "DURACION_DIAS", "FECHA_CORTE"])
+    df = df.assign(ID_EMISORA=pd.to_numeric(df["ID_EMISORA"], errors="coerce"),
+                   ID_PRODUCTO=pd.to_numeric(df["ID_PRODUCTO"], errors="coerce"))
+    df = df.merge(dim_emisoras(), on="ID_EMISORA", how="inner", validate="many_to_one")
+    df["MES"] = pd.to_datetime(df["MES"])
+    df["FECHA_CORTE"] = pd.to_datetime(df["FECHA_CORTE"])
+    df["ID_ACTIVO_LOGICO"] = np.where(df["ID_PRODUCTO"].isin(REPORTO_RV_PRODUCTS), 2,
+                                      pd.to_numeric(df["ID_TIPO_ACTIVO"], errors="coerce"))
+    return df
+
+def _cube(alias: str, cutoff_next: pd.Timestamp, contratos_key: tuple[int, ...] | None = None) -> pd.DataFrame:
+    """Cubo del reporte: desde POS_CUBE_START hasta el corte (misma llave para todas las vistas)."""
+    if contratos_key is not None and isinstance(contratos_key, pd.Index):
+        contratos_key = tuple(map(int, contratos_key.tolist()))
+    return position_cube(alias, POS_CUBE_START, pd.Timestamp(cutoff_next), contratos_key)
+
+def _cube_rows(cube: pd.DataFrame, id_activo: int, f_ini: pd.Timestamp | None = None,
+               f_fin_next: pd.Timestamp | None = None) -> pd.DataFrame:
+    """Renglones de un activo lógico (1 deuda, 2 RV con reportos de RV) con corte en [f_ini, f_fin_next)."""
+    if cube.empty:
+        return cube
+    m = cube["ID_ACTIVO_LOGICO"].eq(id_activo)
+    if f_ini is not None:
+        m &= cube["FECHA_CORTE"] >= pd.Timestamp(f_ini)
+    if f_fin_next is not None:
+        m &= cube["FECHA_CORTE"] < pd.Timestamp(f_fin_next)
+    return cube.loc[m]
+
+def _cube_last_cut(cube: pd.DataFrame, f_ini: pd.Timestamp, f_fin_next: pd.Timestamp) -> pd.DataFrame:
+    """Renglones del último día de corte en [f_ini, f_fin_next), sobre TODAS las posiciones (como FECHA_C)."""
+    if cube.empty:
+        return cube
+    rng = cube["FECHA_CORTE"].between(pd.Timestamp(f_ini), pd.Timestamp(f_fin_next), inclusive="left")
+    if not rng.any():
+        return cube.iloc[0:0]
+    return cube.loc[cube["FECHA_CORTE"].eq(cube.loc[rng, "FECHA_CORTE"].max())]
+
+SNAP_DEUDA_COLS = [
+    "ID_PRODUCTO", "ID_EMISORA", "NOMBRE_EMISORA", "SERIE", "TIPO_PAPEL", "TIPO_INSTRUMENTO",
+    "PLAZO_CUPON", "FECHA_VTO_EM", "ID_TASA_REFERENCIA", "ID_DIVISA_TV",
+    "CALIFICACION_HOMOLOGADA", "CALIFICACION_S_P", "CALIFICACION_MDYS", "CALIFICACION_HRRATING",
+    "CALIFICACION_FITCH", "EMIS_TASA", "VALOR_NOMINAL", "VALOR_REAL", "DURACION_DIAS",
+    "DIAS_X_V", "FECHA_CORTE", "TASA_BASE", "TASA_REF_NAME",
+]
+
+@perf_cache_data(ttl=1200, show_spinner=False)
+def query_snapshot_deuda(
+    alias: str,
+    f_ini: pd.Timestamp,
+    f_fin_next: pd.Timestamp,
+    contratos_key: tuple[int, ...] | None = None
+) -> pd.DataFrame:
+    """Snapshot de deuda del último día de corte de [f_ini, f_fin_next), derivado del cubo + tasas de referencia."""
+    cut = _cube_last_cut(_cube(alias, f_fin_next, contratos_key), f_ini, f_fin_next)
+    df = _cube_rows(cut, 1)
+    if df.empty:
+        return pd.DataFrame(columns=SNAP_DEUDA_COLS)
+    df = _decat(df)
+    df["DIAS_X_V"] = (df["FECHA_VTO_EM"].dt.normalize() - df["FECHA_CORTE"]).dt.days
+    df = df.join(tasas_ref_asof(df["ID_TASA_REFERENCIA"], df["FECHA_CORTE"]))
+    vr = pd.to_numeric(df["VALOR_REAL"], errors="coerce")
+    order = np.lexsort((df["NOMBRE_EMISORA"].astype(str).to_numpy(), (-vr).fillna(np.inf).to_numpy()))
+    return df.iloc[order][SNAP_DEUDA_COLS].reset_index(drop=True)
+
+@perf_cache_data(ttl=1200, show_spinner=False)
+def query_snapshot_deuda_multi(
+    alias: str,
+    f_ini: pd.Timestamp,
+    f_fin_next: pd.Timestamp,
+    contratos_key: tuple[int, ...] | None = None
+) -> pd.DataFrame:
+    """
+    Snapshots de deuda de TODOS los meses de [f_ini, f_fin_next): por mes, el día de su último
+    REGISTRO_CONTROL (mismo corte que query_snapshot_deuda mes a mes). Solo lo de posición (valor,
+    duración, emisora); sin tasas de referencia, que la línea de duración no usa.
+    Una fila por (MES, ID_PRODUCTO, ID_EMISORA).
+    """
+    cols = ["MES", "ID_PRODUCTO", "ID_EMISORA", "NOMBRE_EMISORA", "TIPO_PAPEL", "TIPO_INSTRUMENTO",
+            "VALOR_NOMINAL", "VALOR_REAL", "DURACION_DIAS", "FECHA_CORTE"]
+    df = _cube_rows(_cube(alias, f_fin_next, contratos_key), 1, f_ini, f_fin_next)
+    if df.empty:
+        return pd.DataFrame(columns=cols)
+    return _decat(df[cols]).sort_values("MES", kind="stable").reset_index(drop=True)
 
 # ===== Ratings helpers + carry =====
 VAL_TO_BUCKET = {
@@ -2628,14 +3238,11 @@ def _auto_to_decimal(series):
     med = vals.dropna().median()
     return vals if (pd.notna(med) and 0 < med < 1) else vals * 0.01
 
-@st.cache_data(ttl=900, show_spinner=True)
 def map_productos() -> pd.DataFrame:
-    return run_sql("""
-        SELECT ID_PRODUCTO, COALESCE(DESCRIPCION,'SIN_DESCRIPCION') AS PRODUCTO
-        FROM SIAPII.V_M_PRODUCTO
-    """)
+    """ID_PRODUCTO -> PRODUCTO desde dim_productos() (copia sin categóricas)."""
+    return _decat(dim_productos())
 
-@st.cache_data(ttl=900, show_spinner=True)
+@st.cache_data(ttl=900, show_spinner=False)
 def build_df_final(df_snap: pd.DataFrame, inflacion_anual: float) -> pd.DataFrame:
     if df_snap is None or df_snap.empty:
         return pd.DataFrame()
@@ -2831,187 +3438,95 @@ def build_df_final(df_snap: pd.DataFrame, inflacion_anual: float) -> pd.DataFram
 # =========================
 #  core_issuer y RV
 # =========================
-@st.cache_data(ttl=3600, show_spinner=True)
 def core_issuer_map() -> pd.DataFrame:
-    core = pg_run_sql("""
-        SELECT issuer_name, ticker_symbol, sector, industry
-        FROM core_issuer
-        WHERE issuer_name IS NOT NULL
-    """)
-    if core.empty:
-        return pd.DataFrame(columns=["issuer_name","Nombre Completo","sector","industry"])
-    core = core.copy()
-    core["issuer_name"] = core["issuer_name"].astype(str)
-    core["ticker_symbol"] = core.get("ticker_symbol", pd.Series(index=core.index, dtype=object))
-    core["sector"] = core.get("sector", pd.Series(index=core.index, dtype=object))
-    core["industry"] = core.get("industry", pd.Series(index=core.index, dtype=object))
-
-    def _mode_or_default(s, default_val):
-        s = s.dropna()
-        return s.value_counts().index[0] if len(s) else default_val
-
-    agg = (core.groupby("issuer_name", dropna=False)
-           .agg({
-               "ticker_symbol": lambda s: _mode_or_default(s, None),
-               "sector":        lambda s: _mode_or_default(s, "SIN SECTOR"),
-               "industry":      lambda s: _mode_or_default(s, "SIN INDUSTRIA"),
-           })
-           .reset_index())
-
-    agg["Nombre Completo"] = np.where(
-        agg["ticker_symbol"].notna() & (agg["ticker_symbol"].astype(str).str.strip() != ""),
-        agg["ticker_symbol"].astype(str),
-        agg["issuer_name"].astype(str)
-    )
-    agg["Nombre Completo"] = agg["Nombre Completo"].str.split(",", n=1, expand=True)[0].str.strip()
-    agg["sector"] = agg["sector"].fillna("SIN SECTOR")
-    agg["industry"] = agg["industry"].fillna("SIN INDUSTRIA")
-    return agg[["issuer_name","Nombre Completo","sector","industry"]]
+    """issuer_name -> Nombre Completo / sector / industry desde dim_core_issuer() (copia sin categóricas)."""
+    return _decat(dim_core_issuer())
 
-@st.cache_data(ttl=900, show_spinner=True)
+@perf_cache_data(ttl=900, show_spinner=False)
 def rv_snapshot_por_producto(alias: str, f_ini: pd.Timestamp, f_fin_next: pd.Timestamp,
                              contratos_key: tuple[int, ...] | None = None) -> pd.DataFrame:
-    filtro_fc, params_fc = build_contrato_filter_sql(contratos_key, "c1.ID_CLIENTE", "cid_rv_fc")
-    filtro_main, params_main = build_contrato_filter_sql(contratos_key, "c.ID_CLIENTE", "cid_rv_main")
-
-    SQL = f"""
-    WITH FECHA_C AS (
-      SELECT MAX(TRUNC(h.REGISTRO_CONTROL)) AS FECHA_CORTE
-      FROM SIAPII.V_HIS_POSICION_CLIENTE h
-      WHERE TRUNC(h.REGISTRO_CONTROL) >= TO_DATE(:f_ini_dt,'YYYY-MM-DD')
-        AND TRUNC(h.REGISTRO_CONTROL) <  TO_DATE(:f_fin_dt,'YYYY-MM-DD')
-        AND EXISTS (
-            SELECT 1
-            FROM SIAPII.V_M_CONTRATO_CDM c1
-            WHERE c1.ALIAS_CDM = :alias
-              AND c1.ID_CLIENTE = h.ID_CLIENTE
-              {filtro_fc}
-        )
-    )
-    SELECT
-      h.ID_PRODUCTO,
-      MAX(e.NOMBRE_EMISORA) AS NOMBRE_EMISORA,
-      SUM(h.VALOR_REAL)     AS MONTO
-    FROM SIAPII.V_HIS_POSICION_CLIENTE h
-    JOIN FECHA_C fc ON TRUNC(h.REGISTRO_CONTROL) = fc.FECHA_CORTE
-    JOIN SIAPII.V_M_CONTRATO_CDM c ON c.ID_CLIENTE = h.ID_CLIENTE AND c.ALIAS_CDM = :alias
-    JOIN SIAPII.V_M_EMISORA e ON e.ID_EMISORA = h.ID_EMISORA
-    WHERE (e.ID_TIPO_ACTIVO = 2 OR h.ID_PRODUCTO IN ({REPORTO_RV_CSV}))
-      {filtro_main}
-    GROUP BY h.ID_PRODUCTO, e.ID_EMISORA
-    HAVING SUM(h.VALOR_REAL) IS NOT NULL
-    """
-    params = {
-        "alias": alias,
-        "f_ini_dt": f_ini.strftime("%Y-%m-%d"),
-        "f_fin_dt": f_fin_next.strftime("%Y-%m-%d"),
-    }
-    params.update(params_fc)
-    params.update(params_main)
-    return run_sql(SQL, params)
+    """RV (tipo 2 + reportos de RV) del último día de corte de [f_ini, f_fin_next), derivado del cubo."""
+    cut = _cube_last_cut(_cube(alias, f_fin_next, contratos_key), f_ini, f_fin_next)
+    df = _cube_rows(cut, 2)
+    df = df[df["VALOR_REAL"].notna()] if not df.empty else df
+    if df.empty:
+        return pd.DataFrame(columns=["ID_PRODUCTO", "NOMBRE_EMISORA", "MONTO"])
+    return (_decat(df[["ID_PRODUCTO", "NOMBRE_EMISORA", "VALOR_REAL"]])
+              .rename(columns={"VALOR_REAL": "MONTO"})
+              .reset_index(drop=True))
 
 # =========================
 #  HISTÓRICO trimestral + duración
 # =========================
-@st.cache_data(ttl=3600, show_spinner=True)
+@perf_cache_data(ttl=3600, show_spinner=False)
 def hist_trimestral_papel_instrumento(alias: str, id_tipo_activo: int, cutoff_next: pd.Timestamp,
                                       contratos_key: tuple[int, ...] | None = None):
-    if contratos_key is not None and isinstance(contratos_key, pd.Index):
-        contratos_key = tuple(map(int, contratos_key.tolist()))
-
-    filtro_contratos, extra_params = build_contrato_filter_sql(contratos_key, "c.ID_CLIENTE", "cid_hist_tri")
-
-    SQL = f"""
-    WITH H AS (
-      SELECT
-        TRUNC(h.REGISTRO_CONTROL, 'Q') AS Q,
-        CASE 
-          WHEN h.ID_PRODUCTO IN ({REPORTO_RV_CSV}) THEN 2
-          ELSE e.ID_TIPO_ACTIVO
-        END AS ID_ACTIVO_LOGICO,
-        e.TIPO_PAPEL,
-        e.TIPO_INSTRUMENTO,
-        SUM(h.VALOR_REAL) AS MONTO
-      FROM SIAPII.V_HIS_POSICION_CLIENTE h
-      JOIN SIAPII.V_M_EMISORA e ON e.ID_EMISORA = h.ID_EMISORA
-      JOIN SIAPII.V_M_CONTRATO_CDM c ON c.ID_CLIENTE = h.ID_CLIENTE
-      WHERE c.ALIAS_CDM = :alias
-        {filtro_contratos}
-        AND h.REGISTRO_CONTROL >= TO_DATE('2020-01-01','YYYY-MM-DD')
-        AND h.REGISTRO_CONTROL <  TO_DATE(:cutoff_next,'YYYY-MM-DD')
-
-      GROUP BY TRUNC(h.REGISTRO_CONTROL, 'Q'),
-               CASE 
-                 WHEN h.ID_PRODUCTO IN ({REPORTO_RV_CSV}) THEN 2
-                 ELSE e.ID_TIPO_ACTIVO
-               END,
-               e.TIPO_PAPEL, e.TIPO_INSTRUMENTO
-    ),
-    FILT AS (
-      SELECT Q, TIPO_PAPEL, TIPO_INSTRUMENTO, MONTO
-      FROM H WHERE ID_ACTIVO_LOGICO = :id_act
-    ),
-    TOT AS ( SELECT Q, SUM(MONTO) AS TOT FROM FILT GROUP BY Q )
-    SELECT
-      TO_CHAR(f.Q,'YYYY') || '-Q' || TO_CHAR(f.Q,'Q') AS PERIODO,
-      f.TIPO_PAPEL,
-      f.TIPO_INSTRUMENTO,
-      f.MONTO,
-      t.TOT,
-      CASE WHEN t.TOT=0 OR t.TOT IS NULL THEN 0 ELSE (f.MONTO/t.TOT)*100 END AS PCT
-    FROM FILT f
-    JOIN TOT  t ON t.Q = f.Q
-    """
-    params = {
-    "alias": alias,
-    "id_act": id_tipo_activo,
-    "cutoff_next": pd.to_datetime(cutoff_next).strftime("%Y-%m-%d")
-}
-    params.update(extra_params)
-    df = run_sql(SQL, params)
+    """Mezcla % por TIPO_PAPEL / TIPO_INSTRUMENTO de cada trimestre (suma de los cierres de mes del cubo)."""
+    df = _cube_rows(_cube(alias, cutoff_next, contratos_key), id_tipo_activo)
     if df.empty:
         return (pd.DataFrame(columns=["PERIODO","TIPO_PAPEL","Pct"]),
                 pd.DataFrame(columns=["PERIODO","TIPO_INSTRUMENTO","Pct"]))
-    df = df.rename(columns={"PCT": "Pct"})
-    df["Pct"] = pd.to_numeric(df["Pct"], errors="coerce").fillna(0.0)
-    por_papel = df.groupby(["PERIODO","TIPO_PAPEL"], dropna=False)["Pct"].sum().reset_index()
-    por_instr = df.groupby(["PERIODO","TIPO_INSTRUMENTO"], dropna=False)["Pct"].sum().reset_index()
-    def _key(p):
-        y, q = p.split("-Q")
-        return (int(y), int(q))
-    por_papel = por_papel.sort_values(by="PERIODO", key=lambda s: s.map(_key)).reset_index(drop=True)
-    por_instr = por_instr.sort_values(by="PERIODO", key=lambda s: s.map(_key)).reset_index(drop=True)
-    return por_papel, por_instr
-
-@st.cache_data(ttl=1800, show_spinner=True)
+    q = df["MES"].dt.to_period("Q")
+    g = (_decat(df[["TIPO_PAPEL","TIPO_INSTRUMENTO"]])
+           .assign(Q=q, MONTO=pd.to_numeric(df["VALOR_REAL"], errors="coerce"))
+           .groupby(["Q","TIPO_PAPEL","TIPO_INSTRUMENTO"], dropna=False, as_index=False)["MONTO"].sum())
+    tot = g.groupby("Q")["MONTO"].transform("sum")
+    g["Pct"] = (g["MONTO"] / tot.where(tot.ne(0)) * 100).fillna(0.0)
+    g["PERIODO"] = g["Q"].dt.year.astype(str) + "-Q" + g["Q"].dt.quarter.astype(str)
+    por_papel = g.groupby(["Q","PERIODO","TIPO_PAPEL"], dropna=False, sort=True)["Pct"].sum().reset_index()
+    por_instr = g.groupby(["Q","PERIODO","TIPO_INSTRUMENTO"], dropna=False, sort=True)["Pct"].sum().reset_index()
+    return (por_papel.drop(columns="Q").reset_index(drop=True),
+            por_instr.drop(columns="Q").reset_index(drop=True))
+
+@perf_cache_data(ttl=1800, show_spinner=False)
+def rv_emisora_por_mes(alias: str, end_ref: pd.Timestamp, n: int = 12,
+                       contratos_key: tuple[int, ...] | None = None) -> pd.DataFrame:
+    """
+    RV por (MES, NOMBRE_EMISORA) en los n cierres de mes que terminan en end_ref, con el total de RV
+    del mes (TOT_RV) para sacar el % de portafolio. Derivado del cubo.
+    """
+    end_m = pd.Timestamp(end_ref).to_period("M")
+    df = _cube_rows(_cube(alias, end_m.to_timestamp("M") + pd.Timedelta(days=1), contratos_key), 2,
+                    f_ini=(end_m - (n - 1)).to_timestamp())
+    if df.empty:
+        return pd.DataFrame(columns=["MES", "NOMBRE_EMISORA", "ID_ACTIVO_LOGICO", "MONTO", "TOT_RV"])
+    g = (_decat(df[["MES", "NOMBRE_EMISORA", "ID_ACTIVO_LOGICO"]])
+           .assign(MONTO=pd.to_numeric(df["VALOR_REAL"], errors="coerce"))
+           .groupby(["MES", "NOMBRE_EMISORA", "ID_ACTIVO_LOGICO"], dropna=False, as_index=False)["MONTO"].sum())
+    g["TOT_RV"] = g.groupby("MES")["MONTO"].transform("sum")
+    return g
+
+def duracion_ponderada_por_mes(df_snap_m: pd.DataFrame) -> pd.DataFrame:
+    """
+    Duración del portafolio por mes = Σ DURACION_DIAS·VALOR_REAL / Σ VALOR_REAL (0 si no hay valor),
+    redondeada a días: el mismo número que el renglón TOTAL de build_df_final, sin armar el detalle.
+    """
+    if df_snap_m is None or df_snap_m.empty:
+        return pd.DataFrame(columns=["MES", "DURACION_DIAS"])
+    vr = pd.to_numeric(df_snap_m["VALOR_REAL"], errors="coerce").fillna(0.0)
+    dur = pd.to_numeric(df_snap_m["DURACION_DIAS"], errors="coerce").fillna(0.0)
+    g = (pd.DataFrame({"MES": pd.to_datetime(df_snap_m["MES"]) + pd.offsets.MonthEnd(0),
+                       "VR": vr, "DV": dur * vr})
+           .groupby("MES", as_index=False)[["VR", "DV"]].sum())
+    vr_tot = g["VR"].to_numpy()
+    dur_m = np.where(vr_tot > 0, g["DV"].to_numpy() / np.where(vr_tot > 0, vr_tot, 1.0), 0.0)
+    return (pd.DataFrame({"MES": g["MES"], "DURACION_DIAS": np.round(dur_m, 0)})
+              .sort_values("MES").reset_index(drop=True))
+
+@perf_cache_data(ttl=1800, show_spinner=False)
 def deuda_duracion_historico(alias: str, inflacion_anual: float, f_ref_fin: pd.Timestamp,
                              contratos_key: tuple[int, ...] | None = None) -> pd.DataFrame:
-    filas = []
+    # inflacion_anual solo afecta el carry; se conserva en la firma (y llave de cache) por compatibilidad
     ref_period = f_ref_fin.to_period("M")
-    for k in range(11, -1, -1):
-        periodo = ref_period - k
-        mes_end = periodo.to_timestamp("M")
-        mes_ini = mes_end.replace(day=1)
-        mes_end_next = mes_end + pd.Timedelta(days=1)
-        df_snap = query_snapshot_deuda(alias, mes_ini, mes_end_next, contratos_key)
-        df_det = build_df_final(df_snap, inflacion_anual)
-        if df_det is None or df_det.empty:
-            continue
-        total_row = df_det[df_det["Instrumento"].astype(str).str.upper() == "TOTAL"].tail(1)
-        if total_row.empty:
-            continue
-        dur = pd.to_numeric(total_row["Duración (días)"], errors="coerce").iloc[0]
-        if pd.isna(dur):
-            continue
-        filas.append({"MES": mes_end, "DURACION_DIAS": float(dur)})
-    if not filas:
-        return pd.DataFrame(columns=["MES", "DURACION_DIAS"])
-    return pd.DataFrame(filas).sort_values("MES").reset_index(drop=True)
+    f_ini = (ref_period - 11).to_timestamp()
+    f_fin_next = ref_period.to_timestamp("M") + pd.Timedelta(days=1)
+    df_snap_m = query_snapshot_deuda_multi(alias, f_ini, f_fin_next, contratos_key)
+    return duracion_ponderada_por_mes(df_snap_m)
 
 # =========================
 #  CONSULTAS BASE / PARAMS
 # =========================
-with st.spinner("Consultando Oracle / Postgres y construyendo vistas…"):
+def _aa_base():
     QUERY_BASE_AA, params_aa = build_query_base_unfiltered(ALIAS_CDM, FECHA_ESTADISTICA, CONTRATOS_KEY)
     base = run_sql(QUERY_BASE_AA, params=params_aa)
     if not base.empty:
@@ -3030,33 +3545,60 @@ with st.spinner("Consultando Oracle / Postgres y construyendo vistas…"):
     else:
         df_aa_activo = pd.DataFrame(columns=["Categoria","Monto","Porcentaje"])
         df_aa_producto = pd.DataFrame(columns=["PRODUCTO","ACTIVO","Monto","Porcentaje"])
+    return df_aa_activo, df_aa_producto
+
+def _rv_enriq(rv_df_raw: pd.DataFrame, core_map_df: pd.DataFrame, mp_rv: pd.DataFrame) -> pd.DataFrame:
+    rv_enriq_base = pd.DataFrame()
+    if not rv_df_raw.empty:
+        rv_enriq_base = rv_df_raw.merge(core_map_df, left_on="NOMBRE_EMISORA", right_on="issuer_name", how="left")
+        rv_enriq_base = rv_enriq_base.merge(mp_rv[["ID_PRODUCTO","PRODUCTO"]], on="ID_PRODUCTO", how="left")
+        rv_enriq_base.rename(columns={"PRODUCTO": "Producto"}, inplace=True)
+        rv_enriq_base["industry"] = rv_enriq_base["industry"].fillna("SIN INDUSTRIA")
+        rv_enriq_base["sector"] = rv_enriq_base["sector"].fillna("SIN SECTOR")
+        rv_enriq_base["Nombre Completo"] = rv_enriq_base.get("Nombre Completo", rv_enriq_base["NOMBRE_EMISORA"].astype(str))
+        rv_enriq_base["Nombre Completo"] = rv_enriq_base["Nombre Completo"].astype(str).str.split(",", n=1, expand=True)[0].str.strip()
+    return rv_enriq_base
+
+# Plan de consultas: {nombre: (fn, dependencias)}; las independientes corren en paralelo
+with st.spinner("Consultando Oracle / Postgres y construyendo vistas…"):
+    _q = run_query_plan({
+        "aa":               (_aa_base, []),
+        # una consulta por nivel; las vistas 12m / 5 años / mes de corte esperan a su ventana
+        "rend_cto_win":     (lambda: rend_cto_window(ALIAS_CDM, y, m, REND_HIST_YEARS, CONTRATOS_KEY), []),
+        "rend_prod_win":    (lambda: rend_prod_window(ALIAS_CDM, y, m, REND_HIST_YEARS, CONTRATOS_KEY), []),
+        "rend":             (lambda **_: rend_bruto_contrato_y_producto(ALIAS_CDM, y, m, CONTRATOS_KEY), ["rend_cto_win"]),
+        "hist_rend":        (lambda **_: rend_bruto_contrato_hist_12m(ALIAS_CDM, y, m, CONTRATOS_KEY), ["rend_cto_win"]),
+        "hist_rend_prod":   (lambda **_: rend_bruto_producto_hist_12m(ALIAS_CDM, y, m, CONTRATOS_KEY), ["rend_prod_win"]),
+        "hist_rend_5y":     (lambda **_: rend_bruto_contrato_hist_n_years(ALIAS_CDM, y, m, n_years=5, contratos_key=CONTRATOS_KEY), ["rend_cto_win"]),
+        "hist_rend_prod_5y": (lambda **_: rend_bruto_producto_hist_n_years(ALIAS_CDM, y, m, n_years=5, contratos_key=CONTRATOS_KEY), ["rend_prod_win"]),
+        # una lectura de posiciones; snapshots, mezcla trimestral y duración se derivan del cubo
+        "pos_cube":         (lambda: _cube(ALIAS_CDM, F_DIA_FIN_NEXT, CONTRATOS_KEY), []),
+        "snap_deuda":       (lambda **_: query_snapshot_deuda(ALIAS_CDM, F_DIA_INI, F_DIA_FIN_NEXT, CONTRATOS_KEY), ["pos_cube"]),
+        "final_deuda":      (lambda snap_deuda: build_df_final(snap_deuda, INFLACION_ANUAL), ["snap_deuda"]),
+        "rv_raw":           (lambda **_: rv_snapshot_por_producto(ALIAS_CDM, F_DIA_INI, F_DIA_FIN_NEXT, CONTRATOS_KEY), ["pos_cube"]),
+        "core_map":         (core_issuer_map, []),
+        "map_prod":         (map_productos, []),
+        "rv_enriq":         (lambda rv_raw, core_map, map_prod: _rv_enriq(rv_raw, core_map, map_prod),
+                             ["rv_raw", "core_map", "map_prod"]),
+        "hist_deuda":       (lambda **_: hist_trimestral_papel_instrumento(ALIAS_CDM, 1, F_DIA_FIN_NEXT, CONTRATOS_KEY), ["pos_cube"]),
+        "hist_rv":          (lambda **_: hist_trimestral_papel_instrumento(ALIAS_CDM, 2, F_DIA_FIN_NEXT, CONTRATOS_KEY), ["pos_cube"]),
+        "hist_dur":         (lambda **_: deuda_duracion_historico(ALIAS_CDM, INFLACION_ANUAL, F_DIA_FIN, CONTRATOS_KEY), ["pos_cube"]),
+    })
 
-cto_m_anual, cto_ytd_anual, df_rend_prod = rend_bruto_contrato_y_producto(ALIAS_CDM, y, m, CONTRATOS_KEY)
-df_hist_rend      = rend_bruto_contrato_hist_12m(ALIAS_CDM, y, m, CONTRATOS_KEY)
-df_hist_rend_prod = rend_bruto_producto_hist_12m(ALIAS_CDM, y, m, CONTRATOS_KEY)
-df_hist_rend_5y      = rend_bruto_contrato_hist_n_years(ALIAS_CDM, y, m, n_years=5, contratos_key=CONTRATOS_KEY)
-df_hist_rend_prod_5y = rend_bruto_producto_hist_n_years(ALIAS_CDM, y, m, n_years=5, contratos_key=CONTRATOS_KEY)
-
-with st.spinner("Calculando Deuda…"):
-    df_snap_deuda = query_snapshot_deuda(ALIAS_CDM, F_DIA_INI, F_DIA_FIN_NEXT, CONTRATOS_KEY)
-    df_final_deuda = build_df_final(df_snap_deuda, INFLACION_ANUAL)
-
-rv_df_raw = rv_snapshot_por_producto(ALIAS_CDM, F_DIA_INI, F_DIA_FIN_NEXT, CONTRATOS_KEY)
-core_map_df = core_issuer_map()
-rv_enriq_base = pd.DataFrame()
-if not rv_df_raw.empty:
-    rv_enriq_base = rv_df_raw.merge(core_map_df, left_on="NOMBRE_EMISORA", right_on="issuer_name", how="left")
-    mp_rv = map_productos()
-    rv_enriq_base = rv_enriq_base.merge(mp_rv[["ID_PRODUCTO","PRODUCTO"]], on="ID_PRODUCTO", how="left")
-    rv_enriq_base.rename(columns={"PRODUCTO": "Producto"}, inplace=True)
-    rv_enriq_base["industry"] = rv_enriq_base["industry"].fillna("SIN INDUSTRIA")
-    rv_enriq_base["sector"] = rv_enriq_base["sector"].fillna("SIN SECTOR")
-    rv_enriq_base["Nombre Completo"] = rv_enriq_base.get("Nombre Completo", rv_enriq_base["NOMBRE_EMISORA"].astype(str))
-    rv_enriq_base["Nombre Completo"] = rv_enriq_base["Nombre Completo"].astype(str).str.split(",", n=1, expand=True)[0].str.strip()
-
-hist_deuda_papel, hist_deuda_instr = hist_trimestral_papel_instrumento(ALIAS_CDM, 1, F_DIA_FIN_NEXT, CONTRATOS_KEY)
-hist_rv_papel, hist_rv_instr = hist_trimestral_papel_instrumento(ALIAS_CDM, 2, F_DIA_FIN_NEXT, CONTRATOS_KEY)
-hist_dur = deuda_duracion_historico(ALIAS_CDM, INFLACION_ANUAL, F_DIA_FIN, CONTRATOS_KEY)
+df_aa_activo, df_aa_producto = _q["aa"]
+cto_m_anual, cto_ytd_anual, df_rend_prod = _q["rend"]
+df_hist_rend      = _q["hist_rend"]
+df_hist_rend_prod = _q["hist_rend_prod"]
+df_hist_rend_5y      = _q["hist_rend_5y"]
+df_hist_rend_prod_5y = _q["hist_rend_prod_5y"]
+df_snap_deuda  = _q["snap_deuda"]
+df_final_deuda = _q["final_deuda"]
+rv_df_raw   = _q["rv_raw"]
+core_map_df = _q["core_map"]
+rv_enriq_base = _q["rv_enriq"]
+hist_deuda_papel, hist_deuda_instr = _q["hist_deuda"]
+hist_rv_papel, hist_rv_instr = _q["hist_rv"]
+hist_dur = _q["hist_dur"]
 
 # =========================
 #  TÍTULO
@@ -3319,23 +3861,11 @@ def plot_rend_producto_series(
     footer_bm_prod_a = bench_ficha_to_markdown(rows_bm_prod_a, title="Benchmark (composición)")
     render_print_block(" ", fig_a, print_mode=print_mode, break_after=True, footer_md=footer_bm_prod_a)
 
-# =========================
-#  BENCHMARKS: CACHE HELPERS
-# =========================
-@st.cache_data(show_spinner=False)
-def _bench_map_cached():
-    return load_bench_map(BENCH_MAP_FILE)
-
-@st.cache_data(show_spinner=False)
-def _bench_levels_cached(alias_cdm: str, nombre_corto: str, producto: str | None):
-    df_map = _bench_map_cached()
-    rows = get_bench_rows(df_map, alias_cdm=alias_cdm, nombre_corto=nombre_corto, producto=producto)
-    return build_benchmark_series(rows, BENCH_FILES)  # FECHA, BENCH (nivel)
-
-bench_map_df = load_bench_map(BENCH_MAP_FILE)
+bench_map_df = get_bench_map()
 # =========================
 #  RENDER SECCIONES
 # =========================
+@perf_timed
 def render_resumen():
     # KPIs
     total_port = float(df_aa_activo["Monto"].sum()) if len(df_aa_activo) else 0.0
@@ -3496,12 +4026,10 @@ def render_resumen():
     # PORTAFOLIO TOTAL => producto=None (según nuestra regla)
     if nombre_corto_focus:
         try:
-            bench_pack = build_bench_pack_from_map(
-                bench_map_df=bench_map_df,
+            bench_pack = get_bench_pack(
                 alias_cdm=ALIAS_CDM,
                 nombre_corto=nombre_corto_focus,
                 producto=None,          # ✅ PORTAFOLIO TOTAL
-                bench_files=BENCH_FILES,
             )
             if bench_pack is not None and bench_pack.empty:
                 bench_pack = None
@@ -3636,6 +4164,7 @@ def render_resumen():
         _style_fig_for_mode(fig_y, print_mode=print_mode)
         render_print_block(" ", fig_y, print_mode=print_mode, break_after=True)
 
+@perf_timed
 def render_allocation_general():
     st.subheader("Portafolio")
     if not len(df_aa_producto):
@@ -3662,6 +4191,7 @@ def render_allocation_general():
         else:
             st.dataframe(df_tab, hide_index=True, use_container_width=True)
 
+@perf_timed
 def render_allocation_detalle():
     st.subheader("Distribución por estrategia")
     prod_deuda = df_aa_producto[df_aa_producto["ACTIVO"]=="Deuda"]["PRODUCTO"].dropna().unique().tolist()
@@ -3706,6 +4236,7 @@ def render_allocation_detalle():
             else:
                 st.dataframe(vista, hide_index=True, use_container_width=True)
 
+@perf_timed
 def render_allocation_historico():
     st.subheader("Comportamiento de activos y estrategias")
     aa_activo, aa_producto = aa_hist_ultimo_5_anios(ALIAS_CDM, F_DIA_FIN_NEXT, CONTRATOS_KEY)
@@ -3734,6 +4265,7 @@ def render_allocation_historico():
             st.plotly_chart(area100_from_pivot(pivot_p2, "Productos", tickvals=tickvals2),
                             use_container_width=True, config={"displayModeBar": False})
 
+@perf_timed
 def render_deuda_composicion(df_final):
     st.subheader("Composición de activos deuda")
     if df_final.empty:
@@ -3769,6 +4301,7 @@ def render_deuda_composicion(df_final):
             use_container_width=True, config={"displayModeBar": False}
         )
 
+@perf_timed
 def render_deuda_riesgo(df_final):
     st.subheader("Calificación")
     if df_final.empty:
@@ -3858,6 +4391,7 @@ def render_deuda_riesgo(df_final):
     else:
         st.caption("No hay histórico de duración disponible.")
 
+@perf_timed
 def render_deuda_historico_trimestral():
     st.subheader("Comportamiento del tipo de papel e instrumento")
     c1, c2 = st.columns(2)
@@ -3884,6 +4418,7 @@ def render_deuda_historico_trimestral():
             fig2 = add_datapoints_to_fig(fig2, decimals=1)
             st.plotly_chart(fig2, use_container_width=True, config={"displayModeBar": False})
 
+@perf_timed
 def render_deuda_tabla(df_final):
     st.subheader("Portafolio")
     if df_final.empty:
@@ -3935,6 +4470,7 @@ def render_deuda_tabla(df_final):
             st.markdown('</div>', unsafe_allow_html=True)
             st.markdown("<br><em>Carry calculado a 365 días</em>", unsafe_allow_html=True)
 
+@perf_timed
 def render_deuda_por_producto_comp(df_final):
     st.subheader("Composición por estrategia de deuda")
     if df_final.empty:
@@ -3972,6 +4508,7 @@ def render_deuda_por_producto_comp(df_final):
                 use_container_width=True, config={"displayModeBar": False}
             )
 
+@perf_timed
 def render_deuda_rendimientos_por_producto():
     st.subheader("Rendimientos por estrategia de deuda")
     if df_hist_rend_prod is None or df_hist_rend_prod.empty:
@@ -3996,12 +4533,10 @@ def render_deuda_rendimientos_por_producto():
     if nombre_corto_focus:
         try:
             # producto != portafolio total => benchmarks de producto
-            bench_pack = build_bench_pack_from_map(
-                bench_map_df=bench_map_df,
+            bench_pack = get_bench_pack(
                 alias_cdm=ALIAS_CDM,
                 nombre_corto=nombre_corto_focus,
                 producto=prod_sel,          # ✅ benchmarks ligados al producto
-                bench_files=BENCH_FILES,
             )
             if bench_pack is not None and bench_pack.empty:
                 bench_pack = None
@@ -4016,6 +4551,7 @@ def render_deuda_rendimientos_por_producto():
     except Exception:
         pass
     
+@perf_timed
 def render_rv_resumen():
     st.subheader("Distribución")
     if rv_enriq_base.empty:
@@ -4053,6 +4589,7 @@ def render_rv_resumen():
     
     st.markdown("<br><em>Carry calculado a 365 días</em>", unsafe_allow_html=True)
 
+@perf_timed
 def render_rv_por_producto():
     st.subheader("Participación de industria y sector por estrategia")
     if rv_enriq_base.empty:
@@ -4095,44 +4632,10 @@ def render_rv_por_producto():
         else:
             st.dataframe(view, hide_index=True, use_container_width=True)
 
+@perf_timed
 def render_rv_evolucion():
     st.subheader("Comportamiento en el tiempo de principales sectores e industrias")
-    filtro_contratos, extra_params = build_contrato_filter_sql(CONTRATOS_KEY, "c.ID_CLIENTE", "cid_rv_evo")
-
-    rv12 = run_sql(f"""
-        WITH H AS (
-          SELECT
-            TRUNC(h.REGISTRO_CONTROL,'MM') AS MES,
-            e.NOMBRE_EMISORA,
-            CASE 
-              WHEN h.ID_PRODUCTO IN ({REPORTO_RV_CSV}) THEN 2
-              ELSE e.ID_TIPO_ACTIVO
-            END AS ID_ACTIVO_LOGICO,
-            SUM(h.VALOR_REAL) AS MONTO
-          FROM SIAPII.V_HIS_POSICION_CLIENTE h
-          JOIN SIAPII.V_M_CONTRATO_CDM c
-            ON c.ID_CLIENTE = h.ID_CLIENTE
-          JOIN SIAPII.V_M_EMISORA e ON e.ID_EMISORA = h.ID_EMISORA
-          WHERE c.ALIAS_CDM = :alias
-            {filtro_contratos}
-            AND h.REGISTRO_CONTROL >= ADD_MONTHS(TRUNC(SYSDATE,'MM'), -12)
-          GROUP BY TRUNC(h.REGISTRO_CONTROL,'MM'),
-                   e.NOMBRE_EMISORA,
-                   CASE 
-                     WHEN h.ID_PRODUCTO IN ({REPORTO_RV_CSV}) THEN 2
-                     ELSE e.ID_TIPO_ACTIVO
-                   END
-        ),
-        RV_MES AS (
-          SELECT MES, SUM(MONTO) AS TOT_RV
-          FROM H
-          WHERE ID_ACTIVO_LOGICO = 2
-          GROUP BY MES
-        )
-        SELECT H.MES, H.NOMBRE_EMISORA, H.ID_ACTIVO_LOGICO, H.MONTO, R.TOT_RV
-        FROM H JOIN RV_MES R ON R.MES = H.MES
-        WHERE H.ID_ACTIVO_LOGICO = 2
-    """, {"alias": ALIAS_CDM, **extra_params})
+    rv12 = rv_emisora_por_mes(ALIAS_CDM, F_DIA_FIN, 12, CONTRATOS_KEY)
     if rv12.empty:
         st.info("Sin datos para evolución 12 meses de RV.")
         return
@@ -4202,6 +4705,7 @@ def render_rv_evolucion():
         fig_ind = add_datapoints_to_fig(fig_ind, decimals=1)
         st.plotly_chart(fig_ind, use_container_width=True, config={"displayModeBar": False})
 
+@perf_timed
 def render_rv_rendimientos_por_producto():
     st.subheader("Rendimientos por estrategia de renta variable")
     if df_hist_rend_prod is None or df_hist_rend_prod.empty:
@@ -4224,12 +4728,10 @@ def render_rv_rendimientos_por_producto():
     bench_pack = None
     if nombre_corto_focus:
         try:
-            bench_pack = build_bench_pack_from_map(
-                bench_map_df=bench_map_df,
+            bench_pack = get_bench_pack(
                 alias_cdm=ALIAS_CDM,
                 nombre_corto=nombre_corto_focus,
                 producto=prod_sel,          # ✅ benchmarks ligados al producto
-                bench_files=BENCH_FILES,
             )
             if bench_pack is not None and bench_pack.empty:
                 bench_pack = None
@@ -4344,3 +4846,9 @@ else:
     st.markdown('</div>', unsafe_allow_html=True)
 
 st.markdown("<hr/><div style='text-align:center;opacity:.85'><small>Datos al cierre del mes seleccionado</small></div>", unsafe_allow_html=True)
+
+# Panel de desempeño de esta corrida (diagnóstico: ?perf=1 en la URL)
+if st.query_params.get("perf") == "1":
+    with st.sidebar:
+        with st.expander("Desempeño (última corrida)", expanded=True):
+            render_perf_panel()
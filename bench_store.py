@@ -0,0 +1,854 @@
+"""
+Benchmarks: índices + Mapa_Benchmarks sin dependencia de Streamlit.
+
+Lo importa app.py (lectura de índices con cache Parquet, tablas month-end, store versionado)
+y también se corre como CLI para armar el store offline, antes de desplegar:
+
+    python bench_store.py validate              # solo valida FILE_KEY / SHEET_NAME / COL_NAME del mapa
+    python bench_store.py build [--out DIR]     # valida + escribe store versionado (Parquet + manifest)
+                                [--keep N] [--strict]
+"""
+import os, re, sys, json, time
+import hashlib
+import posixpath
+import threading
+import unicodedata
+import zipfile
+import numpy as np
+import pandas as pd
+from datetime import date, datetime
+from pathlib import Path
+
+# =========================
+#  CONFIG
+# =========================
+APP_DIR = Path(__file__).resolve().parent
+DATA_DIR = APP_DIR / "data"
+
+BENCH_FILES = {
+    "PIP":    DATA_DIR / "Indices Pip.xlsx",
+    "RV":     DATA_DIR / "Indices RV.xlsx",
+    "BOLSAS": DATA_DIR / "Indices Bolsas.xlsx",
+    "SP":     DATA_DIR / "Indices SP.xlsx",
+}
+BENCH_MAP_FILE = DATA_DIR / "Mapa_Benchmarks.xlsx"
+BENCH_SHEET_DEFAULT = "indices"  # índices
+
+# Cache columnar (Parquet) de las hojas de índices ya limpias; se comparte entre réplicas/reinicios
+BENCH_CACHE_DIR = Path(os.getenv("BENCH_CACHE_DIR", str(DATA_DIR / ".bench_cache")))
+BENCH_CACHE_VERSION = 2  # subir si cambia la limpieza de _parse_index_file (invalida caches viejos)
+# Store versionado armado offline (python bench_store.py build); la app lo mapea al arrancar
+BENCH_STORE_DIR = Path(os.getenv("BENCH_STORE_DIR", str(DATA_DIR / "bench_store")))
+
+def configure(cache_dir: Path | str | None = None, store_dir: Path | str | None = None):
+    """Permite a la app sobreescribir rutas (p.ej. desde st.secrets)."""
+    global BENCH_CACHE_DIR, BENCH_STORE_DIR
+    if cache_dir:
+        BENCH_CACHE_DIR = Path(cache_dir)
+    if store_dir:
+        BENCH_STORE_DIR = Path(store_dir)
+
+# =========================
+#  MAPA + ÍNDICES
+# =========================
+
+REQUIRED_MAP_COLS = [
+    "ALIAS_CDM", "NOMBRE_CORTO", "PRODUCTO",
+    "BENCHMARK_LABEL", "FILE_KEY", "SHEET_NAME", "COL_NAME",
+    "PESO", "MODO"
+]
+
+def _norm_colname(s: str) -> str:
+    """
+    Normaliza headers del Excel:
+    - strip
+    - upper
+    - sin acentos
+    - espacios/guiones -> _
+    - colapsa __
+    """
+    if s is None:
+        return ""
+    s = str(s).strip()
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))  # quita acentos
+    s = s.upper()
+    for ch in [" ", "-", ".", "/", "\\", "(", ")", "[", "]", "{", "}", ":"]:
+        s = s.replace(ch, "_")
+    while "__" in s:
+        s = s.replace("__", "_")
+    return s.strip("_")
+
+def load_bench_map(map_path: Path, sheet_name=None) -> pd.DataFrame:
+    """
+    Carga Mapa_Benchmarks.xlsx tolerando headers "sucios".
+    - Normaliza nombres de columna
+    - Acepta sinónimos comunes
+    - Luego aplica tus normalizaciones de valores
+    """
+    _ensure_file(map_path, "Mapa_Benchmarks.xlsx")
+    df = pd.read_excel(map_path, sheet_name=sheet_name) if sheet_name else pd.read_excel(map_path)
+    df = df.copy()
+
+    # 1) Normaliza headers
+    orig_cols = list(df.columns)
+    df.columns = [_norm_colname(c) for c in df.columns]
+
+    # 2) Sinónimos / variantes (ajusta aquí si tu archivo usa otros nombres)
+    synonyms = {
+        # alias / contrato
+        "ALIAS": "ALIAS_CDM",
+        "ALIASCDM": "ALIAS_CDM",
+        "ALIAS_CDM_": "ALIAS_CDM",
+
+        "NOMBRECORTO": "NOMBRE_CORTO",
+        "NOMBRE_CORTO_": "NOMBRE_CORTO",
+        "CONTRATO": "NOMBRE_CORTO",
+
+        # producto
+        "ESTRATEGIA": "PRODUCTO",
+        "PRODUCTO_": "PRODUCTO",
+
+        # benchmark
+        "BENCHMARK": "BENCHMARK_LABEL",
+        "BENCHMARKS": "BENCHMARK_LABEL",
+        "BENCHMARK_LABEL_": "BENCHMARK_LABEL",
+        "INDICE": "BENCHMARK_LABEL",
+        "INDICE_LABEL": "BENCHMARK_LABEL",
+
+        # file
+        "ARCHIVO": "FILE_KEY",
+        "FILE": "FILE_KEY",
+        "FILEKEY": "FILE_KEY",
+
+        # sheet/col
+        "HOJA": "SHEET_NAME",
+        "SHEET": "SHEET_NAME",
+        "SHEETNAME": "SHEET_NAME",
+
+        "COLUMNA": "COL_NAME",
+        "COL": "COL_NAME",
+        "COLNAME": "COL_NAME",
+
+        # peso/modo
+        "WEIGHT": "PESO",
+        "PESOS": "PESO",
+
+        "TIPO": "MODO",
+    }
+
+    # Aplica synonyms SOLO si la columna destino no existe ya
+    rename_map = {}
+    for c in df.columns:
+        if c in synonyms and synonyms[c] not in df.columns:
+            rename_map[c] = synonyms[c]
+    if rename_map:
+        df = df.rename(columns=rename_map)
+
+    # 3) Valida requeridas
+    missing = [c for c in REQUIRED_MAP_COLS if c not in df.columns]
+    if missing:
+        # Debug útil: muestra qué columnas sí detectó
+        raise ValueError(
+            "[BENCH] Mapa_Benchmarks no trae columnas requeridas.\n"
+            f"Faltan: {missing}\n"
+            f"Columnas detectadas (normalizadas): {list(df.columns)}\n"
+            f"Columnas originales: {orig_cols}"
+        )
+
+    # 4) Normalizaciones de valores (igual que ya tenías)
+    df["ALIAS_CDM"] = df["ALIAS_CDM"].apply(_norm_upper)
+    df["NOMBRE_CORTO"] = df["NOMBRE_CORTO"].apply(_norm_str)
+    df["PRODUCTO"] = df["PRODUCTO"].apply(_norm_str)
+    df["BENCHMARK_LABEL"] = df["BENCHMARK_LABEL"].apply(_norm_str)
+    df["FILE_KEY"] = df["FILE_KEY"].apply(_norm_upper)
+    df["SHEET_NAME"] = df["SHEET_NAME"].apply(_norm_str)
+    df["COL_NAME"] = df["COL_NAME"].apply(_norm_str)
+    df["MODO"] = df["MODO"].apply(_norm_upper)
+    df["PESO"] = pd.to_numeric(df["PESO"], errors="coerce").fillna(0.0)
+
+    return df
+
+
+def _norm_str(x):
+    return "" if pd.isna(x) else str(x).strip()
+
+def _norm_upper(x):
+    return _norm_str(x).upper()
+
+def _ensure_file(path: Path, label: str):
+    if path is None:
+        raise FileNotFoundError(f"[BENCH] Path None para {label}")
+    if not Path(path).exists():
+        raise FileNotFoundError(f"[BENCH] No existe el archivo {label}: {path}")
+
+def _index_cache_prefix(file_path: Path, sheet_name: str, kind: str = "") -> str:
+    """
+    Prefijo estable del cache para (archivo, hoja); las versiones viejas comparten prefijo.
+    kind: "" = niveles diarios, "ME" = niveles a cierre de mes.
+    """
+    prefix = f"{_norm_colname(Path(file_path).stem)}__{_norm_colname(sheet_name)}"
+    return f"{prefix}_{kind}" if kind else prefix
+
+def _index_cache_path(file_path: Path, sheet_name: str, kind: str = "") -> Path | None:
+    """
+    Ruta del cache Parquet de (archivo, hoja).
+    La llave incluye ruta, tamaño y mtime del archivo fuente: si el Excel cambia, la llave cambia.
+    """
+    try:
+        stat = Path(file_path).stat()
+    except OSError:
+        return None
+    key = f"{BENCH_CACHE_VERSION}|{Path(file_path).resolve()}|{sheet_name}|{stat.st_size}|{stat.st_mtime_ns}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    return BENCH_CACHE_DIR / f"{_index_cache_prefix(file_path, sheet_name, kind)}__v{BENCH_CACHE_VERSION}_{digest}.parquet"
+
+def _previous_index_cache(cache_path: Path | None, prefix: str) -> Path | None:
+    """Cache anterior (misma versión de limpieza) de la misma hoja, si quedó en disco; el más reciente."""
+    if cache_path is None or not cache_path.parent.exists():
+        return None
+    olds = [p for p in cache_path.parent.glob(f"{prefix}__v{BENCH_CACHE_VERSION}_*.parquet") if p != cache_path]
+    return max(olds, key=lambda p: p.stat().st_mtime_ns) if olds else None
+
+def _match_index_columns(available: list, wanted: list) -> list:
+    """Resuelve COL_NAME del mapa contra headers reales (match exacto y luego por strip)."""
+    avail = [str(c) for c in available]
+    by_strip = {c.strip(): c for c in avail}
+    out = []
+    for w in wanted:
+        w = str(w)
+        real = w if w in avail else by_strip.get(w.strip())
+        if real is not None and real != "FECHA" and real not in out:
+            out.append(real)
+    return out
+
+def _load_index_cache(cache_path: Path | None, usecols: list | None = None) -> pd.DataFrame | None:
+    if cache_path is None or not cache_path.exists():
+        return None
+    try:
+        if not usecols:
+            return pd.read_parquet(cache_path)
+        import pyarrow.parquet as pq
+        all_cols = pq.read_schema(cache_path).names
+        cols = _match_index_columns(all_cols, usecols)
+        df = pd.read_parquet(cache_path, columns=["FECHA"] + cols)
+        df.attrs["ALL_COLUMNS"] = all_cols
+        return df
+    except Exception:
+        # cache corrupto o sin motor parquet: se vuelve a parsear el Excel
+        return None
+
+def _index_ingest_meta(cache_path: Path | None) -> dict | None:
+    """Huella de ingesta (_xlsx_ingest_state) guardada en la metadata del Parquet, si la hay."""
+    if cache_path is None:
+        return None
+    try:
+        import pyarrow.parquet as pq
+        raw = (pq.read_schema(cache_path).metadata or {}).get(_INGEST_META_KEY)
+        return json.loads(raw) if raw else None
+    except Exception:
+        return None
+
+def _save_index_cache(cache_path: Path | None, df: pd.DataFrame, prefix: str, ingest: dict | None = None):
+    """
+    Escritura atómica (tmp + replace) y limpieza de versiones anteriores del mismo (archivo, hoja).
+    ingest: huella de las filas ya ingeridas; viaja en la metadata del Parquet (atómica con los datos).
+    """
+    if cache_path is None:
+        return
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        if ingest is None:
+            df.to_parquet(tmp, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            tbl = pa.Table.from_pandas(df, preserve_index=False)
+            meta = {**(tbl.schema.metadata or {}), _INGEST_META_KEY: json.dumps(ingest).encode("utf-8")}
+            pq.write_table(tbl.replace_schema_metadata(meta), tmp)
+        os.replace(tmp, cache_path)
+        for old in cache_path.parent.glob(f"{prefix}__*.parquet"):
+            if old != cache_path:
+                old.unlink(missing_ok=True)
+    except Exception:
+        # el cache es best-effort: si el disco es read-only seguimos sin él
+        pass
+
+def _parse_index_file(file_path: Path, sheet_name: str) -> pd.DataFrame:
+    """Parseo Excel (xlsx/xlsb) + limpieza: FECHA datetime, sin duplicados, índices numéricos."""
+    suffix = file_path.suffix.lower()
+
+    if suffix == ".xlsb":
+        df = pd.read_excel(file_path, sheet_name=sheet_name, engine="pyxlsb")
+    else:
+        df = pd.read_excel(file_path, sheet_name=sheet_name)
+
+    if df.shape[1] < 2:
+        raise ValueError(f"[BENCH] Hoja {sheet_name} en {file_path.name} no tiene columnas suficientes.")
+
+    # Primera columna es FECHA (diaria)
+    fecha_col = df.columns[0]
+    df = df.rename(columns={fecha_col: "FECHA"}).copy()
+    if suffix != ".xlsb":
+        # en xlsx las fechas llegan como datetime; números sueltos (p.ej. fila de códigos 1,2,3) no son fechas
+        df = df[~df["FECHA"].map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool))]
+    df["FECHA"] = pd.to_datetime(df["FECHA"], errors="coerce")
+    df = df.dropna(subset=["FECHA"]).sort_values("FECHA")
+    df = df.drop_duplicates(subset=["FECHA"], keep="last")
+
+    # Convertir columnas de índices a numérico
+    for c in df.columns[1:]:
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+
+    # headers como str (Parquet no acepta nombres no-str; COL_NAME del mapa siempre es str)
+    df.columns = [str(c) for c in df.columns]
+    return df.reset_index(drop=True)
+
+def _to_index_date(v):
+    """Celda de FECHA -> np.datetime64 (NaT si no es fecha)."""
+    if isinstance(v, (datetime, date)):
+        return np.datetime64(pd.Timestamp(v).to_datetime64(), "ns")
+    if isinstance(v, str) and v.strip():
+        try:
+            return np.datetime64(pd.Timestamp(v.strip()).to_datetime64(), "ns")
+        except (ValueError, TypeError):
+            pass
+    return np.datetime64("NaT", "ns")
+
+def _to_index_float(v) -> float:
+    """Celda de índice -> float (NaN para 'nd', vacíos, texto)."""
+    if v is None or isinstance(v, bool):
+        return np.nan
+    if isinstance(v, (int, float)):
+        return float(v)
+    try:
+        return float(str(v).strip())
+    except ValueError:
+        return np.nan
+
+# --- xlsx: huella de lo ya ingerido (bytes de <sheetData>) para la ingesta incremental ---
+_XLSX_REL_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+_XLSX_SHEETDATA = re.compile(rb"<(?:\w+:)?sheetData\b[^>]*?(/?)>")
+_XLSX_SHEETDATA_END = re.compile(rb"</(?:\w+:)?sheetData>")
+_XLSX_ROW = re.compile(rb"<(?:\w+:)?row\b([^>]*)>")
+_XLSX_ROW_NUM = re.compile(rb'\br="(\d+)"')
+_INGEST_META_KEY = b"bench_ingest"
+
+def _xml_tag(el) -> str:
+    return el.tag.rsplit("}", 1)[-1]
+
+def _xlsx_sheet_part(zf, sheet_name: str) -> str:
+    """Parte XML de la hoja dentro del zip (workbook.xml + sus relaciones)."""
+    import xml.etree.ElementTree as ET
+    wb = ET.fromstring(zf.read("xl/workbook.xml"))
+    rid = next((el.get(_XLSX_REL_ID) for el in wb.iter() if _xml_tag(el) == "sheet" and el.get("name") == sheet_name), None)
+    for rel in ET.fromstring(zf.read("xl/_rels/workbook.xml.rels")):
+        if rel.get("Id") == rid:
+            target = rel.get("Target", "")
+            return target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+    raise KeyError(f"hoja '{sheet_name}' no encontrada")
+
+def _xlsx_sheet_bounds(data: bytes) -> tuple[int, int]:
+    """(inicio, fin) del contenido de <sheetData> dentro del XML de la hoja."""
+    m = _XLSX_SHEETDATA.search(data)
+    if m is None:
+        raise ValueError("hoja sin <sheetData>")
+    if m.group(1):  # <sheetData/>
+        return m.end(), m.end()
+    end = _XLSX_SHEETDATA_END.search(data, m.end())
+    if end is None:
+        raise ValueError("hoja sin </sheetData>")
+    return m.end(), end.start()
+
+def _xlsx_last_row(data: bytes, start: int, end: int) -> int | None:
+    """Número (atributo r) de la última fila en data[start:end]; 0 si no hay filas, None si no trae r."""
+    last = None
+    for lo in (max(start, end - (1 << 16)), start):
+        for last in _XLSX_ROW.finditer(data, lo, end):
+            pass
+        if last is not None:
+            break
+    if last is None:
+        return 0
+    num = _XLSX_ROW_NUM.search(last.group(1))
+    return int(num.group(1)) if num else None
+
+def _xlsx_ingest_state(file_path: Path, sheet_name: str) -> dict | None:
+    """
+    Huella de lo ya ingerido de una hoja xlsx: largo + sha1 del contenido de <sheetData> y número de
+    la última fila. Solo se hashean bytes (nada se parsea). None si el archivo no es un xlsx legible así.
+    """
+    try:
+        with zipfile.ZipFile(file_path) as zf:
+            part = _xlsx_sheet_part(zf, sheet_name)
+            data = zf.read(part)
+        start, end = _xlsx_sheet_bounds(data)
+        rows = _xlsx_last_row(data, start, end)
+    except Exception:
+        return None
+    if rows is None:
+        return None
+    return {"part": part, "len": end - start, "sha1": hashlib.sha1(data[start:end]).hexdigest(), "rows": rows}
+
+def _xlsx_tail(file_path: Path, sheet_name: str, ingest: dict, columns: list):
+    """
+    Filas agregadas a la hoja después de `ingest`. El contenido previo de <sheetData> debe ser
+    idéntico byte a byte (mismo largo + sha1; cualquier edición de historia o del header lo cambia).
+    Las filas nuevas las lee openpyxl (read_only, iter_rows desde la fila siguiente a la última
+    ingerida) sobre una copia del libro con la hoja recortada a esas filas: no vuelve a parsear la
+    historia, y textos, estilos de fecha y época 1904 se resuelven como en el parseo completo.
+    columns: columnas del cache previo (FECHA + índices), en el orden de las columnas A, B, ...
+    Devuelve (filas nuevas, huella nueva) o None si la historia cambió o no se puede leer así.
+    """
+    import io
+    import openpyxl
+
+    with zipfile.ZipFile(file_path) as zf:
+        part = _xlsx_sheet_part(zf, sheet_name)
+        data = zf.read(part)
+        start, end = _xlsx_sheet_bounds(data)
+        old_end = start + int(ingest["len"])
+        if part != ingest.get("part") or "rows" not in ingest or old_end > end:
+            return None
+        digest = hashlib.sha1(data[start:old_end])
+        if digest.hexdigest() != ingest["sha1"]:
+            return None
+        digest.update(data[old_end:end])
+        last = _xlsx_last_row(data, old_end, end) or int(ingest["rows"])
+        if last < int(ingest["rows"]):
+            return None
+        new_ingest = {"part": part, "len": end - start, "sha1": digest.hexdigest(), "rows": last}
+
+        rows = []
+        if end > old_end:
+            buf = io.BytesIO()
+            with zipfile.ZipFile(buf, "w") as out:
+                for info in zf.infolist():
+                    body = data[:start] + data[old_end:] if info.filename == part else zf.read(info)
+                    out.writestr(zipfile.ZipInfo(info.filename, info.date_time), body)
+            wb = openpyxl.load_workbook(buf, read_only=True, data_only=True)
+            try:
+                rows = list(wb[sheet_name].iter_rows(min_row=int(ingest["rows"]) + 1, values_only=True))
+            finally:
+                wb.close()
+
+    width = len(columns)
+    if any(v is not None for r in rows for v in r[width:]):
+        return None  # celdas a la derecha del header: columna nueva
+    fechas, vals = [], []
+    for r in rows:
+        r = tuple(r) + (None,) * (width - len(r))
+        f = _to_index_date(r[0])
+        if np.isnat(f):
+            continue
+        fechas.append(f)
+        vals.append([_to_index_float(v) for v in r[1:width]])
+    df = pd.DataFrame(np.array(vals, dtype=float).reshape(len(vals), width - 1), columns=columns[1:])
+    df.insert(0, "FECHA", np.array(fechas, dtype="datetime64[ns]"))
+    df = df.sort_values("FECHA", kind="stable").drop_duplicates(subset=["FECHA"], keep="last")
+    return df.reset_index(drop=True), new_ingest
+
+def _append_index_file(file_path: Path, sheet_name: str, prev: pd.DataFrame, ingest: dict | None):
+    """
+    Ingesta incremental (xlsx): el archivo de índices solo crece hacia adelante en FECHA.
+    Con la huella guardada junto al cache previo (_xlsx_ingest_state) se verifica que las filas
+    ya ingeridas no cambiaron y se convierten solo las nuevas; las viejas nunca se parsean.
+    Devuelve (DF completo, huella nueva), o None (=> re-parseo completo) si no hay huella, si
+    cambió la historia o el header, o si llegan filas con FECHA <= la última del cache.
+    """
+    if not ingest:
+        return None
+    try:
+        out = _xlsx_tail(file_path, sheet_name, ingest, list(prev.columns))
+    except Exception:
+        return None
+    if out is None:
+        return None
+    new, new_ingest = out
+    if new.empty:
+        return prev, new_ingest
+    if new["FECHA"].min() <= prev["FECHA"].max():
+        return None
+    new["FECHA"] = new["FECHA"].astype(prev["FECHA"].dtype)  # misma resolución que el parseo completo
+    return pd.concat([prev, new], ignore_index=True), new_ingest
+
+def _update_month_end_tail(file_path: Path, sheet_name: str, prev_path: Path, prev: pd.DataFrame, df: pd.DataFrame):
+    """
+    Tras un append, actualiza la tabla month-end recalculando solo los meses afectados
+    (desde el último mes del cache previo). Sin tabla previa no hace nada: se arma completa al pedirla.
+    """
+    prefix, me_prefix = _index_cache_prefix(file_path, sheet_name), _index_cache_prefix(file_path, sheet_name, kind="ME")
+    prev_me = _load_index_cache(prev_path.with_name(me_prefix + prev_path.name[len(prefix):]))
+    if prev_me is None or list(prev_me.columns) != list(df.columns):
+        return
+
+    cut = pd.Timestamp(prev["FECHA"].max()).normalize() + pd.offsets.MonthEnd(0)
+    fecha_me = df["FECHA"].dt.normalize() + pd.offsets.MonthEnd(0)
+    tail = _month_end_levels(df[fecha_me >= cut])
+    me = pd.concat([prev_me[prev_me["FECHA"] < cut], tail], ignore_index=True)
+    _save_index_cache(_index_cache_path(file_path, sheet_name, kind="ME"), me, me_prefix)
+
+def _read_index_file(file_path: Path, sheet_name: str, usecols: list | None = None):
+    """
+    Lee archivo de índices (xlsx/xlsb) y devuelve DF con:
+      - columna 'FECHA' (datetime)
+      - columnas de índices numéricas (float)
+    Orden: store versionado (si el archivo no cambió desde el build) -> cache Parquet en BENCH_CACHE_DIR
+    (llave: ruta + tamaño + mtime) -> Excel; solo re-parsea Excel si cambió.
+    Si el xlsx cambió pero hay cache de la versión anterior con su huella de ingesta, se parsean
+    solo las filas agregadas (_append_index_file) y se actualiza la cola de la tabla month-end.
+
+    usecols: si se pasa (COL_NAMEs del mapa), devuelve solo FECHA + esas columnas. La proyección
+    aplica a la lectura Parquet: un miss parsea la hoja completa una vez y llena el cache, así las
+    siguientes lecturas (de cualquier subconjunto de columnas) ya no tocan el Excel. El parseo del
+    Excel no escala con # de columnas usadas (openpyxl materializa todas las celdas de cada fila).
+    """
+    file_path = Path(file_path)
+    _ensure_file(file_path, f"bench file {file_path.name}")
+
+    df = _store_table(file_path, sheet_name, usecols=usecols)
+    if df is not None:
+        return df
+
+    cache_path = _index_cache_path(file_path, sheet_name)
+    df = _load_index_cache(cache_path, usecols)
+    if df is not None:
+        return df
+
+    prefix = _index_cache_prefix(file_path, sheet_name)
+    is_xlsx = file_path.suffix.lower() != ".xlsb"
+    df, ingest = None, None
+    if is_xlsx:
+        prev_path = _previous_index_cache(cache_path, prefix)
+        prev = _load_index_cache(prev_path)
+        if prev is not None and not prev.empty:
+            appended = _append_index_file(file_path, sheet_name, prev, _index_ingest_meta(prev_path))
+            if appended is not None:
+                df, ingest = appended
+                _update_month_end_tail(file_path, sheet_name, prev_path, prev, df)
+
+    if df is None:
+        # la huella se toma antes de parsear: si el archivo cambia en medio, el siguiente append
+        # ve filas con FECHA ya ingerida y cae a re-parseo completo
+        ingest = _xlsx_ingest_state(file_path, sheet_name) if is_xlsx else None
+        df = _parse_index_file(file_path, sheet_name)
+    _save_index_cache(cache_path, df, prefix, ingest)
+    if usecols:
+        all_cols = list(df.columns)
+        df = df[["FECHA"] + _match_index_columns(all_cols[1:], usecols)]
+        df.attrs["ALL_COLUMNS"] = all_cols
+    return df
+
+def _month_end_levels(df_idx: pd.DataFrame) -> pd.DataFrame:
+    """
+    Niveles diarios -> último nivel válido de cada mes, por columna.
+    FECHA queda en el cierre de mes calendario.
+    """
+    val_cols = [c for c in df_idx.columns if c != "FECHA"]
+    fecha_me = pd.to_datetime(df_idx["FECHA"]).dt.normalize() + pd.offsets.MonthEnd(0)
+    me = df_idx[val_cols].groupby(fecha_me.rename("FECHA")).last()
+    me = me.dropna(how="all").sort_index().reset_index()
+    me[val_cols] = me[val_cols].astype(float)
+    return me
+
+def _read_index_month_end(file_path: Path, sheet_name: str, usecols: list | None = None):
+    """
+    Tabla de niveles a cierre de mes de (archivo, hoja), guardada junto al cache diario
+    (misma llave ruta + tamaño + mtime). Se construye una vez desde la hoja completa;
+    después cada lectura es un Parquet chico (≈12 filas por año), proyectado a usecols.
+    """
+    file_path = Path(file_path)
+    _ensure_file(file_path, f"bench file {file_path.name}")
+
+    me = _store_table(file_path, sheet_name, kind="ME", usecols=usecols)
+    if me is not None:
+        return me
+
+    cache_path = _index_cache_path(file_path, sheet_name, kind="ME")
+    me = _load_index_cache(cache_path, usecols)
+    if me is not None:
+        return me
+
+    me = _month_end_levels(_read_index_file(file_path, sheet_name))
+    _save_index_cache(cache_path, me, _index_cache_prefix(file_path, sheet_name, kind="ME"))
+    if usecols:
+        all_cols = list(me.columns)
+        me = me[["FECHA"] + _match_index_columns(all_cols[1:], usecols)]
+        me.attrs["ALL_COLUMNS"] = all_cols
+    return me
+
+
+# =========================
+#  STORE VERSIONADO
+# =========================
+# Layout:
+#   BENCH_STORE_DIR/CURRENT                     -> nombre de la versión vigente
+#   BENCH_STORE_DIR/<version>/manifest.json     -> fuentes (ruta relativa a DATA_DIR, tamaño, sha1), tablas, errores
+#   BENCH_STORE_DIR/<version>/<KEY>__<HOJA>.parquet      niveles diarios
+#   BENCH_STORE_DIR/<version>/<KEY>__<HOJA>_ME.parquet   niveles a cierre de mes
+#   BENCH_STORE_DIR/<version>/mapa.parquet               mapa normalizado
+
+_SOURCE_SHA1: dict = {}  # (ruta absoluta, tamaño, mtime_ns) -> sha1: cada versión del archivo se hashea una vez
+
+def _source_key(path: Path) -> str:
+    """Ruta de la fuente relativa a DATA_DIR (la misma en otro checkout o clon); absoluta si está fuera."""
+    p = Path(path).resolve()
+    try:
+        return p.relative_to(DATA_DIR.resolve()).as_posix()
+    except ValueError:
+        return str(p)
+
+def _source_stat(path: Path) -> dict:
+    """Identidad de una fuente: ruta relativa + tamaño + sha1 del contenido (no depende de mtime)."""
+    p = Path(path)
+    stat = p.stat()
+    memo = (str(p.resolve()), stat.st_size, stat.st_mtime_ns)
+    digest = _SOURCE_SHA1.get(memo)
+    if digest is None:
+        h = hashlib.sha1()
+        with open(p, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                h.update(chunk)
+        digest = _SOURCE_SHA1[memo] = h.hexdigest()
+    return {"path": _source_key(p), "size": stat.st_size, "sha1": digest}
+
+def _same_source(a: dict, b: dict) -> bool:
+    return all(a.get(k) == b.get(k) for k in ("path", "size", "sha1"))
+
+def validate_bench_map(df_map: pd.DataFrame, bench_files: dict, headers: dict) -> list:
+    """
+    Valida cada fila del mapa contra los archivos de índices.
+    headers: (FILE_KEY, SHEET_NAME) -> lista de columnas de la hoja, o str con el error al leerla.
+    Devuelve lista de errores (uno por fila con problema; FILA = renglón en Excel).
+    """
+    errors = []
+    for i, r in df_map.reset_index(drop=True).iterrows():
+        file_key = _norm_upper(r["FILE_KEY"])
+        sheet = _norm_str(r["SHEET_NAME"]) or BENCH_SHEET_DEFAULT
+        col = _norm_str(r["COL_NAME"])
+
+        if not file_key:
+            err = "FILE_KEY vacío"
+        elif file_key not in bench_files:
+            err = f"FILE_KEY '{file_key}' no existe en BENCH_FILES"
+        elif isinstance(headers.get((file_key, sheet)), str):
+            err = headers[(file_key, sheet)]
+        elif not col:
+            err = "COL_NAME vacío"
+        elif not _match_index_columns(headers.get((file_key, sheet), [])[1:], [col]):
+            err = f"COL_NAME '{col}' no existe en {file_key} hoja '{sheet}'"
+        elif not r["PESO"] > 0:
+            err = f"PESO inválido ({r['PESO']})"
+        else:
+            continue
+
+        errors.append({
+            "FILA": int(i) + 2,
+            "ALIAS_CDM": r["ALIAS_CDM"], "NOMBRE_CORTO": r["NOMBRE_CORTO"], "PRODUCTO": r["PRODUCTO"],
+            "FILE_KEY": file_key, "SHEET_NAME": sheet, "COL_NAME": col,
+            "ERROR": err,
+        })
+    return errors
+
+def _load_sources(bench_files: dict, map_path: Path):
+    """Lee mapa + todas las hojas que referencia. Devuelve (mapa, {(key, hoja): (diario, month-end)}, headers)."""
+    df_map = load_bench_map(map_path)
+    sheets = dict.fromkeys(
+        (_norm_upper(k), _norm_str(s) or BENCH_SHEET_DEFAULT)
+        for k, s in zip(df_map["FILE_KEY"], df_map["SHEET_NAME"])
+        if _norm_upper(k) in bench_files
+    )
+    tables, headers = {}, {}
+    for file_key, sheet in sheets:
+        path = Path(bench_files[file_key])
+        try:
+            daily = _read_index_file(path, sheet)
+            tables[(file_key, sheet)] = (daily, _read_index_month_end(path, sheet))
+            headers[(file_key, sheet)] = list(daily.columns)
+        except Exception as e:
+            headers[(file_key, sheet)] = f"No se pudo leer {path.name} hoja '{sheet}': {e}"
+    return df_map, tables, headers
+
+def build_store(out_dir: Path | None = None, bench_files: dict | None = None, map_path: Path | None = None,
+                keep: int = 3, strict: bool = False) -> dict:
+    """
+    Arma una versión nueva del store y la publica (CURRENT) con rename atómico.
+    strict=True: si hay errores de validación no publica nada (manifest["published"] = False).
+    """
+    out_dir = Path(out_dir or BENCH_STORE_DIR)
+    bench_files = {k.upper(): Path(v) for k, v in (bench_files or BENCH_FILES).items()}
+    map_path = Path(map_path or BENCH_MAP_FILE)
+
+    df_map, tables, headers = _load_sources(bench_files, map_path)
+    errors = validate_bench_map(df_map, bench_files, headers)
+
+    sources = {"MAPA": _source_stat(map_path)}
+    for file_key, _ in tables:
+        sources[file_key] = _source_stat(bench_files[file_key])
+    digest = hashlib.sha1(json.dumps(sources, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+    version = f"{time.strftime('%Y%m%dT%H%M%S')}_{digest}"
+
+    manifest = {
+        "version": version,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "cache_version": BENCH_CACHE_VERSION,
+        "sources": sources,
+        "map_rows": int(len(df_map)),
+        "map": "mapa.parquet",
+        "tables": [],
+        "errors": errors,
+        "published": False,
+    }
+    if strict and errors:
+        return manifest
+
+    tmp_dir = out_dir / f".{version}.tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    df_map.to_parquet(tmp_dir / "mapa.parquet", index=False)
+    for (file_key, sheet), (daily, me) in tables.items():
+        name = f"{file_key}__{_norm_colname(sheet)}"
+        daily.to_parquet(tmp_dir / f"{name}.parquet", index=False)
+        me.to_parquet(tmp_dir / f"{name}_ME.parquet", index=False)
+        manifest["tables"].append({
+            "file_key": file_key, "sheet": sheet, "source": sources[file_key]["path"],
+            "rows": int(len(daily)), "columns": int(daily.shape[1] - 1),
+            "fecha_min": str(daily["FECHA"].min().date()) if len(daily) else None,
+            "fecha_max": str(daily["FECHA"].max().date()) if len(daily) else None,
+            "daily": f"{name}.parquet", "month_end": f"{name}_ME.parquet",
+        })
+    manifest["published"] = True
+    (tmp_dir / "manifest.json").write_text(json.dumps(manifest, indent=2, ensure_ascii=False, default=str), encoding="utf-8")
+
+    # publicar: carpeta completa -> rename; luego CURRENT (tmp + replace)
+    if (out_dir / version).exists():
+        # mismo segundo y mismas fuentes (sha1): esa versión ya tiene este contenido
+        _remove_dir(tmp_dir)
+    else:
+        os.replace(tmp_dir, out_dir / version)
+    cur_tmp = out_dir / f"CURRENT.{os.getpid()}.tmp"
+    cur_tmp.write_text(version, encoding="utf-8")
+    os.replace(cur_tmp, out_dir / "CURRENT")
+
+    # limpieza: conserva la recién publicada + las `keep - 1` anteriores (nunca borra la vigente)
+    olds = sorted(p for p in out_dir.iterdir() if p.is_dir() and not p.name.startswith(".") and p.name != version)
+    for old in olds[:len(olds) - (keep - 1)] if keep > 0 else []:
+        _remove_dir(old)
+    return manifest
+
+def _remove_dir(path: Path):
+    for f in path.iterdir():
+        f.unlink(missing_ok=True)
+    path.rmdir()
+
+_STORE_LOCK = threading.Lock()
+_STORE = {"key": None, "manifest": None, "tables": {}, "map": None}  # tables: (ruta fuente, hoja, kind) -> pyarrow.Table
+
+def open_store(store_dir: Path | None = None) -> dict | None:
+    """
+    Abre la versión vigente del store (una vez por proceso; se reabre si cambia CURRENT).
+    Las tablas y el mapa se mapean en memoria (pyarrow memory_map) al abrir. None si no hay store.
+    """
+    store_dir = Path(store_dir or BENCH_STORE_DIR)
+    try:
+        version = (store_dir / "CURRENT").read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    key = (str(store_dir), version)
+    if _STORE["key"] == key:
+        return _STORE["manifest"]
+
+    with _STORE_LOCK:
+        if _STORE["key"] == key:
+            return _STORE["manifest"]
+        try:
+            import pyarrow.parquet as pq
+            vdir = store_dir / version
+            manifest = json.loads((vdir / "manifest.json").read_text(encoding="utf-8"))
+            tables = {}
+            for t in manifest["tables"]:
+                for kind, fname in (("", t["daily"]), ("ME", t["month_end"])):
+                    tables[(t["source"], t["sheet"], kind)] = pq.read_table(vdir / fname, memory_map=True)
+            bench_map = pq.read_table(vdir / manifest.get("map", "mapa.parquet"), memory_map=True)
+        except Exception:
+            # store incompleto/corrupto: la app sigue con el cache Parquet
+            return None
+        _STORE.update(manifest=manifest, tables=tables, map=bench_map, key=key)
+        return manifest
+
+def store_bench_map(map_path: Path | None = None) -> pd.DataFrame | None:
+    """
+    Mapa ya normalizado (load_bench_map) desde el store vigente, sin abrir el Excel.
+    None si no hay store o si Mapa_Benchmarks.xlsx cambió desde el build (se cae a load_bench_map).
+    """
+    manifest = open_store()
+    if manifest is None or _STORE["map"] is None or "MAPA" not in manifest["sources"]:
+        return None
+    try:
+        src = _source_stat(Path(map_path or BENCH_MAP_FILE))
+    except OSError:
+        return None
+    if not _same_source(manifest["sources"]["MAPA"], src):
+        return None
+    return _STORE["map"].to_pandas()
+
+def _store_table(file_path: Path, sheet_name: str, kind: str = "", usecols: list | None = None) -> pd.DataFrame | None:
+    """
+    Hoja desde el store vigente, solo si el archivo fuente no cambió desde el build
+    (misma ruta relativa, tamaño y sha1); si cambió, None y se cae al cache/Excel.
+    """
+    manifest = open_store()
+    if manifest is None:
+        return None
+    try:
+        src = _source_stat(file_path)
+    except OSError:
+        return None
+    if not any(_same_source(s, src) for s in manifest["sources"].values()):
+        return None
+
+    table = _STORE["tables"].get((src["path"], sheet_name, kind))
+    if table is None:
+        return None
+    if not usecols:
+        return table.to_pandas()
+    all_cols = table.column_names
+    df = table.select(["FECHA"] + _match_index_columns(all_cols, usecols)).to_pandas()
+    df.attrs["ALL_COLUMNS"] = all_cols
+    return df
+
+# =========================
+#  CLI
+# =========================
+def main(argv=None) -> int:
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Store de benchmarks (índices + Mapa_Benchmarks).")
+    ap.add_argument("cmd", choices=["build", "validate"])
+    ap.add_argument("--out", default=None, help=f"carpeta del store (default: {BENCH_STORE_DIR})")
+    ap.add_argument("--map", default=None, help=f"Mapa_Benchmarks.xlsx (default: {BENCH_MAP_FILE})")
+    ap.add_argument("--keep", type=int, default=3, help="versiones a conservar")
+    ap.add_argument("--strict", action="store_true", help="no publicar si hay errores de validación")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "validate":
+        bench_files = {k.upper(): Path(v) for k, v in BENCH_FILES.items()}
+        df_map, _, headers = _load_sources(bench_files, Path(args.map or BENCH_MAP_FILE))
+        errors = validate_bench_map(df_map, bench_files, headers)
+        manifest = {"map_rows": int(len(df_map)), "errors": errors, "published": False}
+    else:
+        manifest = build_store(args.out, map_path=args.map, keep=args.keep, strict=args.strict)
+
+    for e in manifest["errors"]:
+        print(f"[fila {e['FILA']}] {e['ALIAS_CDM']} / {e['NOMBRE_CORTO']} / {e['PRODUCTO']}: {e['ERROR']}", file=sys.stderr)
+    print(f"{manifest['map_rows']} filas en el mapa, {len(manifest['errors'])} con error.")
+    if args.cmd == "build":
+        if manifest["published"]:
+            print(f"Store {manifest['version']}: {len(manifest['tables'])} hojas -> {Path(args.out or BENCH_STORE_DIR)}")
+        else:
+            print("Store NO publicado (--strict con errores).")
+            return 1
+    return 1 if (args.strict and manifest["errors"]) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,8 @@ import numpy as np
 import pandas as pd
 import streamlit as st
 import oracledb
+import ora_async
+import sql_replay
 import plotly.graph_objects as go
 
 st.set_page_config(
@@ -133,6 +135,13 @@ PORT = int(st.secrets.get("ORACLE_PORT", os.getenv("ORACLE_PORT", 1521)))
 SID  = st.secrets.get("ORACLE_SID",  os.getenv("ORACLE_SID"))
 USER = st.secrets.get("ORACLE_USER", os.getenv("ORACLE_USER"))
 PWD  = st.secrets.get("ORACLE_PWD",  os.getenv("ORACLE_PWD"))
+# Fetch columnar (Arrow, fetch_df_all) con los mismos dtypes que pd.read_sql; 0 = pd.read_sql
+ORA_FETCH_ARROW = str(st.secrets.get("ORACLE_FETCH_ARROW", os.getenv("ORACLE_FETCH_ARROW", "1"))).strip().lower() in ("1", "true", "yes")
+sql_replay.configure(
+    mode=st.secrets.get("SQL_BACKEND", os.getenv("SQL_BACKEND")),
+    replay_dir=st.secrets.get("SQL_REPLAY_DIR", os.getenv("SQL_REPLAY_DIR")),
+)
+ORA_ASYNC = str(st.secrets.get("ORACLE_ASYNC", os.getenv("ORACLE_ASYNC", "0"))).strip().lower() in ("1", "true", "yes")
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
 def normalize_text(x):
@@ -174,6 +183,22 @@ def get_pool():
     dsn = oracledb.makedsn(HOST, PORT, sid=SID)
     return oracledb.create_pool(user=USER, password=PWD, dsn=dsn, min=1, max=4)
 
+@st.cache_resource
+def get_async_db() -> ora_async.AsyncOracle:
+    dsn = oracledb.makedsn(HOST, PORT, sid=SID)
+    return ora_async.AsyncOracle(user=USER, password=PWD, dsn=dsn, min=1, max=4, arrow=ORA_FETCH_ARROW)
+
+def run_sql(sql: str, params: dict | None = None) -> pd.DataFrame:
+    return sql_replay.through("oracle", sql, params, lambda: _run_sql_live(sql, params))
+
+def _run_sql_live(sql: str, params: dict | None = None) -> pd.DataFrame:
+    if ORA_ASYNC:
+        return get_async_db().read_sql(sql, params)
+    with get_pool().acquire() as conn:
+        if ORA_FETCH_ARROW:
+            return ora_async.read_sql_arrow(conn, sql, params, arraysize=5000)
+        return pd.read_sql(sql, conn, params=params or {})
+
 # ── Carga principal ───────────────────────────────────────────────────────────
 @st.cache_data(ttl=3600, show_spinner="Cargando datos…")
 def load_base_data() -> pd.DataFrame:
@@ -207,8 +232,7 @@ def load_base_data() -> pd.DataFrame:
         "        = REPLACE(REPLACE(UPPER(TRIM(cben.CURP)),' ',''),'-','')"
         " LEFT JOIN POS_ULT pos ON b.ID_CLIENTE = pos.ID_CLIENTE AND pos.RN = 1"
     )
-    with get_pool().acquire() as conn:
-        return pd.read_sql(sql, conn)
+    return run_sql(sql)
 
 # ── Historial bajo demanda ────────────────────────────────────────────────────
 @st.cache_data(ttl=3600, show_spinner="Cargando historial…")
@@ -223,8 +247,7 @@ def load_history(id_cliente: str) -> pd.DataFrame:
         " GROUP BY ID_CLIENTE, TRUNC(REGISTRO_CONTROL,'MM')"
         " ORDER BY MES"
     )
-    with get_pool().acquire() as conn:
-        return pd.read_sql(sql, conn, params={"id": id_cliente})
+    return run_sql(sql, {"id": id_cliente})
 
 # ── Modelo base ───────────────────────────────────────────────────────────────
 @st.cache_data(show_spinner=False)
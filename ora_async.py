@@ -0,0 +1,196 @@
+"""
+Acceso a Oracle con la API asíncrona de python-oracledb (modo thin), sin dependencia de Streamlit.
+
+Un solo event loop (en un hilo daemon) y un pool async atienden las consultas de todas las
+sesiones: cada consulta es una corrutina, no un hilo bloqueado en el socket. Para la capa
+Streamlit hay envolturas síncronas con la misma firma que run_sql / pd.read_sql:
+
+    db = AsyncOracle(user, password, dsn, min=1, max=8)
+    df = db.read_sql("SELECT ... WHERE A = :a", {"a": 1})
+    dfs = db.read_sql_many({"snap": (SQL1, p1), "hist": (SQL2, p2)})   # fan-out en el loop
+
+Desde código async se usan directamente fetch_df / fetch_many.
+
+Con arrow=True (default) el resultado se arma columnar con fetch_df_all (oracledb >= 3): los
+tipos salen declarados del cursor y no se crean objetos Python por fila. read_sql_arrow hace lo
+mismo sobre una conexión síncrona del pool.
+
+Listas de ids (IdList) se bindean como UNA colección SQL (SYS.ODCINUMBERLIST) y se consultan con
+TABLE(:x): el texto SQL no depende de cuántos ids lleve (salvo el hint CARDINALITY por orden de
+magnitud que agrega app.build_contrato_filter_sql) y no aplica el límite de 1000 del IN.
+"""
+import asyncio
+import threading
+import time
+import pandas as pd
+import oracledb
+
+
+ID_LIST_TYPE = "SYS.ODCINUMBERLIST"  # VARRAY(32767) OF NUMBER, viene con Oracle (sin DDL)
+
+class IdList(tuple):
+    """Ids para bindear como colección: ... IN (SELECT COLUMN_VALUE FROM TABLE(:x))."""
+
+def _has_id_lists(params: dict | None) -> bool:
+    return bool(params) and any(isinstance(v, IdList) for v in params.values())
+
+def bind_collections(conn, params: dict | None) -> dict:
+    """Convierte los IdList de params a objetos ODCINUMBERLIST de la conexión (síncrona)."""
+    if not _has_id_lists(params):
+        return params or {}
+    typ = conn.gettype(ID_LIST_TYPE)
+    return {k: typ.newobject(list(v)) if isinstance(v, IdList) else v for k, v in params.items()}
+
+async def bind_collections_async(conn, params: dict | None) -> dict:
+    if not _has_id_lists(params):
+        return params or {}
+    typ = await conn.gettype(ID_LIST_TYPE)
+    return {k: typ.newobject(list(v)) if isinstance(v, IdList) else v for k, v in params.items()}
+
+# resolución con la que pd.read_sql deja los datetime de la base: ns antes de pandas 3, us desde 3
+_PD_TS_UNIT = "ns" if int(pd.__version__.split(".")[0]) < 3 else "us"
+
+def arrow_table_to_pandas(tbl) -> pd.DataFrame:
+    """
+    pyarrow.Table -> DataFrame con los dtypes que daría pd.read_sql (coerce_float): decimales como
+    float64, timestamps en la resolución de pandas (_PD_TS_UNIT) y columnas sin ningún valor como
+    object con None. Fechas fuera del rango de ns (p.ej. 9999-12-31) quedan como objetos datetime.
+    """
+    import pyarrow as pa
+    cols, as_object = [], []
+    for field, col in zip(tbl.schema, tbl.columns):
+        typ = field.type
+        if col.null_count == len(col):
+            as_object.append(field.name)
+        elif pa.types.is_decimal(typ):
+            col = col.cast(pa.float64())
+        elif pa.types.is_timestamp(typ) and typ.unit != _PD_TS_UNIT:
+            try:
+                col = col.cast(pa.timestamp(_PD_TS_UNIT, tz=typ.tz))
+            except pa.ArrowInvalid:
+                as_object.append(field.name)
+        cols.append(col)
+    df = pa.Table.from_arrays(cols, names=tbl.column_names).to_pandas()
+    for name in as_object:
+        df[name] = pd.Series(tbl.column(name).to_pylist(), index=df.index, dtype=object)
+    return df
+
+def arrow_to_pandas(odf) -> pd.DataFrame:
+    """OracleDataFrame (fetch_df_all) -> pandas vía Arrow, sin pasar por tuplas."""
+    import pyarrow as pa
+    if hasattr(odf, "__arrow_c_stream__"):
+        tbl = pa.table(odf)
+    else:  # oracledb 3.0
+        tbl = pa.Table.from_arrays(odf.column_arrays(), names=odf.column_names())
+    return arrow_table_to_pandas(tbl)
+
+def read_sql_arrow(conn, sql: str, params: dict | None = None, arraysize: int = 1000) -> pd.DataFrame:
+    """Equivalente columnar de pd.read_sql(sql, conn, params) para conexiones oracledb síncronas."""
+    params = bind_collections(conn, params)
+    if not hasattr(conn, "fetch_df_all"):  # oracledb < 3
+        return pd.read_sql(sql, conn, params=params)
+    return arrow_to_pandas(conn.fetch_df_all(sql, params, arraysize=arraysize))
+
+
+class AsyncOracle:
+    def __init__(self, user: str, password: str, dsn: str, min: int = 1, max: int = 8,
+                 increment: int = 1, wait_timeout_ms: int = 30000, stmtcachesize: int = 50,
+                 arraysize: int = 1000, arrow: bool = True):
+        self._pool_kwargs = dict(
+            user=user, password=password, dsn=dsn,
+            min=min, max=max, increment=increment,
+            getmode=oracledb.POOL_GETMODE_TIMEDWAIT, wait_timeout=wait_timeout_ms,
+            stmtcachesize=stmtcachesize, ping_interval=60,
+        )
+        self.arraysize = arraysize
+        self.arrow = arrow
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._pool = None
+        self._stats = {"queries": 0, "rows": 0, "errors": 0, "in_flight": 0, "busy_s": 0.0}
+
+    # ---------- loop / pool ----------
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or not self._thread.is_alive():
+                loop = asyncio.new_event_loop()
+                t = threading.Thread(target=loop.run_forever, name="ora-async-loop", daemon=True)
+                t.start()
+                self._loop, self._thread, self._pool = loop, t, None
+                # El pool se crea dentro del loop: todas sus conexiones viven en ese hilo
+                asyncio.run_coroutine_threadsafe(self._open_pool(), loop).result()
+            return self._loop
+
+    async def _open_pool(self):
+        self._pool = oracledb.create_pool_async(**self._pool_kwargs)
+
+    def _run(self, coro, timeout: float | None = None):
+        fut = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        try:
+            return fut.result(timeout)
+        except TimeoutError:
+            fut.cancel()
+            raise
+
+    # ---------- async ----------
+    async def fetch_df(self, sql: str, params: dict | None = None) -> pd.DataFrame:
+        """Ejecuta y arma el DataFrame: columnar (Arrow) o igual que pd.read_sql (from_records + coerce_float)."""
+        c = self._stats
+        c["in_flight"] += 1
+        t0 = time.perf_counter()
+        try:
+            async with self._pool.acquire() as conn:
+                params = await bind_collections_async(conn, params)
+                if self.arrow and hasattr(conn, "fetch_df_all"):
+                    df = arrow_to_pandas(await conn.fetch_df_all(sql, params, arraysize=self.arraysize))
+                else:
+                    with conn.cursor() as cur:
+                        cur.arraysize = self.arraysize
+                        cur.prefetchrows = self.arraysize
+                        await cur.execute(sql, params)
+                        cols = [d[0] for d in cur.description]
+                        rows = await cur.fetchall()
+                    df = pd.DataFrame.from_records(rows, columns=cols, coerce_float=True)
+        except Exception:
+            c["errors"] += 1
+            raise
+        finally:
+            c["in_flight"] -= 1
+            c["busy_s"] += time.perf_counter() - t0
+        c["queries"] += 1
+        c["rows"] += len(df)
+        return df
+
+    async def fetch_many(self, queries: dict, return_exceptions: bool = False) -> dict:
+        """
+        {nombre: (sql, params)} -> {nombre: DataFrame}, todas concurrentes en el pool.
+        return_exceptions=True: la consulta que falla trae su excepción en lugar del DataFrame.
+        """
+        names = list(queries)
+        dfs = await asyncio.gather(*(self.fetch_df(*queries[n]) for n in names), return_exceptions=return_exceptions)
+        return dict(zip(names, dfs))
+
+    # ---------- envolturas síncronas (Streamlit) ----------
+    def read_sql(self, sql: str, params: dict | None = None, timeout: float | None = None) -> pd.DataFrame:
+        return self._run(self.fetch_df(sql, params), timeout)
+
+    def read_sql_many(self, queries: dict, timeout: float | None = None, return_exceptions: bool = False) -> dict:
+        return self._run(self.fetch_many(queries, return_exceptions), timeout)
+
+    def stats(self) -> dict:
+        """Contadores del loop (se actualizan solo desde el hilo del loop) + estado del pool."""
+        out = dict(self._stats)
+        if self._pool is not None:
+            out.update(open=self._pool.opened, busy=self._pool.busy, max=self._pool.max)
+        return out
+
+    def close(self):
+        with self._lock:
+            loop, pool = self._loop, self._pool
+            self._loop = self._pool = None
+        if loop is None:
+            return
+        if pool is not None:
+            asyncio.run_coroutine_threadsafe(pool.close(force=True), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
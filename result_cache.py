@@ -0,0 +1,251 @@
+"""
+Cache persistente (Parquet en disco) de resultados de consultas, sin dependencia de Streamlit.
+
+Los datos de un mes ya cerrado no cambian: esas entradas no expiran por TTL y sobreviven reinicios y
+réplicas que compartan el directorio. Un mes cuenta como cerrado CLOSE_GRACE_DAYS días después de
+su fin (las posiciones / tasas del último día se cargan tarde); hasta entonces, igual que el mes
+en curso, sigue un TTL corto (OPEN_MONTH_TTL).
+Se usa debajo de st.cache_data, que sigue siendo el cache en memoria de cada proceso:
+
+    @st.cache_data(ttl=3600, show_spinner=True)
+    @result_cache.persist("aa_hist_5y", last_day=lambda a: a["cutoff_next"] - pd.Timedelta(days=1))
+    def aa_hist_ultimo_5_anios(alias, cutoff_next, contratos_key=None): ...
+
+last_day recibe los argumentos ya ligados ({nombre: valor}) y regresa el último día que cubre la
+consulta; la entrada es "cerrada" si ese mes terminó hace más de CLOSE_GRACE_DAYS días.
+
+La llave incluye un hash del código que arma el SQL (la función decorada + los helpers en deps=) y
+SCHEMA_VERSION (subir cuando cambian las vistas de Oracle sin que cambie el código): un cambio de
+consulta no sirve resultados viejos. Las entradas que ya nadie pide (llaves viejas incluidas) salen
+en la pasada de expulsión: sin uso hace más de MAX_AGE_DAYS o, si el directorio pasa de MAX_BYTES,
+las de uso más antiguo primero.
+"""
+import os, json, time
+import hashlib
+import functools
+import inspect
+import threading
+from datetime import date, datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+RESULT_CACHE_DIR = Path(os.getenv("RESULT_CACHE_DIR", str(Path(__file__).resolve().parent / "data" / ".result_cache")))
+RESULT_CACHE_VERSION = 2   # subir si cambia el formato de los archivos o el criterio de cierre (invalida todo)
+OPEN_MONTH_TTL = 600       # segundos de vida de las entradas del mes en curso
+CLOSE_GRACE_DAYS = 5       # días después del fin de mes en que sus entradas todavía expiran
+NAMESPACE = ""             # separa ambientes que comparten directorio (p.ej. host/SID de Oracle)
+SCHEMA_VERSION = ""        # subir si cambian las vistas/columnas de origen (invalida todo)
+MAX_BYTES = 2 << 30        # tope del directorio; 0 = sin tope
+MAX_AGE_DAYS = 90          # días sin uso antes de expulsar una entrada (cerrada o no); 0 = sin tope
+EVICT_INTERVAL = 600       # segundos mínimos entre pasadas de expulsión automáticas (por proceso)
+ENABLED = True
+
+STATS = {"hits": 0, "misses": 0, "writes": 0, "errors": 0, "evicted": 0}
+HOOK = None  # opcional: HOOK(name, "hit" | "miss", t_inicio, segundos) para instrumentación
+_stats_lock = threading.Lock()
+_evict_lock = threading.Lock()
+_last_evict = 0.0
+
+def configure(cache_dir: Path | str | None = None, open_ttl: int | None = None,
+              namespace: str | None = None, enabled: bool | None = None, close_grace_days: int | None = None,
+              schema_version: str | None = None, max_bytes: int | None = None, max_age_days: float | None = None):
+    """
+    Permite a la app sobreescribir ruta / TTL / namespace / gracia de cierre / versión de esquema /
+    topes de tamaño y edad (p.ej. desde st.secrets).
+    """
+    global RESULT_CACHE_DIR, OPEN_MONTH_TTL, NAMESPACE, ENABLED, CLOSE_GRACE_DAYS
+    global SCHEMA_VERSION, MAX_BYTES, MAX_AGE_DAYS
+    if cache_dir:
+        RESULT_CACHE_DIR = Path(cache_dir)
+    if open_ttl is not None:
+        OPEN_MONTH_TTL = int(open_ttl)
+    if close_grace_days is not None:
+        CLOSE_GRACE_DAYS = int(close_grace_days)
+    if namespace is not None:
+        NAMESPACE = str(namespace)
+    if enabled is not None:
+        ENABLED = bool(enabled)
+    if schema_version is not None:
+        SCHEMA_VERSION = str(schema_version)
+    if max_bytes is not None:
+        MAX_BYTES = int(max_bytes)
+    if max_age_days is not None:
+        MAX_AGE_DAYS = float(max_age_days)
+
+def _count(k: str):
+    with _stats_lock:
+        STATS[k] += 1
+
+def is_closed(last_day, today: date | None = None) -> bool:
+    """True si el mes de last_day terminó hace más de CLOSE_GRACE_DAYS días (0 = desde el día 1 del siguiente)."""
+    month_end = pd.Timestamp(last_day).to_period("M").end_time.normalize()
+    return pd.Timestamp(today or date.today()).normalize() > month_end + pd.Timedelta(days=CLOSE_GRACE_DAYS)
+
+def _norm_param(v):
+    if isinstance(v, (pd.Timestamp, datetime, date)):
+        return pd.Timestamp(v).isoformat()
+    if isinstance(v, (list, tuple, pd.Index, np.ndarray)):
+        return [_norm_param(x) for x in v]
+    if isinstance(v, np.generic):
+        return v.item()
+    return v
+
+def _code_digest(fns) -> str:
+    """Hash del código fuente de las funciones que arman el SQL (bytecode + constantes si no hay fuente)."""
+    h = hashlib.sha1()
+    for fn in fns:
+        fn = inspect.unwrap(fn)
+        try:
+            h.update(inspect.getsource(fn).encode("utf-8"))
+        except (OSError, TypeError):
+            code = fn.__code__
+            h.update(code.co_code + repr(code.co_consts).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def _entry_key(name: str, params: dict, code: str = "") -> str:
+    ident = json.dumps([RESULT_CACHE_VERSION, NAMESPACE, SCHEMA_VERSION, name, code,
+                        {k: _norm_param(v) for k, v in params.items()}],
+                       sort_keys=True, default=str)
+    return hashlib.sha1(ident.encode("utf-8")).hexdigest()[:20]
+
+def _load(meta_path: Path):
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not meta.get("closed") and time.time() - float(meta.get("written", 0)) > OPEN_MONTH_TTL:
+        return None
+    try:
+        parts = [pd.read_parquet(meta_path.with_name(f"{meta_path.stem}.{i}.parquet")) for i in range(meta["parts"])]
+    except Exception:
+        return None
+    try:
+        os.utime(meta_path)  # mtime del meta = último uso (orden de expulsión)
+    except OSError:
+        pass
+    return tuple(parts) if meta.get("tuple") else parts[0]
+
+def _save(meta_path: Path, result, closed: bool, name: str):
+    """Escritura best-effort: partes Parquet primero y el meta (tmp + replace) al final = entrada válida."""
+    parts = list(result) if isinstance(result, tuple) else [result]
+    if not parts or not all(isinstance(p, pd.DataFrame) for p in parts):
+        return
+    try:
+        meta_path.parent.mkdir(parents=True, exist_ok=True)
+        for i, df in enumerate(parts):
+            out = meta_path.with_name(f"{meta_path.stem}.{i}.parquet")
+            tmp = out.with_name(f"{out.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            df.to_parquet(tmp)
+            os.replace(tmp, out)
+        meta = {"name": name, "parts": len(parts), "tuple": isinstance(result, tuple),
+                "closed": bool(closed), "written": time.time()}
+        tmp = meta_path.with_name(f"{meta_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, meta_path)
+        _count("writes")
+    except Exception:
+        # tipos que Parquet no representa o disco read-only: se sigue sin cache
+        _count("errors")
+
+def evict(now: float | None = None) -> int:
+    """
+    Pasada de expulsión: quita las entradas sin uso hace más de MAX_AGE_DAYS y, si el directorio
+    pasa de MAX_BYTES, las de uso más antiguo hasta quedar debajo. También borra temporales y partes
+    huérfanas (escrituras interrumpidas) de más de una hora. Regresa cuántas entradas se quitaron.
+    """
+    global _last_evict
+    if not RESULT_CACHE_DIR.exists():
+        return 0
+    now = time.time() if now is None else now
+    _last_evict = now
+    entries, total = [], 0
+    for meta_path in RESULT_CACHE_DIR.glob("*/*.json"):
+        try:
+            parts = list(meta_path.parent.glob(f"{meta_path.stem}.*.parquet"))
+            used = meta_path.stat().st_mtime
+            size = meta_path.stat().st_size + sum(p.stat().st_size for p in parts)
+        except OSError:
+            continue
+        entries.append((used, size, meta_path, parts))
+        total += size
+    entries.sort(key=lambda e: e[0])
+    n = 0
+    for used, size, meta_path, parts in entries:
+        too_old = MAX_AGE_DAYS > 0 and now - used > MAX_AGE_DAYS * 86400
+        too_big = MAX_BYTES > 0 and total > MAX_BYTES
+        if not (too_old or too_big):
+            break
+        # el meta primero: la entrada deja de ser válida antes de quitar sus partes
+        for p in [meta_path, *parts]:
+            p.unlink(missing_ok=True)
+        total -= size
+        n += 1
+    for p in [*RESULT_CACHE_DIR.glob("*/*.tmp"), *RESULT_CACHE_DIR.glob("*/*.parquet")]:
+        try:
+            stale = now - p.stat().st_mtime > 3600
+        except OSError:
+            continue
+        if stale and (p.suffix == ".tmp" or not p.with_name(f"{p.name.split('.', 1)[0]}.json").exists()):
+            p.unlink(missing_ok=True)
+    if n:
+        with _stats_lock:
+            STATS["evicted"] += n
+    return n
+
+def _maybe_evict():
+    """Pasada de expulsión tras una escritura, a lo más una cada EVICT_INTERVAL s y sin bloquear."""
+    if time.time() - _last_evict < EVICT_INTERVAL or not _evict_lock.acquire(blocking=False):
+        return
+    try:
+        evict()
+    except Exception:
+        _count("errors")
+    finally:
+        _evict_lock.release()
+
+def persist(name: str, last_day, deps: tuple = ()):
+    """
+    Decorador: cache en disco de un resultado DataFrame (o tupla de DataFrames).
+    deps: helpers que también arman el SQL (filtros, rangos); su código entra en la llave.
+    """
+    def deco(fn):
+        sig = inspect.signature(fn)
+        code = _code_digest((fn, *deps))
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = dict(bound.arguments)
+            meta_path = RESULT_CACHE_DIR / name / f"{_entry_key(name, params, code)}.json"
+            t0 = time.perf_counter()
+            hit = _load(meta_path)
+            if hit is not None:
+                _count("hits")
+                if HOOK:
+                    HOOK(name, "hit", t0, time.perf_counter() - t0)
+                return hit
+            _count("misses")
+            result = fn(*args, **kwargs)
+            _save(meta_path, result, is_closed(last_day(params)), name)
+            _maybe_evict()
+            if HOOK:
+                HOOK(name, "miss", t0, time.perf_counter() - t0)
+            return result
+        return wrapper
+    return deco
+
+def clear(name: str | None = None) -> int:
+    """Borra entradas (todas o las de una consulta); regresa cuántos archivos se quitaron."""
+    root = RESULT_CACHE_DIR / name if name else RESULT_CACHE_DIR
+    if not root.exists():
+        return 0
+    n = 0
+    for p in root.rglob("*"):
+        if p.is_file() and p.suffix in (".json", ".parquet", ".tmp"):
+            p.unlink(missing_ok=True)
+            n += 1
+    return n
@@ -0,0 +1,460 @@
+"""
+Backend intercambiable para las consultas de app.py y beneficiarios_app_9.py, sin dependencia de Streamlit.
+
+    SQL_BACKEND=live     (default) consulta Oracle / Postgres
+    SQL_BACKEND=record   consulta en vivo y guarda cada resultado en SQL_REPLAY_DIR
+    SQL_BACKEND=replay   sirve los resultados grabados; no abre conexiones ni pide credenciales
+
+La llave es (origen, SQL normalizado en espacios, params); un faltante en replay es un error con el
+SQL para grabarlo. Con una grabación se puede medir un reporte completo sin acceso a producción:
+
+    SQL_BACKEND=record streamlit run app.py                  # navegar el reporte una vez
+    python sql_replay.py ls                                  # qué se grabó
+    python sql_replay.py bench app.py --runs 5               # latencia / memoria en replay (AppTest)
+    python sql_replay.py bench beneficiarios_app_9.py
+    python sql_replay.py lint                                # filtros de fecha no sargables (offline + grabación)
+"""
+import os, sys, json, time
+import functools
+import hashlib
+import re
+import threading
+import types
+from datetime import date, datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+APP_DIR = Path(__file__).resolve().parent
+MODES = ("live", "record", "replay")
+MODE = os.getenv("SQL_BACKEND", "live").strip().lower()
+SQL_REPLAY_DIR = Path(os.getenv("SQL_REPLAY_DIR", str(APP_DIR / "data" / "sql_replay")))
+
+_lock = threading.Lock()
+STATS = {"served": 0, "recorded": 0}
+
+# Columnas de fecha / periodo que se filtran por rango: envolverlas en una función dentro de WHERE / ON
+# (TRUNC(col) = ..., ADD_MONTHS(col, n) >= ..., TO_DATE(ANIO || ...)) obliga a leer la vista completa
+# en vez de usar el índice. Cualquier llamada cuenta como función salvo estas palabras de SQL.
+DATE_FILTER_COLS = ("REGISTRO_CONTROL", "FECHA_ESTADISTICA", "FECHA", "ANIO", "MES")
+_NOT_FUNCS = {"IN", "EXISTS", "AND", "OR", "NOT", "ANY", "ALL", "SOME", "TABLE", "VALUES", "WHEN", "THEN",
+              "ELSE", "CASE", "BETWEEN", "LIKE", "IS", "ON", "WHERE", "AS", "SELECT", "USING"}
+_COL_REF = rf"(?<![:\w.])(?:\w+\.)?(?:{'|'.join(DATE_FILTER_COLS)})\b"
+_PRED_START = re.compile(r"\b(?:WHERE|ON)\b", re.I)
+_PRED_END = re.compile(r"\b(?:WHERE|ON|GROUP\s+BY|ORDER\s+BY|SELECT|FROM|JOIN|UNION|MINUS|INTERSECT|HAVING|CONNECT\s+BY)\b", re.I)
+_SUBQUERY = re.compile(r"\(\s*(?:SELECT|WITH)\b", re.I)
+_CALL = re.compile(r"(?<![\w.:$#])([A-Za-z_][\w$#]*)\s*\(")
+_CONCAT_COL = re.compile(rf"{_COL_REF}\s*\|\||\|\|\s*{_COL_REF}", re.I)
+
+# Constructores de SQL de app.py: `lint` y tests/test_sql_lint.py los corren con argumentos de ejemplo y
+# un run_sql que solo captura el texto (sin Oracle ni grabación); app_namespace carga lo que usan.
+LINT_APP = APP_DIR / "app.py"
+_CUT = pd.Timestamp("2024-07-01")
+_CTS = (101, 102)
+LINT_CALLS = (
+    ("get_contratos_por_alias", ("UNIB",)),
+    ("get_num_contratos", ("UNIB",)),
+    ("get_nombre_cliente", ("UNIB",)),
+    ("schema_catalog", ()),
+    ("_col_type", ("SIAPII", "V_FUERA_DEL_CATALOGO", "FECHA")),
+    ("build_query_base_unfiltered", ("UNIB", "2024-06-28", _CTS)),
+    ("aa_hist_ultimo_5_anios", ("UNIB", _CUT, _CTS)),
+    ("rend_bruto_contrato_hist_12m", ("UNIB", 2024, 6, _CTS)),
+    ("rend_bruto_producto_hist_12m", ("UNIB", 2024, 6, _CTS)),
+    ("rend_bruto_contrato_hist_n_years", ("UNIB", 2024, 6, 5, _CTS)),
+    ("rend_bruto_producto_hist_n_years", ("UNIB", 2024, 6, 5, _CTS)),
+    ("rend_bruto_contrato_y_producto", ("UNIB", 2024, 6, _CTS)),
+    ("query_snapshot_deuda", ("UNIB", pd.Timestamp("2024-06-01"), _CUT, _CTS)),
+    ("query_snapshot_deuda_multi", ("UNIB", pd.Timestamp("2023-07-01"), _CUT, _CTS)),
+    ("rv_snapshot_por_producto", ("UNIB", pd.Timestamp("2024-06-01"), _CUT, _CTS)),
+    ("hist_trimestral_papel_instrumento", ("UNIB", 1, _CUT, _CTS)),
+    ("rv_emisora_por_mes", ("UNIB", pd.Timestamp("2024-06-30"), 12, _CTS)),
+    ("deuda_duracion_historico", ("UNIB", 0.035, pd.Timestamp("2024-06-30"), _CTS)),
+    ("tasas_ref_series", ()),
+    ("dim_emisoras", ()),
+    ("dim_productos", ()),
+)
+
+class ReplayMiss(KeyError):
+    """La consulta no está en la grabación."""
+
+def configure(mode: str | None = None, replay_dir: Path | str | None = None):
+    """Permite a la app sobreescribir modo / carpeta (p.ej. desde st.secrets)."""
+    global MODE, SQL_REPLAY_DIR
+    if mode:
+        mode = str(mode).strip().lower()
+        if mode not in MODES:
+            raise ValueError(f"SQL_BACKEND inválido: {mode!r} (usar {', '.join(MODES)})")
+        MODE = mode
+    if replay_dir:
+        SQL_REPLAY_DIR = Path(replay_dir)
+
+def is_replay() -> bool:
+    return MODE == "replay"
+
+def _norm_sql(sql: str) -> str:
+    return re.sub(r"\s+", " ", sql).strip()
+
+def _norm_param(v):
+    if isinstance(v, (pd.Timestamp, datetime, date)):
+        return pd.Timestamp(v).isoformat()
+    if isinstance(v, (list, tuple, pd.Index, np.ndarray)):  # incluye ora_async.IdList
+        return [_norm_param(x) for x in v]
+    if isinstance(v, np.generic):
+        return v.item()
+    return v
+
+def query_key(source: str, sql: str, params: dict | None) -> str:
+    ident = json.dumps([source, _norm_sql(sql), {k: _norm_param(v) for k, v in (params or {}).items()}],
+                       sort_keys=True, default=str)
+    return hashlib.sha1(ident.encode("utf-8")).hexdigest()[:24]
+
+def _paths(source: str, key: str) -> tuple[Path, Path, Path]:
+    base = SQL_REPLAY_DIR / source / key
+    return base.with_suffix(".json"), base.with_suffix(".parquet"), base.with_suffix(".pkl")
+
+def load(source: str, sql: str, params: dict | None) -> pd.DataFrame:
+    key = query_key(source, sql, params)
+    _, pq_path, pkl_path = _paths(source, key)
+    if pq_path.exists():
+        df = pd.read_parquet(pq_path)
+    elif pkl_path.exists():
+        df = pd.read_pickle(pkl_path)
+    else:
+        raise ReplayMiss(f"[{source}] sin grabación ({key}): {_norm_sql(sql)[:200]}")
+    with _lock:
+        STATS["served"] += 1
+    return df
+
+def save(source: str, sql: str, params: dict | None, df: pd.DataFrame):
+    """Parquet si los tipos lo permiten; si no (Decimal mezclado, objetos), pickle para no perder fidelidad."""
+    key = query_key(source, sql, params)
+    meta_path, pq_path, pkl_path = _paths(source, key)
+    meta_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = pq_path.with_name(f"{pq_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        df.to_parquet(tmp)
+        os.replace(tmp, pq_path)
+    except Exception:
+        tmp.unlink(missing_ok=True)
+        df.to_pickle(pkl_path)
+    meta = {"source": source, "sql": _norm_sql(sql), "params": {k: _norm_param(v) for k, v in (params or {}).items()},
+            "rows": int(len(df)), "recorded": datetime.now().isoformat(timespec="seconds")}
+    meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=1, default=str), encoding="utf-8")
+    with _lock:
+        STATS["recorded"] += 1
+    hits = non_sargable(sql)
+    if hits:
+        print(f"[sql_replay] filtro de fecha no sargable en {key}: {', '.join(hits)}", file=sys.stderr)
+
+def _close_paren(text: str, i: int) -> int:
+    """Posición del ')' que cierra el '(' de text[i] (len(text) si no cierra)."""
+    depth = 0
+    for j in range(i, len(text)):
+        if text[j] == "(":
+            depth += 1
+        elif text[j] == ")":
+            depth -= 1
+            if depth == 0:
+                return j
+    return len(text)
+
+def _predicate_end(mask: str, i: int) -> int:
+    """
+    Fin del predicado que empieza en mask[i]: la siguiente cláusula al mismo nivel de paréntesis o el ')'
+    que cierra el nivel. Las subconsultas (IN (SELECT ...), EXISTS (...)) se saltan completas: su propio
+    WHERE se revisa aparte y lo que viene después (AND ...) sigue siendo parte de este predicado.
+    """
+    while i < len(mask):
+        ch = mask[i]
+        if ch == "(":
+            i = _close_paren(mask, i) + 1
+            continue
+        if ch == ")":
+            return i
+        if ch.isalpha() and (i == 0 or not (mask[i - 1].isalnum() or mask[i - 1] in "_.:$#")):
+            if _PRED_END.match(mask, i):
+                return i
+        i += 1
+    return i
+
+def _sql_mask(sql: str) -> tuple[str, str]:
+    """(SQL sin comentarios y normalizado, el mismo con el contenido de los literales en blanco: mismas posiciones)."""
+    sql = re.sub(r"/\*.*?\*/|--[^\n]*", " ", sql, flags=re.S)
+    sql = _norm_sql(sql)
+    mask = re.sub(r"'(?:[^']|'')*'", lambda m: "'" + " " * (len(m.group(0)) - 2) + "'", sql)
+    return sql, mask
+
+def non_sargable(sql: str) -> list[str]:
+    """
+    Predicados (WHERE / ON, con sus AND / OR) que aplican una función o una concatenación a una columna
+    de DATE_FILTER_COLS. Devuelve los fragmentos culpables (la llamada más externa).
+    """
+    sql, mask = _sql_mask(sql)
+    found = []
+    for m in _PRED_START.finditer(mask):
+        start, end = m.end(), _predicate_end(mask, m.end())
+        # dentro del predicado, las subconsultas no cuentan (su WHERE ya es otro predicado)
+        region = list(mask[start:end])
+        for sub in _SUBQUERY.finditer(mask, start, end):
+            close = min(_close_paren(mask, sub.start()), end)
+            region[sub.start() - start + 1: close - start] = " " * (close - sub.start() - 1)
+        region = "".join(region)
+        spans = []
+        for call in _CALL.finditer(region):
+            if (spans and call.start() < spans[-1][1]) or call.group(1).upper() in _NOT_FUNCS:
+                continue
+            close = _close_paren(region, call.end() - 1)
+            if re.search(_COL_REF, region[call.end(): close], re.I):
+                spans.append((call.start(), close + 1))
+        spans += [(x.start(), x.end()) for x in _CONCAT_COL.finditer(region)
+                  if not any(a <= x.start() < b for a, b in spans)]
+        found += [sql[start + a: start + b] for a, b in spans]
+    return found
+
+@functools.lru_cache(maxsize=4)
+def _app_tree(app_path: str, mtime_ns: int):
+    import ast
+    return ast.parse(Path(app_path).read_text(encoding="utf-8"))
+
+def _names(node, ctx) -> set:
+    import ast
+    out = {n.id for n in ast.walk(node) if isinstance(n, ast.Name) and isinstance(n.ctx, ctx)}
+    if ctx is ast.Store:
+        out |= {a.arg for a in ast.walk(node) if isinstance(a, ast.arg)}
+    return out
+
+def app_namespace(names, ns: dict | None = None, app_path: Path | str = LINT_APP) -> dict:
+    """
+    Namespace con las definiciones `names` de app.py y lo que usan (funciones, clases y constantes de
+    nivel módulo, transitivo), sin decoradores ni anotaciones y sin correr el script de Streamlit.
+    Lo que venga en ns (p.ej. un run_sql falso o los TTL que salen de st.secrets) tiene prioridad.
+    Los imports de app.py que no se pueden importar aquí (streamlit, oracledb, ...) se omiten, y con
+    ellos las constantes que dependen de ellos: si una función los usa, van en ns.
+    """
+    import ast
+    import builtins
+    app_path = Path(app_path)
+    tree = _app_tree(str(app_path), app_path.stat().st_mtime_ns)
+    ns = dict(ns or {})
+    ns.setdefault("__name__", "app")
+
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            bound = [(a.asname or a.name).split(".")[0] for a in node.names]
+            if all(b in ns for b in bound):
+                continue
+            scratch = {}
+            try:
+                exec(compile(ast.Module(body=[node], type_ignores=[]), str(app_path), "exec"), scratch)
+            except ImportError:
+                continue
+            ns.update({b: scratch[b] for b in bound if b not in ns})
+
+    defs, consts = {}, {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            defs[node.name] = node
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            if len(targets) == 1 and isinstance(targets[0], ast.Name) and node.value is not None:
+                consts.setdefault(targets[0].id, []).append(node)
+
+    known = set(ns) | set(dir(builtins))
+    ok_const: dict = {}
+
+    def const_ok(name: str, seen=()) -> bool:
+        # constante = solo literales, módulos y otras constantes (nada que llame funciones de la app)
+        if name not in ok_const:
+            free = set().union(*(_names(n.value, ast.Load) - _names(n.value, ast.Store) for n in consts[name]))
+            free.discard(name)
+            ok_const[name] = all(
+                f in known or (f in consts and f not in seen and const_ok(f, (*seen, name))) for f in free
+            )
+        return ok_const[name]
+
+    chosen, todo = set(), list(names)
+    while todo:
+        name = todo.pop()
+        if name in chosen or name in ns:
+            continue
+        if name in defs:
+            chosen.add(name)
+            todo += _names(defs[name], ast.Load)
+        elif name in consts and const_ok(name):
+            chosen.add(name)
+            todo += set().union(*(_names(n.value, ast.Load) for n in consts[name]))
+
+    for node in tree.body:
+        if getattr(node, "name", None) in chosen and node.name in defs and defs[node.name] is node:
+            node = _strip_def(node)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)) and any(node is n for c in chosen for n in consts.get(c, ())):
+            if isinstance(node, ast.AnnAssign):
+                node = ast.Assign(targets=[node.target], value=node.value, lineno=node.lineno, col_offset=0)
+        else:
+            continue
+        try:
+            exec(compile(ast.Module(body=[node], type_ignores=[]), str(app_path), "exec"), ns)
+        except NameError:
+            pass  # default / base que depende de algo no disponible: queda sin definir
+    return ns
+
+def _strip_def(node):
+    """Copia de la definición sin decoradores ni anotaciones (se evalúan al definir y pueden no existir aquí)."""
+    import ast
+    import copy
+    node = copy.deepcopy(node)
+    node.decorator_list = []
+    for n in ast.walk(node):
+        if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            n.returns = None
+        elif isinstance(n, ast.arg):
+            n.annotation = None
+    return node
+
+def builder_sql(app_path: Path | str = LINT_APP, on_sql=None) -> dict:
+    """
+    {constructor: [SQL]} de LINT_CALLS. No importa app.py (es el script de Streamlit completo): carga
+    solo esas definiciones (app_namespace) con un run_sql que captura el texto y regresa un DF vacío, y
+    _col_exists fijo en True y en False (cubre las dos ramas de las consultas que dependen del esquema).
+    Lo que el constructor haga después con el DF vacío no importa: basta con que haya emitido su SQL.
+    on_sql(sql), si se pasa, se llama dentro de cada run_sql (p.ej. para ver la pila de quién consulta).
+    """
+    out = {name: [] for name, _ in LINT_CALLS}
+    for col_exists in (True, False):
+        captured = []
+
+        def run_sql(sql, params=None):
+            captured.append(sql)
+            if on_sql is not None:
+                on_sql(sql)
+            return pd.DataFrame()
+
+        ns = app_namespace([name for name, _ in LINT_CALLS], {
+            "ora_async": types.SimpleNamespace(IdList=tuple),
+            "run_sql": run_sql,
+            "pg_run_sql": lambda sql, params=None: pd.DataFrame(),
+            "_col_exists": lambda *a, _v=col_exists: _v,
+            "ORA_AVAILABLE": True, "DIM_REFRESH_TTL": 0, "DIM_WATERMARK_TTL": 0,
+        }, app_path)
+        for name, args in LINT_CALLS:
+            if name not in ns:
+                raise KeyError(f"{name} no está definido en {Path(app_path).name}")
+            captured.clear()
+            try:
+                ret = ns[name](*args)
+            except Exception:
+                if not captured:
+                    raise
+                ret = None
+            if isinstance(ret, tuple) and ret and isinstance(ret[0], str):  # constructores que regresan (sql, params)
+                captured.append(ret[0])
+            out[name] += [q for q in captured if q not in out[name]]
+    return out
+
+def through(source: str, sql: str, params: dict | None, fetch) -> pd.DataFrame:
+    """Punto único de paso: live -> fetch(); record -> fetch() + guardar; replay -> grabación."""
+    if MODE == "replay":
+        return load(source, sql, params)
+    df = fetch()
+    if MODE == "record":
+        try:
+            save(source, sql, params, df)
+        except Exception as e:
+            print(f"[sql_replay] no se pudo grabar: {e}", file=sys.stderr)
+    return df
+
+# =========================
+#  CLI
+# =========================
+def _cmd_ls() -> int:
+    metas = sorted(SQL_REPLAY_DIR.glob("*/*.json"))
+    for p in metas:
+        m = json.loads(p.read_text(encoding="utf-8"))
+        print(f"{m['source']:6} {p.stem}  {m['rows']:>8} filas  {m['sql'][:90]}")
+    print(f"{len(metas)} consultas grabadas en {SQL_REPLAY_DIR}")
+    return 0
+
+def _cmd_lint(app_path: Path) -> int:
+    """
+    Filtros de fecha no sargables; sale con 1 si hay alguno:
+      1) SQL de los constructores de app.py (builder_sql, offline: sirve en CI)
+      2) SQL grabado, si hay grabación (el que la app generó de verdad)
+    """
+    bad = 0
+    built = builder_sql(app_path)
+    for name, sqls in built.items():
+        if not sqls:
+            bad += 1
+            print(f"app    {name}: no generó SQL")
+        for sql in sqls:
+            hits = non_sargable(sql)
+            if hits:
+                bad += 1
+                print(f"app    {name}  {_norm_sql(sql)[:90]}")
+                for h in hits:
+                    print(f"         -> {h}")
+    print(f"{bad} problemas en {sum(map(len, built.values()))} consultas de {len(built)} constructores de {Path(app_path).name}")
+
+    metas = sorted(SQL_REPLAY_DIR.glob("*/*.json"))
+    bad_rec = 0
+    for p in metas:
+        m = json.loads(p.read_text(encoding="utf-8"))
+        hits = non_sargable(m["sql"])
+        if hits:
+            bad_rec += 1
+            print(f"{m['source']:6} {p.stem}  {m['sql'][:90]}")
+            for h in hits:
+                print(f"         -> {h}")
+    print(f"{bad_rec} de {len(metas)} consultas grabadas con filtros de fecha no sargables")
+    return 1 if bad or bad_rec else 0
+
+def _cmd_bench(script: str, runs: int, timeout: float) -> int:
+    """Corre el script completo N veces en replay con streamlit.testing (AppTest): tiempo y pico de memoria."""
+    import tracemalloc
+    from streamlit.testing.v1 import AppTest
+
+    os.environ["SQL_BACKEND"] = "replay"
+    os.environ["SQL_REPLAY_DIR"] = str(SQL_REPLAY_DIR)
+    times, peaks = [], []
+    for i in range(runs):
+        at = AppTest.from_file(str(script), default_timeout=timeout)
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        at.run()
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if at.exception:
+            print(f"run {i + 1}: excepción en el script:\n{at.exception[0].message}", file=sys.stderr)
+            return 1
+        times.append(elapsed)
+        peaks.append(peak / 2**20)
+        print(f"run {i + 1}: {elapsed:7.3f} s   pico {peak / 2**20:8.1f} MiB")
+    t = np.array(times)
+    print(f"{Path(script).name}: mediana {np.median(t):.3f} s · min {t.min():.3f} s · max {t.max():.3f} s · "
+          f"pico máx {max(peaks):.1f} MiB  (run 1 incluye caches fríos)")
+    return 0
+
+def main(argv=None) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(prog="sql_replay.py", description="Grabaciones de consultas para correr los reportes offline.")
+    ap.add_argument("--dir", help="carpeta de grabaciones (default SQL_REPLAY_DIR)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("ls", help="lista las consultas grabadas")
+    lint = sub.add_parser("lint", help="filtros de fecha con funciones sobre la columna (sale con 1 si hay)")
+    lint.add_argument("--app", default=str(LINT_APP), help="script con los constructores (default app.py)")
+    b = sub.add_parser("bench", help="mide el script en modo replay")
+    b.add_argument("script")
+    b.add_argument("--runs", type=int, default=3)
+    b.add_argument("--timeout", type=float, default=300.0)
+    args = ap.parse_args(argv)
+    configure(replay_dir=args.dir)
+    if args.cmd == "ls":
+        return _cmd_ls()
+    if args.cmd == "lint":
+        return _cmd_lint(Path(args.app))
+    return _cmd_bench(args.script, args.runs, args.timeout)
+
+if __name__ == "__main__":
+    sys.exit(main())
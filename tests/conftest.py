@@ -0,0 +1,9 @@
+"""
+Tests sin Streamlit, Oracle ni Postgres. Los módulos auxiliares se importan directo; las funciones de
+app.py se cargan sueltas con sql_replay.app_namespace (sin correr el script), con dobles de run_sql.
+"""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
@@ -0,0 +1,293 @@
+import os
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+import bench_store as bs
+
+SHEET = "indices"
+HEADER = ["FECHA", "IDX A", "IDX B", "IDX C"]
+
+
+def _write(path, rows):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = SHEET
+    ws.append(HEADER)
+    ws.append([1, 2, 3, 4])  # fila de códigos: no es fecha
+    for r in rows:
+        ws.append(r)
+    wb.save(path)
+
+
+def _append(path, rows):
+    wb = openpyxl.load_workbook(path)
+    for r in rows:
+        wb[SHEET].append(r)
+    wb.save(path)
+    # la llave del cache incluye mtime: que no empate con la versión anterior
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+
+def _rows(start, n):
+    return [[datetime(2024, 1, start + k), 100.25 + k, "nd" if k % 3 == 0 else 50 + k, None if k % 2 else 7.5]
+            for k in range(n)]
+
+
+@pytest.fixture
+def book(tmp_path, monkeypatch):
+    monkeypatch.setattr(bs, "BENCH_CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(bs, "BENCH_STORE_DIR", tmp_path / "store")
+    path = tmp_path / "Indices Test.xlsx"
+    _write(path, _rows(1, 10))
+    return path
+
+
+def test_tail_matches_full_reparse(book):
+    prev = bs._parse_index_file(book, SHEET)
+    ingest = bs._xlsx_ingest_state(book, SHEET)
+    assert ingest["rows"] == 12
+    _append(book, _rows(11, 5) + [[None, None, None, None], ["2024-01-20", 1.5, "2.5", 3]])
+
+    out = bs._append_index_file(book, SHEET, prev, ingest)
+    assert out is not None
+    df, new_ingest = out
+    pd.testing.assert_frame_equal(df, bs._parse_index_file(book, SHEET))
+    assert new_ingest == bs._xlsx_ingest_state(book, SHEET)
+
+
+def test_no_new_rows_keeps_prev(book):
+    prev = bs._parse_index_file(book, SHEET)
+    ingest = bs._xlsx_ingest_state(book, SHEET)
+    df, new_ingest = bs._append_index_file(book, SHEET, prev, ingest)
+    assert df is prev
+    assert new_ingest == ingest
+
+
+@pytest.mark.parametrize("edit", [
+    lambda ws: ws.cell(row=5, column=2, value=-1.0),        # historia editada
+    lambda ws: ws.cell(row=1, column=3, value="IDX B2"),    # header renombrado
+    lambda ws: ws.delete_rows(4),                           # fila borrada
+])
+def test_changed_history_falls_back(book, edit):
+    prev = bs._parse_index_file(book, SHEET)
+    ingest = bs._xlsx_ingest_state(book, SHEET)
+    wb = openpyxl.load_workbook(book)
+    edit(wb[SHEET])
+    wb[SHEET].append(_rows(11, 1)[0])
+    wb.save(book)
+    assert bs._append_index_file(book, SHEET, prev, ingest) is None
+
+
+@pytest.mark.parametrize("rows", [
+    [[datetime(2024, 1, 5), 1.0, 2.0, 3.0]],                # FECHA ya ingerida
+    [[datetime(2024, 2, 1), 1.0, 2.0, 3.0, 4.0]],            # columna nueva a la derecha
+])
+def test_unexpected_tail_falls_back(book, rows):
+    prev = bs._parse_index_file(book, SHEET)
+    ingest = bs._xlsx_ingest_state(book, SHEET)
+    _append(book, rows)
+    assert bs._append_index_file(book, SHEET, prev, ingest) is None
+
+
+def test_old_ingest_without_rows_falls_back(book):
+    prev = bs._parse_index_file(book, SHEET)
+    ingest = bs._xlsx_ingest_state(book, SHEET)
+    ingest.pop("rows")
+    _append(book, _rows(11, 1))
+    assert bs._append_index_file(book, SHEET, prev, ingest) is None
+
+
+def test_read_index_file_appends_without_reparse(book, monkeypatch):
+    first = bs._read_index_file(book, SHEET)
+    _append(book, _rows(11, 3))
+    full = bs._parse_index_file(book, SHEET)
+
+    def no_parse(*a, **k):
+        raise AssertionError("re-parseo completo en una ingesta incremental")
+
+    monkeypatch.setattr(bs, "_parse_index_file", no_parse)
+    df = bs._read_index_file(book, SHEET)
+    pd.testing.assert_frame_equal(df, full)
+    assert len(df) == len(first) + 3
+    # el append quedó en cache con su huella: la siguiente lectura tampoco parsea
+    pd.testing.assert_frame_equal(bs._read_index_file(book, SHEET), full)
+    assert np.isnan(df["IDX B"].iloc[-3])  # 'nd' -> NaN como en el parseo completo
+
+
+def _no_parse(*a, **k):
+    raise AssertionError("se volvió a parsear el Excel")
+
+
+def test_index_cache_hit_skips_excel(book, monkeypatch):
+    first = bs._read_index_file(book, SHEET)
+    assert bs._index_cache_path(book, SHEET).exists()
+    monkeypatch.setattr(bs, "_parse_index_file", _no_parse)
+    monkeypatch.setattr(bs, "_append_index_file", _no_parse)
+    pd.testing.assert_frame_equal(bs._read_index_file(book, SHEET), first)
+
+
+def test_index_cache_invalidated_when_file_changes(book):
+    bs._read_index_file(book, SHEET)
+    old_path = bs._index_cache_path(book, SHEET)
+    wb = openpyxl.load_workbook(book)
+    wb[SHEET].cell(row=3, column=2, value=-1.0)   # edición de historia: re-parseo completo
+    wb.save(book)
+    st = os.stat(book)
+    os.utime(book, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    assert bs._index_cache_path(book, SHEET) != old_path
+    df = bs._read_index_file(book, SHEET)
+    assert df["IDX A"].iloc[0] == -1.0
+    assert not old_path.exists()   # solo queda la versión vigente de (archivo, hoja)
+    assert len(list(bs.BENCH_CACHE_DIR.glob(f"{bs._index_cache_prefix(book, SHEET)}__*.parquet"))) == 1
+
+
+def test_corrupt_index_cache_reparses(book):
+    first = bs._read_index_file(book, SHEET)
+    bs._index_cache_path(book, SHEET).write_bytes(b"no es parquet")
+    pd.testing.assert_frame_equal(bs._read_index_file(book, SHEET), first)
+
+
+@pytest.mark.parametrize("available, wanted, expected", [
+    (HEADER, ["IDX B"], ["IDX B"]),
+    (HEADER, [" IDX B ", "IDX A"], ["IDX B", "IDX A"]),          # por strip, en el orden pedido
+    (["FECHA", "IDX A ", "IDX B"], ["IDX A"], ["IDX A "]),        # header con espacio en el Excel
+    (HEADER, ["IDX B", "IDX B", "FECHA", "NO EXISTE"], ["IDX B"]),
+])
+def test_match_index_columns(available, wanted, expected):
+    assert bs._match_index_columns(available, wanted) == expected
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["miss", "hit"])
+def test_usecols_projection(book, cached):
+    full = bs._read_index_file(book, SHEET) if cached else bs._parse_index_file(book, SHEET)
+    df = bs._read_index_file(book, SHEET, usecols=["IDX C", " IDX A", "NO EXISTE"])
+    assert list(df.columns) == ["FECHA", "IDX C", "IDX A"]
+    assert df.attrs["ALL_COLUMNS"] == HEADER
+    pd.testing.assert_frame_equal(df, full[["FECHA", "IDX C", "IDX A"]], check_flags=False)
+    # el miss llena el cache completo: cualquier otra proyección sale del Parquet
+    assert bs._read_index_file(book, SHEET, usecols=["IDX B"])["IDX B"].equals(full["IDX B"])
+
+
+def test_month_end_levels_last_valid_per_column():
+    df = pd.DataFrame({
+        "FECHA": pd.to_datetime(["2024-01-30", "2024-01-31", "2024-02-28", "2024-02-29", "2024-03-15"]),
+        "A": [1.0, 2.0, 3.0, np.nan, np.nan],
+        "B": [10.0, np.nan, 30.0, 40.0, np.nan],
+    })
+    me = bs._month_end_levels(df)
+    assert list(me["FECHA"]) == list(pd.to_datetime(["2024-01-31", "2024-02-29"]))  # marzo sin niveles
+    assert me["A"].tolist() == [2.0, 3.0]     # último nivel válido del mes, por columna
+    assert me["B"].tolist() == [10.0, 40.0]
+
+
+def test_month_end_table_cached_and_projected(book, monkeypatch):
+    me = bs._read_index_month_end(book, SHEET)
+    pd.testing.assert_frame_equal(me, bs._month_end_levels(bs._parse_index_file(book, SHEET)))
+    monkeypatch.setattr(bs, "_read_index_file", _no_parse)
+    got = bs._read_index_month_end(book, SHEET, usecols=["IDX B"])
+    assert list(got.columns) == ["FECHA", "IDX B"]
+    pd.testing.assert_frame_equal(got, me[["FECHA", "IDX B"]], check_flags=False)
+
+
+def test_month_end_tail_updated_after_append(book, monkeypatch):
+    bs._read_index_month_end(book, SHEET)
+    _append(book, [[datetime(2024, 1, 31), 111.5, 60.5, None],
+                   [datetime(2024, 2, 1), 112.5, "nd", 8.5]])
+    want = bs._month_end_levels(bs._parse_index_file(book, SHEET))
+    monkeypatch.setattr(bs, "_parse_index_file", _no_parse)
+    bs._read_index_file(book, SHEET)   # append incremental + cola de la tabla month-end
+    monkeypatch.setattr(bs, "_month_end_levels", _no_parse)
+    pd.testing.assert_frame_equal(bs._read_index_month_end(book, SHEET), want)
+
+
+@pytest.fixture
+def store_sources(book, tmp_path, monkeypatch):
+    """Índices (book) + Mapa_Benchmarks con headers "sucios"; store vacío por prueba."""
+    monkeypatch.setattr(bs, "_STORE", {"key": None, "manifest": None, "tables": {}, "map": None})
+    map_path = tmp_path / "Mapa_Benchmarks.xlsx"
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["Alias", "Contrato", "Estrategia", "Benchmark", "Archivo", "Hoja", "Columna", "Peso", "Tipo"])
+    ws.append(["unib", "CTO 1", "Portafolio Total", "Gub", "test", "indices", "IDX A", 100, "blend"])
+    ws.append(["UNIB", "CTO 1", "Deuda", "Corp", "TEST", None, " IDX B", 60, "BLEND"])
+    ws.append(["UNIB", "CTO 1", "Deuda", "Nada", "TEST", "indices", "IDX Z", 40, "BLEND"])
+    ws.append(["UNIB", "CTO 2", "Deuda", "Gub", "OTRO", "indices", "IDX A", 100, "BLEND"])
+    ws.append(["UNIB", "CTO 2", "RV", "Gub", "TEST", "indices", "IDX C", 0, "BLEND"])
+    wb.save(map_path)
+    return SimpleNamespace(files={"TEST": book}, map_path=map_path, out=tmp_path / "store")
+
+
+def test_validate_bench_map(store_sources):
+    df_map, _, headers = bs._load_sources(store_sources.files, store_sources.map_path)
+    assert df_map["FILE_KEY"].tolist()[:2] == ["TEST", "TEST"]
+    errors = bs.validate_bench_map(df_map, store_sources.files, headers)
+    assert [(e["FILA"], e["ERROR"]) for e in errors] == [
+        (4, "COL_NAME 'IDX Z' no existe en TEST hoja 'indices'"),
+        (5, "FILE_KEY 'OTRO' no existe en BENCH_FILES"),
+        (6, "PESO inválido (0)"),
+    ]
+
+
+def test_build_store_publishes_and_serves(store_sources, monkeypatch):
+    m = bs.build_store(store_sources.out, store_sources.files, store_sources.map_path)
+    assert m["published"] and len(m["errors"]) == 3
+    assert (store_sources.out / "CURRENT").read_text() == m["version"]
+    assert m["tables"][0]["rows"] == 10 and m["tables"][0]["columns"] == 3
+
+    want = bs._parse_index_file(store_sources.files["TEST"], SHEET)
+    want_map = bs.load_bench_map(store_sources.map_path)
+    monkeypatch.setattr(bs, "_parse_index_file", _no_parse)
+    monkeypatch.setattr(bs, "_load_index_cache", _no_parse)
+    pd.testing.assert_frame_equal(bs._read_index_file(store_sources.files["TEST"], SHEET), want)
+    got = bs._read_index_month_end(store_sources.files["TEST"], SHEET, usecols=["IDX C"])
+    assert list(got.columns) == ["FECHA", "IDX C"] and len(got) == 1
+    pd.testing.assert_frame_equal(bs.store_bench_map(store_sources.map_path), want_map)
+
+
+def test_store_ignored_when_source_changes(store_sources):
+    bs.build_store(store_sources.out, store_sources.files, store_sources.map_path)
+    src = bs._source_stat(store_sources.files["TEST"])
+    assert bs._same_source(bs.open_store()["sources"]["TEST"], src)
+    _append(store_sources.files["TEST"], _rows(11, 1))
+    assert bs._store_table(store_sources.files["TEST"], SHEET) is None
+    assert len(bs._read_index_file(store_sources.files["TEST"], SHEET)) == 11   # cae al cache / Excel
+    wb = openpyxl.load_workbook(store_sources.map_path)
+    wb.active.cell(row=2, column=8, value=50)
+    wb.save(store_sources.map_path)
+    assert bs.store_bench_map(store_sources.map_path) is None
+
+
+def test_build_store_strict_and_keep(store_sources):
+    m = bs.build_store(store_sources.out, store_sources.files, store_sources.map_path, strict=True)
+    assert not m["published"] and not store_sources.out.exists()
+
+    versions = []
+    for k in range(4):
+        wb = openpyxl.load_workbook(store_sources.map_path)
+        wb.active.cell(row=2, column=8, value=100 + k)   # otra versión de las fuentes
+        wb.save(store_sources.map_path)
+        versions.append(bs.build_store(store_sources.out, store_sources.files, store_sources.map_path, keep=2)["version"])
+    kept = sorted(p.name for p in store_sources.out.iterdir() if p.is_dir())
+    assert len(kept) == 2 and versions[-1] in kept
+    assert (store_sources.out / "CURRENT").read_text() == versions[-1]
+    # mismas fuentes en el mismo segundo: misma versión, se vuelve a publicar sin error
+    again = bs.build_store(store_sources.out, store_sources.files, store_sources.map_path, keep=2)
+    assert (store_sources.out / "CURRENT").read_text() == again["version"]
+
+
+def test_cli_exit_codes(store_sources, monkeypatch, capsys):
+    monkeypatch.setattr(bs, "BENCH_FILES", store_sources.files)
+    args = ["--out", str(store_sources.out), "--map", str(store_sources.map_path)]
+    assert bs.main(["validate", *args]) == 0
+    assert bs.main(["build", "--strict", *args]) == 1
+    assert bs.main(["build", *args]) == 0
+    out = capsys.readouterr()
+    assert "5 filas en el mapa, 3 con error." in out.out
+    assert "[fila 4] UNIB / CTO 1 / Deuda: COL_NAME 'IDX Z' no existe" in out.err
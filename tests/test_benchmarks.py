@@ -0,0 +1,332 @@
+import gc
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+import bench_store
+import sql_replay
+
+BENCH_FILES = {"PIP": "pip.xlsx", "RV": "rv.xlsx"}
+
+
+def _levels(fechas, **cols):
+    df = pd.DataFrame({"FECHA": pd.to_datetime(fechas)})
+    for c, v in cols.items():
+        df[c.replace("_", " ")] = np.asarray(v, dtype=float)
+    return df
+
+
+LOADED = {
+    ("PIP", "indices"): _levels(["2024-01-02", "2024-01-03", "2024-01-05"],
+                                A=[100, 101, 102], B_=[50, 51, 52]),   # header "B " con espacio
+    ("RV", "indices"): _levels(["2024-01-03", "2024-01-04", "2024-01-05"], C=[10, 11, 12]),
+}
+
+
+def _map_rows(*rows):
+    return pd.DataFrame(rows, columns=["FILE_KEY", "SHEET_NAME", "COL_NAME", "BENCHMARK_LABEL", "PESO"])
+
+
+@pytest.fixture(scope="module")
+def app():
+    return sql_replay.app_namespace(["build_benchmark_series"])
+
+
+def _reference(rows: pd.DataFrame) -> pd.DataFrame:
+    """Composición ingenua: outer merge por FECHA de cada serie y suma ponderada, fila por fila."""
+    series, weights = {}, {}
+    for _, r in rows.iterrows():
+        sheet = r["SHEET_NAME"] if isinstance(r["SHEET_NAME"], str) else ""
+        label = r["BENCHMARK_LABEL"] if isinstance(r["BENCHMARK_LABEL"], str) else ""
+        key = (r["FILE_KEY"], sheet.strip() or "indices")
+        label = label.strip() or r["COL_NAME"]
+        df = LOADED[key]
+        col = next(c for c in df.columns if c.strip() == r["COL_NAME"].strip())
+        series.setdefault(label, df.set_index("FECHA")[col].rename(label))
+        weights[label] = weights.get(label, 0.0) + float(r["PESO"])
+    out = None
+    for s in series.values():
+        out = s.to_frame() if out is None else out.join(s, how="outer")
+    out = out.sort_index()
+    total = sum(w for w in weights.values() if w > 0)
+    out.insert(0, "BENCH", sum(out[l] * (w / total) for l, w in weights.items()))
+    return out.rename_axis("FECHA").reset_index()
+
+
+@pytest.mark.parametrize("rows", [
+    _map_rows(("PIP", "indices", "A", "Gubernamental", 100)),
+    _map_rows(("PIP", "indices", "A", "Gub", 60), ("RV", "indices", "C", "IPC", 40)),
+    _map_rows(("PIP", None, "B", "", 30), ("RV", "indices", "C", "IPC", 20), ("PIP", "indices", "A", "Gub", 10)),
+    # MULTI: la misma etiqueta en varias líneas suma pesos
+    _map_rows(("PIP", "indices", "A", "Gub", 50), ("PIP", "indices", "A", "Gub", 50), ("RV", "indices", "C", "IPC", 100)),
+], ids=["una", "dos_archivos", "pesos_sin_normalizar", "multi"])
+def test_benchmark_series_matches_reference(app, rows):
+    got = app["build_benchmark_series"](rows, BENCH_FILES, loaded=LOADED)
+    pd.testing.assert_frame_equal(got, _reference(rows), check_names=False)
+
+
+def test_benchmark_series_zero_weights(app):
+    got = app["build_benchmark_series"](_map_rows(("PIP", "indices", "A", "Gub", 0)), BENCH_FILES, loaded=LOADED)
+    assert list(got.columns) == ["FECHA", "BENCH"]
+    assert got["BENCH"].isna().all()
+
+
+@pytest.mark.parametrize("rows, msg", [
+    (_map_rows(("SP", "indices", "A", "x", 100)), "FILE_KEY no existe"),
+    (_map_rows(("PIP", "indices", "Z", "x", 100)), "COL_NAME 'Z' no existe"),
+])
+def test_benchmark_series_map_errors(app, rows, msg):
+    with pytest.raises(KeyError, match=msg):
+        app["build_benchmark_series"](rows, BENCH_FILES, loaded=LOADED)
+
+
+MAP = pd.DataFrame(
+    [
+        ("UNIB", "CTO 1", "Portafolio Total", "BLEND", "PIP", "indices", "A", "Gub", 100),
+        ("UNIB", "CTO 1", "Deuda", "BLEND", "PIP", "indices", "A", "Gub", 70),
+        ("UNIB", "CTO 1", "Deuda", "BLEND", "PIP", "indices", "B", "Corp", 30),
+        ("UNIB", "CTO 1", "deuda ", "MULTI", "RV", "indices", "C", "IPC", 100),
+        ("UNIB", "CTO 2", "TOTAL", "BLEND", "RV", "indices", "C", "IPC", 100),
+        ("OTRO", "CTO 1", "Deuda", "BLEND", "PIP", "indices", "A", "Gub", 100),
+    ],
+    columns=["ALIAS_CDM", "NOMBRE_CORTO", "PRODUCTO", "MODO", "FILE_KEY", "SHEET_NAME", "COL_NAME",
+             "BENCHMARK_LABEL", "PESO"],
+)
+
+
+@pytest.fixture(scope="module")
+def bench_index():
+    registry = {}
+    ns = sql_replay.app_namespace(
+        ["build_bench_map_index", "bench_map_index", "get_bench_rows", "get_bench_map_rows"],
+        {"_bench_map_index_registry": lambda: registry},
+    )
+    ns["registry"] = registry
+    return ns
+
+
+def _naive(df, alias, nombre, prod=None, modo=None, total=False):
+    key = df["PRODUCTO"].str.strip().str.upper()
+    mask = (df["ALIAS_CDM"] == alias) & (df["NOMBRE_CORTO"] == nombre)
+    if total:
+        mask &= key.isin(["PORTAFOLIO TOTAL", "PORTAFOLIO", "TOTAL", "TOTAL PORTAFOLIO"])
+    if prod is not None:
+        mask &= key == prod
+    if modo is not None:
+        mask &= df["MODO"] == modo
+    return df[mask]
+
+
+def test_bench_map_index_matches_masks(bench_index):
+    idx = bench_index["build_bench_map_index"](MAP)
+    for a, n in {(a, n) for a, n in zip(MAP["ALIAS_CDM"], MAP["NOMBRE_CORTO"])}:
+        pd.testing.assert_frame_equal(idx["contract"][(a, n)], _naive(MAP, a, n))
+        want_total = _naive(MAP, a, n, total=True)
+        if want_total.empty:
+            assert (a, n) not in idx["total"]
+        else:
+            pd.testing.assert_frame_equal(idx["total"][(a, n)], want_total)
+    pd.testing.assert_frame_equal(idx["product"][("UNIB", "CTO 1", "DEUDA")], _naive(MAP, "UNIB", "CTO 1", "DEUDA"))
+    pd.testing.assert_frame_equal(idx["mode"][("UNIB", "CTO 1", "DEUDA", "MULTI")],
+                                  _naive(MAP, "UNIB", "CTO 1", "DEUDA", "MULTI"))
+    pd.testing.assert_frame_equal(idx["contract_mode"][("UNIB", "CTO 1", "BLEND")],
+                                  _naive(MAP, "UNIB", "CTO 1", modo="BLEND"))
+
+
+def test_bench_rows_lookups(bench_index):
+    rows = bench_index["get_bench_rows"](MAP, " unib ", "CTO 1", " Deuda")
+    pd.testing.assert_frame_equal(rows, _naive(MAP, "UNIB", "CTO 1", "DEUDA"))
+    assert bench_index["get_bench_rows"](MAP, "UNIB", "CTO 9").empty
+    assert list(bench_index["get_bench_rows"](MAP, "UNIB", "CTO 9").columns) == list(MAP.columns)
+    multi = bench_index["get_bench_map_rows"](MAP, "UNIB", "CTO 1", "Deuda", modo="multi")
+    assert multi["COL_NAME"].tolist() == ["C"]
+
+
+def test_bench_map_index_built_once_per_frame(bench_index):
+    registry = bench_index["registry"]
+    df = MAP.copy()
+    first = bench_index["bench_map_index"](df)
+    assert bench_index["bench_map_index"](df) is first
+    assert id(df) in registry
+    key = id(df)
+    del df, first
+    gc.collect()
+    assert key not in registry   # el índice se libera con el DataFrame
+
+
+@pytest.fixture
+def bench_map(tmp_path):
+    """get_bench_map con un load_bench_map contador y sin store versionado."""
+    path = tmp_path / "Mapa_Benchmarks.xlsx"
+    path.write_bytes(b"v1")
+    calls = []
+
+    def load(p):
+        calls.append(Path(p).read_bytes())
+        if calls[-1] == b"roto":
+            raise ValueError("archivo a medio guardar")
+        return MAP.copy()
+
+    state = {"lock": threading.Lock(), "current": None}
+    ns = sql_replay.app_namespace(["get_bench_map"], {
+        "_bench_map_state": lambda: state,
+        "_bench_map_index_registry": lambda: {},
+        "load_bench_map": load,
+        "bench_store": SimpleNamespace(store_bench_map=lambda p: None),
+    })
+    return SimpleNamespace(get=lambda: ns["get_bench_map"](path), path=path, calls=calls)
+
+
+def _rewrite(path, data):
+    st = os.stat(path)
+    path.write_bytes(data)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+
+def test_bench_map_loaded_once_until_file_changes(bench_map):
+    first = bench_map.get()
+    assert bench_map.get() is first
+    assert bench_map.calls == [b"v1"]
+    _rewrite(bench_map.path, b"v2")
+    second = bench_map.get()
+    assert second is not first
+    assert bench_map.calls == [b"v1", b"v2"]
+
+
+def test_bench_map_failed_reload_keeps_previous(bench_map):
+    first = bench_map.get()
+    _rewrite(bench_map.path, b"roto")
+    assert bench_map.get() is first
+    _rewrite(bench_map.path, b"v3")
+    assert bench_map.get() is not first
+
+
+def test_bench_map_first_load_error_raises(bench_map):
+    _rewrite(bench_map.path, b"roto")
+    with pytest.raises(ValueError):
+        bench_map.get()
+
+
+def test_bench_map_concurrent_first_load(bench_map):
+    with ThreadPoolExecutor(8) as ex:
+        got = list(ex.map(lambda _: bench_map.get(), range(16)))
+    assert all(df is got[0] for df in got)
+    assert bench_map.calls == [b"v1"]
+
+
+def _write_index(path, cols, seed):
+    rng = np.random.default_rng(seed)
+    fechas = pd.bdate_range("2023-01-02", "2024-03-29")
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "indices"
+    ws.append(["FECHA", *cols])
+    levels = 100 * np.cumprod(1 + rng.normal(0, 0.01, (len(fechas), len(cols))), axis=0)
+    for f, row in zip(fechas, levels):
+        ws.append([f.to_pydatetime(), *map(float, row)])
+    wb.save(path)
+
+
+@pytest.fixture
+def index_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(bench_store, "BENCH_CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(bench_store, "BENCH_STORE_DIR", tmp_path / "store")
+    files = {"PIP": tmp_path / "pip.xlsx", "RV": tmp_path / "rv.xlsx"}
+    _write_index(files["PIP"], ["A", "B"], 1)
+    _write_index(files["RV"], ["C"], 2)
+    return files
+
+
+@pytest.fixture
+def packs_ns():
+    reads = []
+
+    def read_me(path, sheet, usecols=None):
+        reads.append((Path(path).name, sheet))
+        return bench_store._read_index_month_end(path, sheet, usecols=usecols)
+
+    ns = sql_replay.app_namespace(
+        ["build_bench_packs_for_contract", "build_bench_pack_from_map"],
+        {"_bench_map_index_registry": lambda: {}, "_read_index_month_end": read_me},
+    )
+    ns["reads"] = reads
+    return ns
+
+
+def test_contract_packs_equal_per_product_packs(packs_ns, index_files):
+    packs = packs_ns["build_bench_packs_for_contract"](MAP, "UNIB", "CTO 1", index_files)
+    assert list(packs) == [None, "DEUDA"]
+    assert sorted(packs_ns["reads"]) == [("pip.xlsx", "indices"), ("rv.xlsx", "indices")]   # una lectura por hoja
+    for prod in (None, "Deuda"):
+        want = packs_ns["build_bench_pack_from_map"](MAP, "UNIB", "CTO 1", prod, index_files)
+        got = packs[None if prod is None else "DEUDA"]
+        assert len(got) == 15   # ene-2023 .. mar-2024
+        pd.testing.assert_frame_equal(got.reset_index(drop=True), want.reset_index(drop=True))
+
+
+def test_contract_packs_isolate_product_errors(packs_ns, index_files):
+    bad = pd.concat([MAP, MAP.iloc[[1]].assign(PRODUCTO="Renta Variable", COL_NAME="NO EXISTE")], ignore_index=True)
+    packs = packs_ns["build_bench_packs_for_contract"](bad, "UNIB", "CTO 1", index_files)
+    assert isinstance(packs["RENTA VARIABLE"], KeyError)
+    assert isinstance(packs["DEUDA"], pd.DataFrame) and not packs["DEUDA"].empty
+
+
+@pytest.fixture
+def prewarm():
+    log, version = [], ["v1"]
+    state = {"lock": threading.Lock(), "thread": None, "version": None,
+             "total": 0, "done": 0, "errors": [], "started": None, "finished": None}
+
+    def packs(alias, nombre):
+        log.append(("pack", alias, nombre))
+        return {None: pd.DataFrame(), "DEUDA": KeyError("COL_NAME 'Z'")} if nombre == "CTO 2" else {None: pd.DataFrame()}
+
+    ns = sql_replay.app_namespace(["start_bench_prewarm"], {
+        "_bench_prewarm_state": lambda: state,
+        "_bench_sources_version": lambda files: version[0],
+        "get_bench_map": lambda: MAP,
+        "BENCH_FILES": {"PIP": "pip.xlsx", "RV": "rv.xlsx"},
+        "BENCH_PREWARM_WORKERS": 2,
+        "_read_index_month_end": lambda path, sheet: log.append(("sheet", Path(path).name, sheet)),
+        "bench_packs_for_contract": packs,
+    })
+    return SimpleNamespace(start=ns["start_bench_prewarm"], state=state, log=log, version=version)
+
+
+def _wait(state):
+    state["thread"].join(timeout=10)
+    assert not state["thread"].is_alive()
+
+
+def test_prewarm_reads_sheets_then_packs(prewarm):
+    state = prewarm.start(workers=3)
+    _wait(state)
+    kinds = [e[0] for e in prewarm.log]
+    assert kinds == ["sheet"] * 2 + ["pack"] * 3   # ningún pack arranca con un Excel en frío
+    assert {e[1:] for e in prewarm.log if e[0] == "pack"} == {("UNIB", "CTO 1"), ("UNIB", "CTO 2"), ("OTRO", "CTO 1")}
+    assert state["total"] == state["done"] == 5
+    assert state["errors"] == ["UNIB / CTO 2 / DEUDA: \"COL_NAME 'Z'\""]
+    assert state["version"] == "v1" and state["finished"] >= state["started"]
+
+
+def test_prewarm_runs_once_per_sources_version(prewarm):
+    _wait(prewarm.start(workers=2))
+    first = prewarm.state["thread"]
+    assert prewarm.start(workers=2)["thread"] is first   # misma versión: no se relanza
+    prewarm.version[0] = "v2"
+    _wait(prewarm.start(workers=2))
+    assert prewarm.state["thread"] is not first
+    assert prewarm.state["version"] == "v2"
+    assert len(prewarm.log) == 10
+
+
+def test_prewarm_disabled_with_zero_workers(prewarm):
+    assert prewarm.start(workers=0)["thread"] is None
+    assert prewarm.log == []
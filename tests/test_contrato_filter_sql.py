@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+import pytest
+
+import sql_replay
+
+
+@pytest.fixture(scope="module")
+def build():
+    ns = sql_replay.app_namespace(["build_contrato_filter_sql"], {"ora_async": SimpleNamespace(IdList=tuple)})
+    return ns["build_contrato_filter_sql"]
+
+
+@pytest.mark.parametrize("contratos", [None, [], ["x", None]])
+def test_sin_contratos_no_filtra(build, contratos):
+    assert build(contratos, "c.ID_CLIENTE", "cid") == ("", {})
+
+
+def test_ids_unicos_como_int(build):
+    _, params = build(["7", 3, 7, "3", "basura", 9.0], "c.ID_CLIENTE", "cid")
+    assert params == {"cid": (7, 3, 9)}
+
+
+@pytest.mark.parametrize("sizes, card", [
+    ((1, 2, 10), 10),
+    ((11, 57, 100), 100),
+    ((101, 1000), 1000),
+    ((1001, 5000), 10000),
+])
+def test_texto_constante_por_orden_de_magnitud(build, sizes, card):
+    clauses = {build(list(range(1, n + 1)), "c.ID_CLIENTE", "cid")[0] for n in sizes}
+    assert len(clauses) == 1
+    clause = clauses.pop()
+    assert f"/*+ CARDINALITY(t {card}) */" in clause
+    assert "FROM TABLE(:cid) t" in clause
+
+
+def test_filtro_es_sargable(build):
+    clause, _ = build([1, 2], "e.ID_CLIENTE", "cid")
+    sql = f"SELECT 1 FROM T e WHERE 1 = 1 {clause} AND TRUNC(e.FECHA_ESTADISTICA) >= :d"
+    assert sql_replay.non_sargable(sql) == ["TRUNC(e.FECHA_ESTADISTICA)"]  # el predicado después sí se revisa
+    assert sql_replay.non_sargable(f"SELECT 1 FROM T e WHERE 1 = 1 {clause}") == []
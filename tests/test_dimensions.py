@@ -0,0 +1,129 @@
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sql_replay
+
+
+def _core_issuer(seed=5):
+    """core_issuer con varias filas por emisor; la moda de cada columna es única (sin empates)."""
+    rng = np.random.default_rng(seed)
+    tickers = ["AMXL", "WALMEX*", "GFNORTEO, S.A.", "  ", None]
+    sectors = ["Telecom", "Consumo", "Financiero", None]
+    rows = []
+    for i in range(40):
+        name = f"EMISOR {i}"
+        mode = {"ticker_symbol": tickers[i % 5], "sector": sectors[i % 4], "industry": f"IND {i % 3}"}
+        if i % 7 == 0:
+            mode = dict.fromkeys(mode)   # emisor sin valores: la moda es la fila de ruido
+        for _ in range(int(rng.integers(2, 5))):
+            rows.append({"issuer_name": name, **mode})
+        for c in mode:            # una fila de ruido por columna: nunca alcanza a la moda
+            rows.append({"issuer_name": name, **dict.fromkeys(mode), c: f"otro {c} {i}"})
+    rows = [rows[i] for i in rng.permutation(len(rows))]
+    return pd.DataFrame(rows)
+
+
+def _old_core_issuer_map(core):
+    """core_issuer_map anterior: moda por emisor con groupby + lambda."""
+    core = core.copy()
+    core["issuer_name"] = core["issuer_name"].astype(str)
+
+    def _mode_or_default(s, default_val):
+        s = s.dropna()
+        return s.value_counts().index[0] if len(s) else default_val
+
+    agg = (core.groupby("issuer_name", dropna=False)
+           .agg({"ticker_symbol": lambda s: _mode_or_default(s, None),
+                 "sector": lambda s: _mode_or_default(s, "SIN SECTOR"),
+                 "industry": lambda s: _mode_or_default(s, "SIN INDUSTRIA")})
+           .reset_index())
+    agg["Nombre Completo"] = np.where(
+        agg["ticker_symbol"].notna() & (agg["ticker_symbol"].astype(str).str.strip() != ""),
+        agg["ticker_symbol"].astype(str), agg["issuer_name"].astype(str))
+    agg["Nombre Completo"] = agg["Nombre Completo"].str.split(",", n=1, expand=True)[0].str.strip()
+    agg["sector"] = agg["sector"].fillna("SIN SECTOR")
+    agg["industry"] = agg["industry"].fillna("SIN INDUSTRIA")
+    return agg[["issuer_name", "Nombre Completo", "sector", "industry"]]
+
+
+def test_core_issuer_matches_old_aggregation():
+    core = _core_issuer()
+    ns = sql_replay.app_namespace(["_load_dim_core_issuer", "_decat"], {"pg_run_sql": lambda sql: core})
+    got = ns["_decat"](ns["_load_dim_core_issuer"]())
+    want = _old_core_issuer_map(core)
+    pd.testing.assert_frame_equal(got.reset_index(drop=True), want, check_dtype=False)
+    assert isinstance(ns["_load_dim_core_issuer"]()["sector"].dtype, pd.CategoricalDtype)
+
+
+def test_mode_by_skips_nulls():
+    ns = sql_replay.app_namespace(["_mode_by"])
+    df = pd.DataFrame({"k": ["a", "a", "a", "b", "b", "c"], "v": ["x", None, "x", "y", None, None]})
+    assert ns["_mode_by"](df, "k", "v").to_dict() == {"a": "x", "b": "y"}
+
+
+@pytest.fixture
+def dim():
+    clock = {"now": 1000.0}
+    state = {"lock": threading.Lock(), "locks": {}, "dims": {}}
+    src = {"wm": (10, 99), "version": 0, "fail": False, "wm_calls": 0, "loads": 0}
+
+    def watermark():
+        src["wm_calls"] += 1
+        if src["fail"]:
+            raise RuntimeError("ORA-03113")
+        return src["wm"]
+
+    def load():
+        if src["fail"]:
+            raise RuntimeError("ORA-03113")
+        src["loads"] += 1
+        return pd.DataFrame({"V": [src["version"]]})
+
+    ns = sql_replay.app_namespace(["_dim_get"], {
+        "_dim_state": lambda: state, "time": SimpleNamespace(time=lambda: clock["now"]),
+        "DIM_WATERMARK_TTL": 300, "DIM_REFRESH_TTL": 3600,
+    })
+    return SimpleNamespace(get=lambda: int(ns["_dim_get"]("emisora", watermark, load)["V"].iloc[0]),
+                           clock=clock, src=src)
+
+
+def test_dim_reloads_only_on_watermark_change(dim):
+    assert dim.get() == 0 and dim.src["loads"] == 1
+    dim.src["version"] = 1
+    dim.clock["now"] += 299
+    assert dim.get() == 0 and dim.src["wm_calls"] == 1        # dentro del TTL: ni el watermark
+    dim.clock["now"] += 2
+    assert dim.get() == 0 and dim.src["wm_calls"] == 2 and dim.src["loads"] == 1
+    dim.src["wm"] = (11, 100)                                 # cambió V_M_EMISORA
+    dim.clock["now"] += 301
+    assert dim.get() == 1 and dim.src["loads"] == 2
+
+
+def test_dim_full_refresh_and_failures(dim):
+    dim.get()
+    dim.src["version"] = 1
+    dim.clock["now"] += 3601                                  # DIM_REFRESH_TTL: recarga aunque el watermark sea igual
+    assert dim.get() == 1 and dim.src["loads"] == 2
+    dim.src["version"], dim.src["fail"] = 2, True
+    dim.clock["now"] += 3601
+    assert dim.get() == 1                                     # la recarga falla: se sigue sirviendo la anterior
+    dim.src["fail"] = False
+    assert dim.get() == 2                                     # y se reintenta en la siguiente llamada
+
+
+def test_dim_first_load_failure_raises(dim):
+    dim.src["fail"] = True
+    with pytest.raises(RuntimeError, match="ORA-03113"):
+        dim.get()
+
+
+def test_watermark_and_category_helpers():
+    ns = sql_replay.app_namespace(["_watermark", "_as_category"])
+    assert ns["_watermark"](pd.DataFrame({"N": [3], "MAX_ID": [9]})) == (3, 9)
+    assert ns["_watermark"](pd.DataFrame(columns=["N"])) == ()
+    out = ns["_as_category"](pd.DataFrame({"A": ["x"], "B": [1]}), ["A", "NO_EXISTE"])
+    assert isinstance(out["A"].dtype, pd.CategoricalDtype) and out["B"].dtype == np.int64
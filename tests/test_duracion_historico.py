@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import sql_replay
+
+
+def _snapshot(meses, seed=3):
+    """Renglones de query_snapshot_deuda_multi: varias posiciones por mes, con reportos y valores nulos."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for mes in meses:
+        corte = pd.Timestamp(mes) + pd.offsets.MonthEnd(0)
+        for i in range(6):
+            reporto = i == 0
+            rows.append({
+                "MES": corte, "FECHA_CORTE": corte, "ID_PRODUCTO": 10 + i % 2, "ID_EMISORA": i,
+                "TIPO_PAPEL": "Reporto" if reporto else "Gubernamental",
+                "TIPO_INSTRUMENTO": "Reporto" if reporto else ("Tasa revisable" if i % 2 else "Cupón cero"),
+                "NOMBRE_EMISORA": f"EMIS{i}", "SERIE": f"{24 + i}",
+                "EMIS_TASA": f"{rng.uniform(5, 11):.4f}", "TASA_BASE": 11.0, "ID_TASA_REFERENCIA": np.nan,
+                "FECHA_VTO_EM": corte + pd.Timedelta(days=int(rng.integers(1, 2000))), "DIAS_X_V": np.nan,
+                "PLAZO_CUPON": 28, "ID_DIVISA_TV": 1, "CALIFICACION_HOMOLOGADA": "MXAAA",
+                "VALOR_NOMINAL": rng.uniform(1e3, 1e5),
+                "VALOR_REAL": np.nan if i == 5 else rng.uniform(1e5, 1e7),
+                "DURACION_DIAS": np.nan if i == 4 else rng.uniform(1, 1800),
+            })
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def dur():
+    calls = []
+
+    def multi(alias, f_ini, f_fin_next, contratos_key=None):
+        calls.append((alias, f_ini, f_fin_next, contratos_key))
+        return _snapshot(pd.date_range(f_ini, f_fin_next - pd.Timedelta(days=1), freq="MS"))
+
+    ns = sql_replay.app_namespace(
+        ["duracion_ponderada_por_mes", "deuda_duracion_historico", "build_df_final"],
+        {"query_snapshot_deuda_multi": multi,
+         "map_productos": lambda: pd.DataFrame({"ID_PRODUCTO": [10, 11], "PRODUCTO": ["DEUDA", "LIQUIDEZ"]})},
+    )
+    ns["calls"] = calls
+    return ns
+
+
+def _total_row_duration(dur, df_snap):
+    """Lo que leía el histórico por mes: renglón TOTAL de build_df_final."""
+    det = dur["build_df_final"](df_snap.drop(columns=["MES"]).reset_index(drop=True), 0.04)
+    total = det[det["Instrumento"] == "TOTAL"]
+    return float(total["Duración (días)"].iloc[0])
+
+
+def test_matches_build_df_final_total(dur):
+    snap = _snapshot(pd.date_range("2023-04-01", "2024-03-01", freq="MS"))
+    snap.loc[snap["MES"] == "2023-08-31", "VALOR_REAL"] = 0.0   # mes sin valor: duración 0
+    got = dur["duracion_ponderada_por_mes"](snap)
+    want = pd.DataFrame([{"MES": mes, "DURACION_DIAS": _total_row_duration(dur, g)}
+                         for mes, g in snap.groupby("MES")])
+    pd.testing.assert_frame_equal(got, want)
+    assert got.loc[got["MES"] == "2023-08-31", "DURACION_DIAS"].item() == 0
+
+
+def test_history_is_one_snapshot_of_twelve_months(dur):
+    out = dur["deuda_duracion_historico"]("A", 0.04, pd.Timestamp("2024-03-15"), (7,))
+    assert dur["calls"] == [("A", pd.Timestamp("2023-04-01"), pd.Timestamp("2024-04-01"), (7,))]
+    assert out["MES"].tolist() == list(pd.date_range("2023-04-30", "2024-03-31", freq="ME"))
+
+
+def test_empty_snapshot(dur):
+    for snap in (None, _snapshot([]).iloc[:0]):
+        out = dur["duracion_ponderada_por_mes"](snap)
+        assert out.empty and list(out.columns) == ["MES", "DURACION_DIAS"]
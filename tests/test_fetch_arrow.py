@@ -0,0 +1,141 @@
+import warnings
+from collections import namedtuple
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import sql_replay
+from conftest import ROOT
+
+Column = namedtuple("Column", "name type_code display_size internal_size precision scale null_ok")
+
+CST = timezone(timedelta(hours=-6))  # TimeZone de la sesión: psycopg2 trae todo timestamptz con ese offset
+
+# (columna, OID de pg_type, valores como los entrega psycopg2)
+PG_COLS = [
+    ("id", 23, [1, 2, 3]),
+    ("cnt", 20, [10, None, 30]),
+    ("nombre", 25, ["a", "", None]),
+    ("clave", 1043, ["00123", "x,\"y\"", "z"]),
+    ("monto", 1700, [Decimal("1.50"), None, Decimal("-2.2500")]),
+    ("ts_tz", 1184, [datetime(2024, 1, 31, 18, 0, tzinfo=CST), None,
+                     datetime(2024, 2, 1, 5, 30, 0, 250000, tzinfo=CST)]),
+    ("ts", 1114, [datetime(2024, 1, 31, 23, 59, 59), datetime(1999, 12, 31), None]),
+    ("dia", 1082, [date(2024, 1, 31), None, date(2024, 2, 29)]),
+    ("activo", 16, [True, False, None]),
+    ("vacio", 25, [None, None, None]),
+    ("vacio_num", 1700, [None, None, None]),
+]
+
+
+def _pg_text(v) -> str:
+    """Celda como la escribe COPY ... (FORMAT csv) con DateStyle ISO."""
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    if isinstance(v, str):
+        return '"' + v.replace('"', '""') + '"'
+    if isinstance(v, datetime):
+        out = v.strftime("%Y-%m-%d %H:%M:%S") + (f".{v.microsecond:06d}".rstrip("0") if v.microsecond else "")
+        if v.tzinfo is not None:
+            off = int(v.utcoffset().total_seconds() // 60)
+            sign, off = ("-", -off) if off < 0 else ("+", off)
+            out += f"{sign}{off // 60:02d}" + (f":{off % 60:02d}" if off % 60 else "")
+        return out
+    return str(v)
+
+
+class FakePG:
+    """Conexión/cursor psycopg2 falsos: filas para pd.read_sql y el CSV de COPY para _pg_copy_df."""
+
+    def __init__(self, cols):
+        self.cols = cols
+        self.rows = list(zip(*[vals for _, _, vals in cols])) if cols and cols[0][2] else []
+        self.executed = []
+        self.description = None
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def close(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def mogrify(self, sql, params=None):
+        return sql.encode("utf-8")
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+        self.description = [Column(name, oid, None, None, None, None, None) for name, oid, _ in self.cols]
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def copy_expert(self, sql, buf):
+        self.executed.append(sql)
+        buf.write("".join(",".join(map(_pg_text, r)) + "\n" for r in self.rows).encode("utf-8"))
+
+
+@pytest.fixture(scope="module")
+def arrow_table_to_pandas():
+    return sql_replay.app_namespace(["arrow_table_to_pandas"], app_path=ROOT / "ora_async.py")["arrow_table_to_pandas"]
+
+
+@pytest.fixture
+def pg(arrow_table_to_pandas):
+    return sql_replay.app_namespace(
+        ["_pg_copy_df"], {"ora_async": SimpleNamespace(arrow_table_to_pandas=arrow_table_to_pandas)},
+    )
+
+
+def _read_sql(conn, sql):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)  # conexión DBAPI sin SQLAlchemy
+        return pd.read_sql(sql, conn)
+
+
+@pytest.mark.parametrize("cols", [PG_COLS, [(name, oid, []) for name, oid, _ in PG_COLS]], ids=["filas", "vacio"])
+def test_pg_copy_matches_read_sql(pg, cols):
+    sql = "SELECT * FROM t"
+    got = pg["_pg_copy_df"](FakePG(cols), sql)
+    want = _read_sql(FakePG(cols), sql)
+    pd.testing.assert_frame_equal(got, want)
+
+
+def test_pg_types_cached_per_sql(pg):
+    conn = FakePG(PG_COLS)
+    for _ in range(3):
+        pg["_pg_copy_df"](conn, "SELECT * FROM t WHERE a = %(a)s", {"a": 1})
+    pg["_pg_copy_df"](conn, "SELECT * FROM t WHERE a = %(a)s", {"a": "x"})  # otro tipo de bind
+    pg["_pg_copy_df"](conn, "SELECT * FROM u")
+    limit0 = [q for q in conn.executed if q.endswith("LIMIT 0")]
+    assert len(limit0) == 3
+    assert sum(q.startswith("COPY") for q in conn.executed) == 5
+
+
+def test_oracle_arrow_types_match_read_sql(arrow_table_to_pandas):
+    # lo que entrega fetch_df_all: NUMBER(p,s) como decimal128, DATE como timestamp[s]
+    monto = [Decimal("1.50"), None, Decimal("-2.25")]
+    fecha = [datetime(2024, 1, 31), datetime(9999, 12, 31), None]
+    tbl = pa.table({
+        "MONTO": pa.array(monto, pa.decimal128(12, 2)),
+        "FECHA": pa.array(fecha, pa.timestamp("s")),
+        "ID": pa.array([1, 2, 3], pa.int64()),
+        "NADA": pa.array([None, None, None], pa.string()),
+    })
+    want = _read_sql(FakePG([("MONTO", 0, monto), ("FECHA", 0, fecha), ("ID", 0, [1, 2, 3]),
+                             ("NADA", 0, [None, None, None])]), "SELECT * FROM t")
+    pd.testing.assert_frame_equal(arrow_table_to_pandas(tbl), want)
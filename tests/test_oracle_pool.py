@@ -0,0 +1,96 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+import sql_replay
+
+
+class FakePool:
+    """Pool con `max` conexiones: acquire bloquea mientras no haya una libre."""
+
+    def __init__(self, max=1, fail=False):
+        self.min, self.max, self.increment, self.stmtcachesize = 1, max, 1, 50
+        self.opened, self.busy = max, 0
+        self.fail = fail
+        self._free = threading.Semaphore(max)
+
+    def acquire(self):
+        if self.fail:
+            raise RuntimeError("DPY-4005: timed out waiting for the connection pool")
+        self._free.acquire()
+        self.busy += 1
+        return FakeConn(self)
+
+
+class FakeConn:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.pool.busy -= 1
+        self.pool._free.release()
+        return False
+
+
+@pytest.fixture
+def pool_ns():
+    def make(pool):
+        stats = {"lock": threading.Lock(), "acquires": 0, "wait_s": 0.0, "wait_max_s": 0.0, "errors": 0}
+        ns = sql_replay.app_namespace(["pooled_conn", "pool_stats"], {
+            "get_pool": lambda: pool,
+            "_pool_wait_stats": lambda: stats,
+        })
+        ns["pooled_conn"] = contextmanager(ns["pooled_conn"])   # app_namespace quita los decoradores
+        return ns
+    return make
+
+
+def test_connection_returned_to_pool(pool_ns):
+    pool = FakePool(max=1)
+    ns = pool_ns(pool)
+    with ns["pooled_conn"]() as conn:
+        assert isinstance(conn, FakeConn) and pool.busy == 1
+    assert pool.busy == 0
+    with pytest.raises(ValueError):
+        with ns["pooled_conn"]():
+            raise ValueError("falla la consulta")
+    assert pool.busy == 0   # también se regresa si la consulta falla
+    assert ns["pool_stats"]()["acquires"] == 2
+
+
+def test_acquire_wait_is_measured(pool_ns):
+    pool = FakePool(max=1)
+    ns = pool_ns(pool)
+    holding = threading.Event()
+
+    def hold():
+        with ns["pooled_conn"]():
+            holding.set()
+            time.sleep(0.1)
+
+    t = threading.Thread(target=hold)
+    t.start()
+    assert holding.wait(5)
+    with ns["pooled_conn"]():   # espera a que hold() regrese su conexión
+        pass
+    t.join()
+    stats = ns["pool_stats"]()
+    assert stats["acquires"] == 2
+    assert stats["wait_max_ms"] >= 50
+    assert stats["wait_avg_ms"] == pytest.approx(stats["wait_max_ms"] / 2, rel=0.5)
+    assert {k: stats[k] for k in ("open", "busy", "min", "max", "stmt_cache")} == \
+        {"open": 1, "busy": 0, "min": 1, "max": 1, "stmt_cache": 50}
+
+
+def test_acquire_errors_counted(pool_ns):
+    ns = pool_ns(FakePool(fail=True))
+    with pytest.raises(RuntimeError, match="DPY-4005"):
+        with ns["pooled_conn"]():
+            pass
+    stats = ns["pool_stats"]()
+    assert stats["acquire_errors"] == 1 and stats["acquires"] == 0 and stats["wait_avg_ms"] == 0.0
@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import sql_replay
+from conftest import ROOT
+
+
+def _cache_data(**_):
+    """st.cache_data mínimo: memo por argumentos."""
+    def deco(fn):
+        memo = {}
+
+        def cached(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            if key not in memo:
+                memo[key] = fn(*args, **kwargs)
+            return memo[key]
+        cached.clear = memo.clear
+        return cached
+    return deco
+
+
+@pytest.fixture
+def perf(tmp_path):
+    state = {"lock": threading.Lock(), "runs": {}}
+    session = {"id": "s1"}
+    ns = sql_replay.app_namespace(
+        ["perf_begin_run", "perf_record", "perf_tag", "perf_events", "perf_query", "perf_cache_data",
+         "get_num_contratos"],
+        {"_perf_state": lambda: state, "_perf_session": lambda: session["id"],
+         "PERF_LOG_PATH": str(tmp_path / "perf.jsonl"), "__file__": str(ROOT / "app.py")},
+    )
+    ns["st"] = SimpleNamespace(cache_data=_cache_data)   # después: con st en ns se evaluarían los st.secrets
+    ns["state"], ns["session"], ns["log"] = state, session, tmp_path / "perf.jsonl"
+    ns["perf_begin_run"]()
+    return ns
+
+
+def _sql(perf, df=None, exc=None):
+    """run_sql instrumentado que regresa df o lanza exc."""
+    def body(sql, params=None):
+        if exc is not None:
+            raise exc
+        return df
+    return perf["perf_query"]("sql")(body)
+
+
+def test_query_event_names_owner_function(perf):
+    perf["run_sql"] = _sql(perf, pd.DataFrame({"N": [42]}))
+    assert perf["get_num_contratos"]("A") == 42
+    (ev,) = perf["perf_events"]()
+    assert ev["kind"] == "sql" and ev["name"] == "get_num_contratos"
+    assert ev["rows"] == 1 and ev["bytes"] == 8 and ev["cache"] is None
+    assert len(ev["sql_id"]) == 8 and ev["elapsed_s"] >= 0
+
+
+def test_query_error_is_recorded_and_raised(perf):
+    perf["run_sql"] = _sql(perf, exc=RuntimeError("ORA-00942"))
+    with pytest.raises(RuntimeError):
+        perf["get_num_contratos"]("A")
+    (ev,) = perf["perf_events"]()
+    assert ev["error"] == "RuntimeError" and "rows" not in ev
+
+
+def test_st_cached_query_reports_hit_and_miss(perf):
+    calls = []
+
+    def body(sql, params=None):   # como pg_run_sql: solo corre en miss de st.cache_data
+        perf["_perf_tls"].executed = True
+        calls.append(sql)
+        return pd.DataFrame({"N": [1]})
+
+    q = perf["perf_query"]("pg", st_cached=True)(_cache_data()(body))
+    q("SELECT 1")
+    q("SELECT 1")
+    assert [e["cache"] for e in perf["perf_events"]()] == ["miss", "hit"]
+    assert len(calls) == 1
+
+
+def test_cache_data_marks_nested_calls(perf):
+    inner_calls = []
+
+    @perf["perf_cache_data"](ttl=60)
+    def inner(x):
+        inner_calls.append(x)
+        return x * 2
+
+    @perf["perf_cache_data"](ttl=60)
+    def outer(x):
+        return inner(x) + 1
+
+    inner(3)
+    assert outer(3) == 7           # outer corre (miss); inner ya estaba (hit)
+    assert outer(3) == 7
+    ev = [(e["name"], e["cache"]) for e in perf["perf_events"]()]
+    assert ev == [("inner", "miss"), ("inner", "hit"), ("outer", "miss"), ("outer", "hit")]
+    assert inner_calls == [3]
+
+
+def test_sink_and_sessions(perf):
+    perf["perf_tag"](alias="A", periodo="2024-03")
+    perf["perf_record"]("render", "render_portada", time.perf_counter(), 0.25)
+    line = json.loads(perf["log"].read_text(encoding="utf-8").splitlines()[0])
+    assert line["alias"] == "A" and line["session"] == "s1" and line["elapsed_s"] == 0.25
+
+    perf["session"]["id"] = None   # hilo sin sesión: no se registra
+    perf["perf_record"]("task", "prewarm", time.perf_counter(), 0.1)
+    assert perf["perf_events"]() == []
+
+    perf["state"]["runs"]["s1"]["wall"] -= 7200   # sesión inactiva > 1 h
+    perf["session"]["id"] = "s2"
+    perf["perf_begin_run"]()
+    assert set(perf["state"]["runs"]) == {"s2"}
@@ -0,0 +1,159 @@
+import functools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sql_replay
+
+# emisora -> tipo de activo; 5 es deuda pero va en un producto de reporto de RV; 99 no está en V_M_EMISORA
+EMISORAS = pd.DataFrame({
+    "ID_EMISORA": [1, 2, 3, 4, 5],
+    "ID_TIPO_ACTIVO": [1, 1, 1, 2, 1],
+    "NOMBRE_EMISORA": ["BONOS", "CETES", "BANOBRA", "WALMEX", "REPO RV"],
+    "SERIE": ["M 241205", "BI 240502", "22", "*", "R"],
+    "TIPO_PAPEL": ["Gubernamental", "Gubernamental", "Banca Comercial", "Acciones", "Reporto"],
+    "TIPO_INSTRUMENTO": ["Tasa fija", "Cupón cero", "Tasa revisable", "Acción", "Reporto"],
+    "PLAZO_CUPON": [182, 28, 28, None, 1],
+    "FECHA_VTO_EM": pd.to_datetime(["2024-12-05", "2024-05-02", "2026-01-15", None, "2024-04-01"]),
+    "ID_TASA_REFERENCIA": [None, None, 7, None, None],
+    "ID_DIVISA_TV": [1, 1, 1, 1, 1],
+}).astype({c: "category" for c in ("NOMBRE_EMISORA", "SERIE", "TIPO_PAPEL", "TIPO_INSTRUMENTO")})
+PRODUCTO = {1: 10, 2: 10, 3: 11, 4: 20, 5: 144, 99: 10}
+RATINGS = ["CALIFICACION_HOMOLOGADA", "CALIFICACION_S_P", "CALIFICACION_MDYS", "CALIFICACION_HRRATING",
+           "CALIFICACION_FITCH"]
+
+
+def _his(seed=11):
+    """V_HIS_POSICION_CLIENTE diaria de dos clientes; el último día con registro varía por mes."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for day in pd.bdate_range("2023-10-02", "2024-03-20"):
+        if day.month == 2 and day.day > 27:   # febrero cierra el 27
+            continue
+        for cliente in (501, 502):
+            if cliente == 502 and day >= pd.Timestamp("2024-01-20"):
+                continue                      # un contrato que se cierra a media serie
+            for em in (1, 2, 3, 4, 5, 99):
+                if em == 3 and day.month == 12:
+                    continue
+                rows.append({"ID_CLIENTE": cliente, "REGISTRO_CONTROL": day + pd.Timedelta(hours=18),
+                             "ID_PRODUCTO": PRODUCTO[em], "ID_EMISORA": em,
+                             "VALOR_REAL": round(rng.uniform(1e5, 1e6), 2), "VALOR_NOMINAL": 100.0,
+                             "PLAZO_REPORTO": 1 if em == 5 else 0, "EMIS_TASA": "10.5",
+                             **dict.fromkeys(RATINGS, "mxAAA")})
+    return pd.DataFrame(rows)
+
+
+HIS = _his()
+
+
+def _position_facts(alias, f_ini, cutoff_next, contratos_key=None):
+    """Lo que hace SQL_CUBE: por mes su último día con registro y, de ese día, sumas por producto/emisora."""
+    h = HIS[(HIS["REGISTRO_CONTROL"] >= f_ini) & (HIS["REGISTRO_CONTROL"] < cutoff_next)].copy()
+    h["DIA"] = h["REGISTRO_CONTROL"].dt.normalize()
+    h["MES"] = h["DIA"].dt.to_period("M").dt.to_timestamp()
+    h = h[h["DIA"] == h.groupby("MES")["DIA"].transform("max")]
+    h["PV"] = h["PLAZO_REPORTO"] * h["VALOR_REAL"]
+    g = h.groupby(["MES", "ID_PRODUCTO", "ID_EMISORA"], as_index=False).agg(
+        **{c: (c, "max") for c in RATINGS}, EMIS_TASA=("EMIS_TASA", "max"),
+        VALOR_NOMINAL=("VALOR_NOMINAL", "sum"), VALOR_REAL=("VALOR_REAL", "sum"), PV=("PV", "sum"),
+        FECHA_CORTE=("DIA", "max"))
+    g["DURACION_DIAS"] = g["PV"] / g["VALOR_REAL"]
+    return g.drop(columns="PV")
+
+
+def _last_day_positions(f_ini, f_fin_next, activo):
+    """Referencia directa sobre la tabla diaria: posiciones del último día del rango, por activo lógico."""
+    h = HIS[(HIS["REGISTRO_CONTROL"] >= f_ini) & (HIS["REGISTRO_CONTROL"] < f_fin_next)]
+    h = h[h["REGISTRO_CONTROL"].dt.normalize() == h["REGISTRO_CONTROL"].dt.normalize().max()]
+    h = h.merge(EMISORAS[["ID_EMISORA", "ID_TIPO_ACTIVO", "NOMBRE_EMISORA"]], on="ID_EMISORA")
+    logico = np.where(h["ID_PRODUCTO"].isin([144, 149]), 2, h["ID_TIPO_ACTIVO"])
+    h = h[logico == activo]
+    return h.groupby(["ID_PRODUCTO", "ID_EMISORA"])["VALOR_REAL"].sum()
+
+
+@pytest.fixture
+def cube():
+    facts = []
+
+    def facts_counted(*args):
+        facts.append(args)
+        return _position_facts(*args)
+
+    ns = sql_replay.app_namespace(
+        ["query_snapshot_deuda", "query_snapshot_deuda_multi", "rv_snapshot_por_producto",
+         "hist_trimestral_papel_instrumento", "rv_emisora_por_mes", "position_cube"],
+        {"_position_facts": facts_counted, "dim_emisoras": lambda: EMISORAS,
+         "POS_CUBE_START": pd.Timestamp("2023-10-01"),
+         "tasas_ref_asof": lambda ids, fechas: pd.DataFrame({"TASA_BASE": np.nan, "TASA_REF_NAME": None},
+                                                            index=ids.index)},
+    )
+    ns["position_cube"] = functools.cache(ns["position_cube"])   # st.cache_resource en la app
+    ns["facts"] = facts
+    return ns
+
+
+@pytest.mark.parametrize("f_ini, f_fin_next", [
+    ("2024-02-01", "2024-03-01"),   # febrero cierra el 27
+    ("2023-12-01", "2024-01-01"),   # sin la emisora 3
+    ("2024-03-01", "2024-03-16"),   # corte a media quincena
+    ("2024-01-01", "2024-01-20"),   # último día de los dos contratos
+])
+def test_snapshots_match_last_day_positions(cube, f_ini, f_fin_next):
+    f_ini, f_fin_next = pd.Timestamp(f_ini), pd.Timestamp(f_fin_next)
+    deuda = cube["query_snapshot_deuda"]("A", f_ini, f_fin_next)
+    got = deuda.groupby(["ID_PRODUCTO", "ID_EMISORA"])["VALOR_REAL"].sum()
+    pd.testing.assert_series_equal(got, _last_day_positions(f_ini, f_fin_next, 1), check_dtype=False)
+    assert list(deuda.columns) == cube["SNAP_DEUDA_COLS"]
+    assert deuda["VALOR_REAL"].is_monotonic_decreasing
+    assert (deuda["DIAS_X_V"] == (deuda["FECHA_VTO_EM"] - deuda["FECHA_CORTE"]).dt.days).all()
+
+    rv = cube["rv_snapshot_por_producto"]("A", f_ini, f_fin_next)
+    want = _last_day_positions(f_ini, f_fin_next, 2)
+    assert sorted(rv["MONTO"]) == pytest.approx(sorted(want))
+    assert set(rv["ID_PRODUCTO"]) == {20, 144}   # el reporto de RV cuenta como RV
+
+
+def test_multi_month_snapshot_is_each_month_close(cube):
+    multi = cube["query_snapshot_deuda_multi"]("A", pd.Timestamp("2023-10-01"), pd.Timestamp("2024-03-16"))
+    assert multi["MES"].is_monotonic_increasing
+    for mes, g in multi.groupby("MES"):
+        f_fin = mes + pd.offsets.MonthBegin(1)
+        want = _last_day_positions(mes, min(f_fin, pd.Timestamp("2024-03-16")), 1)
+        got = g.groupby(["ID_PRODUCTO", "ID_EMISORA"])["VALOR_REAL"].sum()
+        pd.testing.assert_series_equal(got, want, check_dtype=False)
+    assert not isinstance(multi["NOMBRE_EMISORA"].dtype, pd.CategoricalDtype)
+
+
+def test_rv_by_month_and_quarterly_mix(cube):
+    rv = cube["rv_emisora_por_mes"]("A", pd.Timestamp("2024-03-15"), n=3)
+    assert sorted(rv["MES"].unique()) == list(pd.to_datetime(["2024-01-01", "2024-02-01", "2024-03-01"]))
+    assert (rv.groupby("MES")["MONTO"].sum() == rv.groupby("MES")["TOT_RV"].first()).all()
+    feb = rv[rv["MES"] == "2024-02-01"].set_index("NOMBRE_EMISORA")["MONTO"]
+    want = _last_day_positions(pd.Timestamp("2024-02-01"), pd.Timestamp("2024-03-01"), 2)
+    assert feb.to_dict() == pytest.approx({"WALMEX": want[20, 4], "REPO RV": want[144, 5]})
+
+    papel, instr = cube["hist_trimestral_papel_instrumento"]("A", 1, pd.Timestamp("2024-03-16"))
+    assert list(papel["PERIODO"].unique()) == ["2023-Q4", "2024-Q1"]
+    assert papel.groupby("PERIODO")["Pct"].sum().round(9).eq(100).all()
+    assert instr.groupby("PERIODO")["Pct"].sum().round(9).eq(100).all()
+    assert "Reporto" not in set(papel["TIPO_PAPEL"])   # el reporto de RV no entra en deuda
+
+
+def test_views_share_one_cube(cube):
+    cut = pd.Timestamp("2024-03-16")
+    cube["query_snapshot_deuda"]("A", pd.Timestamp("2024-03-01"), cut, (501, 502))
+    cube["query_snapshot_deuda_multi"]("A", pd.Timestamp("2023-04-01"), cut, (501, 502))
+    cube["rv_snapshot_por_producto"]("A", pd.Timestamp("2024-03-01"), cut, (501, 502))
+    cube["hist_trimestral_papel_instrumento"]("A", 2, cut, (501, 502))
+    cube["rv_emisora_por_mes"]("A", pd.Timestamp("2024-02-29"), 12, (501, 502))   # otro corte: otro cubo
+    assert cube["facts"] == [("A", pd.Timestamp("2023-10-01"), cut, (501, 502)),
+                             ("A", pd.Timestamp("2023-10-01"), pd.Timestamp("2024-03-01"), (501, 502))]
+
+
+def test_unknown_emisora_dropped_and_empty_ranges(cube):
+    full = cube["position_cube"]("A", pd.Timestamp("2023-10-01"), pd.Timestamp("2024-03-16"))
+    assert 99 not in set(full["ID_EMISORA"])
+    assert cube["_cube_last_cut"](full, pd.Timestamp("2025-01-01"), pd.Timestamp("2025-02-01")).empty
+    assert cube["query_snapshot_deuda"]("A", pd.Timestamp("2023-01-01"), pd.Timestamp("2023-02-01")).empty
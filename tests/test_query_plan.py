@@ -0,0 +1,80 @@
+import sys
+import threading
+import time
+from types import ModuleType
+
+import pytest
+
+import sql_replay
+
+
+@pytest.fixture
+def plan_ns(monkeypatch):
+    # run_query_plan importa el contexto de Streamlit al correr; aquí solo se registra a qué hilos se pasa
+    ctx = object()
+    attached = {}
+    scriptrunner = ModuleType("streamlit.runtime.scriptrunner")
+    scriptrunner.get_script_run_ctx = lambda: ctx
+    scriptrunner.add_script_run_ctx = lambda thread, c: attached.__setitem__(thread.name, c)
+    ns = sql_replay.app_namespace(["run_query_plan"], {
+        "perf_record": lambda *a, **k: None,
+        "REPORT_QUERY_WORKERS": 4,
+        "ORA_ASYNC": False,
+    })
+    for name in ("streamlit", "streamlit.runtime"):
+        monkeypatch.setitem(sys.modules, name, sys.modules.get(name) or ModuleType(name))
+    monkeypatch.setitem(sys.modules, "streamlit.runtime.scriptrunner", scriptrunner)
+    ns["ctx"], ns["attached"] = ctx, attached
+    return ns
+
+
+def test_dependencies_get_results_as_kwargs(plan_ns):
+    seen = []
+
+    def mes(base, tasas):
+        seen.append((base, tasas))
+        return base + tasas
+
+    plan = {
+        "mes": (mes, ["base", "tasas"]),
+        "base": (lambda: 10, []),
+        "tasas": (lambda: 5, []),
+        "total": (lambda mes, base: mes * base, ["mes", "base"]),
+    }
+    assert plan_ns["run_query_plan"](plan) == {"base": 10, "tasas": 5, "mes": 15, "total": 150}
+    assert seen == [(10, 5)]
+    assert set(plan_ns["attached"].values()) == {plan_ns["ctx"]}
+    assert all(n.startswith("report-query") for n in plan_ns["attached"])
+
+
+def test_independent_tasks_run_in_parallel(plan_ns):
+    barrier = threading.Barrier(3, timeout=5)   # solo pasa si las tres corren a la vez
+
+    def q(i):
+        return lambda: (barrier.wait(), i)[1]
+
+    plan = {f"q{i}": (q(i), []) for i in range(3)}
+    assert plan_ns["run_query_plan"](plan, max_workers=3) == {"q0": 0, "q1": 1, "q2": 2}
+
+
+def test_failure_stops_dependents(plan_ns):
+    ran = []
+
+    def falla():
+        raise RuntimeError("ORA-01013")
+
+    plan = {
+        "falla": (falla, []),
+        "lenta": (lambda: (time.sleep(0.05), ran.append("lenta"))[1], []),
+        "hija": (lambda falla: ran.append("hija"), ["falla"]),
+    }
+    with pytest.raises(RuntimeError, match="ORA-01013"):
+        plan_ns["run_query_plan"](plan)
+    assert "hija" not in ran
+
+
+def test_plan_errors(plan_ns):
+    with pytest.raises(KeyError, match="tasas"):
+        plan_ns["run_query_plan"]({"mes": (lambda tasas: tasas, ["tasas"])})
+    with pytest.raises(RuntimeError, match="ciclo"):
+        plan_ns["run_query_plan"]({"a": (lambda b: b, ["b"]), "b": (lambda a: a, ["a"]), "c": (lambda: 1, [])})
@@ -0,0 +1,142 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sql_replay
+
+PRODUCTOS = pd.DataFrame({"ID_PRODUCTO": [10, 20], "PRODUCTO": ["DEUDA CP", "RENTA VARIABLE"]})
+
+
+def _view(nivel_rows):
+    """V_RENDIMIENTO_CTO / _PROD sintéticas: 2017-01 a 2024-06, varios registros por mes."""
+    rng = np.random.default_rng(7)
+    rows = []
+    for anio, mes in itertools.product(range(2017, 2025), range(1, 13)):
+        if (anio, mes) > (2024, 6):
+            break
+        for nivel, id_prod in nivel_rows:
+            for _ in range(2):   # duplicados: el histórico se queda con el último del mes
+                t = rng.uniform(1, 12)
+                rows.append({
+                    "ANIO": anio, "MES": mes, "NIVEL": nivel, "ID_PRODUCTO": id_prod,
+                    "NIVEL_PRODUCTO": "SI" if nivel == "PRODUCTO" else "NO",
+                    "TASA": f"{t:.4f}%", "TASA_ACUMULADO": round(t / 100, 6),
+                    "TASA_EFECTIVA": f"{t / 12:.4f}", "TASA_EFECTIVA_ACUMULADO": round(t / 50, 6),
+                    "PLAZO": 30, "PLAZO_ACUMULADO": 30 * mes,
+                })
+    return pd.DataFrame(rows)
+
+
+CTO = _view([("CONTRATO", None), ("PRODUCTO", 10), ("PRODUCTO", 20)])
+PROD = _view([("PRODUCTO", 10), ("PRODUCTO", 20)]).drop(columns=["NIVEL", "NIVEL_PRODUCTO"])
+
+
+@pytest.fixture
+def rend():
+    calls = {"cto": [], "prod": []}
+
+    def loader(kind, view):
+        def window(alias, anio, mes, n_years, contratos_key=None):
+            calls[kind].append((alias, anio, mes, n_years, contratos_key))
+            start, end = ns["_rend_window"](anio, mes, n_years)
+            return _between(view, start, end)
+        return window
+
+    ns = sql_replay.app_namespace(
+        ["rend_bruto_contrato_hist_12m", "rend_bruto_producto_hist_12m", "rend_bruto_contrato_hist_n_years",
+         "rend_bruto_producto_hist_n_years", "rend_bruto_contrato_y_producto"],
+        {"rend_cto_window": loader("cto", CTO), "rend_prod_window": loader("prod", PROD),
+         "map_productos": lambda: PRODUCTOS, "_col_exists": lambda owner, table, col: col != "DESCRIPCION_PRODUCTO"},
+    )
+    ns["calls"] = calls
+    return ns
+
+
+def _between(df, start, end):
+    fecha = pd.to_datetime(dict(year=df["ANIO"], month=df["MES"], day=1))
+    return df[(fecha >= start) & (fecha <= end)].reset_index(drop=True)
+
+
+def _last_per_month(df, keys, to_dec):
+    df = df.sort_values(keys).groupby(keys, as_index=False).last()
+    for out, col in [("TASA_M_ANUAL", "TASA"), ("TASA_ACUM_ANUAL", "TASA_ACUMULADO"),
+                     ("TASA_M_EFEC", "TASA_EFECTIVA"), ("TASA_ACUM_EFEC", "TASA_EFECTIVA_ACUMULADO")]:
+        df[out] = df[col].apply(to_dec)
+    return df
+
+
+def _ref_cto(rend, start, end):
+    """Lo que regresaba la consulta propia de cada histórico (NIVEL = 'CONTRATO' en el WHERE)."""
+    df = _between(CTO[CTO["NIVEL"] == "CONTRATO"], start, end)
+    df = _last_per_month(df, ["ANIO", "MES"], rend["_to_dec"])
+    return df[["ANIO", "MES", "TASA_M_ANUAL", "TASA_ACUM_ANUAL", "TASA_M_EFEC", "TASA_ACUM_EFEC"]]
+
+
+def _ref_prod(rend, start, end):
+    df = _between(PROD, start, end).merge(PRODUCTOS, on="ID_PRODUCTO", how="left")
+    df = _last_per_month(df, ["ANIO", "MES", "ID_PRODUCTO", "PRODUCTO"], rend["_to_dec"])
+    return df[["ANIO", "MES", "ID_PRODUCTO", "PRODUCTO", "TASA_M_ANUAL", "TASA_ACUM_ANUAL", "TASA_M_EFEC", "TASA_ACUM_EFEC"]]
+
+
+def _eq(got, want):
+    pd.testing.assert_frame_equal(got.reset_index(drop=True), want.reset_index(drop=True))
+
+
+@pytest.mark.parametrize("anio, mes", [(2024, 3), (2024, 1), (2023, 12), (2024, 6)])
+def test_12m_matches_own_query(rend, anio, mes):
+    ref = pd.Timestamp(year=anio, month=mes, day=1)
+    start, end = ref - pd.DateOffset(months=11), ref + pd.offsets.MonthEnd(0)
+    _eq(rend["rend_bruto_contrato_hist_12m"]("A", anio, mes), _ref_cto(rend, start, end))
+    _eq(rend["rend_bruto_producto_hist_12m"]("A", anio, mes), _ref_prod(rend, start, end))
+    assert len(rend["rend_bruto_contrato_hist_12m"]("A", anio, mes)) == 12
+
+
+@pytest.mark.parametrize("n_years", [1, 3, 5, 7])
+def test_n_years_matches_own_query(rend, n_years):
+    start = pd.Timestamp(year=2024 - (n_years - 1), month=1, day=1)
+    end = pd.Timestamp("2024-03-31")
+    _eq(rend["rend_bruto_contrato_hist_n_years"]("A", 2024, 3, n_years), _ref_cto(rend, start, end))
+    _eq(rend["rend_bruto_producto_hist_n_years"]("A", 2024, 3, n_years), _ref_prod(rend, start, end))
+
+
+def test_views_share_one_window_per_level(rend):
+    key = (101, 102)
+    rend["rend_bruto_contrato_hist_12m"]("A", 2024, 3, key)
+    rend["rend_bruto_contrato_hist_n_years"]("A", 2024, 3, 5, key)
+    rend["rend_bruto_contrato_y_producto"]("A", 2024, 3, key)
+    rend["rend_bruto_producto_hist_12m"]("A", 2024, 3, key)
+    rend["rend_bruto_producto_hist_n_years"]("A", 2024, 3, 3, key)
+    # mismos argumentos en cada llamada: st.cache_data / result_cache la resuelven con una consulta
+    assert set(rend["calls"]["cto"]) == {("A", 2024, 3, rend["REND_HIST_YEARS"], key)}
+    assert set(rend["calls"]["prod"]) == {("A", 2024, 3, rend["REND_HIST_YEARS"], key)}
+
+
+def test_cutoff_month_slice(rend):
+    cto_m, cto_ytd, prod = rend["rend_bruto_contrato_y_producto"]("A", 2024, 3)
+    row = CTO[(CTO["ANIO"] == 2024) & (CTO["MES"] == 3) & (CTO["NIVEL"] == "CONTRATO")].iloc[0]
+    tef = rend["_to_dec"](row["TASA_EFECTIVA"])
+    assert cto_m == pytest.approx((1 + tef) ** (360 / 30) - 1)
+    assert sorted(prod["Producto"]) == ["DEUDA CP", "RENTA VARIABLE"]
+    # producto: último registro del mes, TASA_EFECTIVA anualizada a su PLAZO, en %
+    deuda = CTO[(CTO["ANIO"] == 2024) & (CTO["MES"] == 3) & (CTO["ID_PRODUCTO"] == 10)].iloc[-1]
+    tef = rend["_to_dec"](deuda["TASA_EFECTIVA"])
+    want = round(((1 + tef) ** (360 / 30) - 1) * 100, 2)
+    assert prod.set_index("Producto").loc["DEUDA CP", "Mensual Anualizado"] == pytest.approx(want)
+
+
+def test_rend_slice_bounds(rend):
+    df = pd.DataFrame({"ANIO": ["2023", "2023", "2024", "2024", None],
+                       "MES": ["3", "4", "3", "4", "1"]})
+    got = rend["_rend_slice"](df, pd.Timestamp("2023-04-01"), pd.Timestamp("2024-03-31"))
+    assert got.index.tolist() == [1, 2]
+    assert rend["_rend_window"](2024, 3, 5) == (pd.Timestamp("2020-01-01"), pd.Timestamp("2024-03-31"))
+
+
+def test_empty_window(rend):
+    empty = CTO.iloc[:0]
+    assert list(rend["_rend_cto_hist"](empty).columns) == ["ANIO", "MES", "TASA_M_ANUAL", "TASA_ACUM_ANUAL",
+                                                          "TASA_M_EFEC", "TASA_ACUM_EFEC"]
+    assert rend["_rend_prod_hist"](PROD.iloc[:0]).empty
+    assert rend["_rend_cto_hist"](CTO[CTO["NIVEL"] == "PRODUCTO"]).empty
@@ -0,0 +1,149 @@
+import os
+import time
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import result_cache as rc
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(rc, "RESULT_CACHE_DIR", tmp_path / "rc")
+    monkeypatch.setattr(rc, "ENABLED", True)
+    monkeypatch.setattr(rc, "OPEN_MONTH_TTL", 600)
+    monkeypatch.setattr(rc, "CLOSE_GRACE_DAYS", 5)
+    monkeypatch.setattr(rc, "SCHEMA_VERSION", "")
+    monkeypatch.setattr(rc, "MAX_BYTES", 0)
+    monkeypatch.setattr(rc, "MAX_AGE_DAYS", 0)
+    monkeypatch.setattr(rc, "EVICT_INTERVAL", 10**9)
+    monkeypatch.setattr(rc, "_last_evict", time.time())
+    monkeypatch.setattr(rc, "STATS", dict.fromkeys(rc.STATS, 0))
+    return tmp_path / "rc"
+
+
+@pytest.mark.parametrize("last_day, today, grace, closed", [
+    ("2024-01-31", "2024-02-05", 5, False),   # dentro de la gracia: cargas tardías del 31
+    ("2024-01-31", "2024-02-06", 5, True),
+    ("2024-01-10", "2024-02-06", 5, True),    # cuenta el fin de mes, no el día
+    ("2024-01-31", "2024-02-01", 0, True),
+    ("2024-01-31", "2024-01-31", 0, False),
+    ("2024-02-29", "2024-03-05", 5, False),   # bisiesto
+    ("2023-12-31", "2024-01-06", 5, True),    # cambio de año
+])
+def test_is_closed(monkeypatch, last_day, today, grace, closed):
+    monkeypatch.setattr(rc, "CLOSE_GRACE_DAYS", grace)
+    assert rc.is_closed(pd.Timestamp(last_day), today=date.fromisoformat(today)) is closed
+
+
+def _counter(name="q", last="2020-01-31", deps=()):
+    calls = []
+
+    @rc.persist(name, last_day=lambda a: pd.Timestamp(last), deps=deps)
+    def q(alias, n=1):
+        calls.append(alias)
+        return pd.DataFrame({"alias": [alias] * n})
+
+    return q, calls
+
+
+def test_persist_hit_after_miss(cache):
+    q, calls = _counter()
+    first = q("A", n=2)
+    pd.testing.assert_frame_equal(q("A", 2), first)
+    assert calls == ["A"]
+    q("B", n=2)
+    assert calls == ["A", "B"]
+    assert rc.STATS["hits"] == 1 and rc.STATS["misses"] == 2
+
+
+def test_open_entry_expires_closed_does_not(cache, monkeypatch):
+    q_open, open_calls = _counter("open", last=str(date.today()))
+    q_closed, closed_calls = _counter("closed")
+    q_open("A")
+    q_closed("A")
+    monkeypatch.setattr(rc, "OPEN_MONTH_TTL", -1)
+    q_open("A")
+    q_closed("A")
+    assert open_calls == ["A", "A"]
+    assert closed_calls == ["A"]
+
+
+def test_key_changes_with_sql_code_and_schema(cache, monkeypatch):
+    def dep_v1(col):
+        return f"{col} >= :d"
+
+    def dep_v2(col):
+        return f"{col} >= TRUNC(:d)"
+
+    q1, calls1 = _counter(deps=(dep_v1,))
+    q1("A")
+    q1("A")
+    q2, calls2 = _counter(deps=(dep_v2,))   # mismo nombre y parámetros, otro SQL
+    q2("A")
+    assert calls1 == ["A"] and calls2 == ["A"]
+
+    monkeypatch.setattr(rc, "SCHEMA_VERSION", "vistas-2")
+    q1("A")
+    assert calls1 == ["A", "A"]
+
+
+def _entries(root):
+    return sorted(p.stem for p in root.glob("*/*.json"))
+
+
+def test_evict_by_age_includes_closed_entries(cache, monkeypatch):
+    q, _ = _counter()
+    q("viejo")
+    q("nuevo")
+    old = next(p for p in cache.glob("q/*.json") if "viejo" in pd.read_parquet(p.with_suffix(".0.parquet"))["alias"].iloc[0])
+    past = time.time() - 100 * 86400
+    os.utime(old, (past, past))
+    monkeypatch.setattr(rc, "MAX_AGE_DAYS", 90)
+    assert rc.evict() == 1
+    assert not old.exists() and not old.with_suffix(".0.parquet").exists()
+    assert len(_entries(cache)) == 1
+    assert rc.STATS["evicted"] == 1
+
+
+def test_evict_by_size_is_lru(cache, monkeypatch):
+    q, calls = _counter()
+    now = time.time()
+    for k, alias in enumerate(["a", "b", "c"]):
+        q(alias, n=200)
+        meta = max(cache.glob("q/*.json"), key=lambda p: p.stat().st_mtime_ns)
+        os.utime(meta, (now - 300 + k, now - 300 + k))
+    q("a", n=200)   # hit: "a" pasa a ser la más reciente
+    sizes = {p.stem: p.stat().st_size for p in cache.glob("q/*.parquet")}
+    monkeypatch.setattr(rc, "MAX_BYTES", int(sum(sizes.values()) * 0.75))
+    assert rc.evict() == 1
+    calls.clear()
+    q("a", n=200)
+    q("c", n=200)
+    q("b", n=200)
+    assert calls == ["b"]
+
+
+def test_evict_removes_stale_orphans(cache):
+    q, _ = _counter()
+    q("A")
+    d = cache / "q"
+    orphan = d / "0123456789abcdef0123.0.parquet"
+    tmp = d / "x.json.1.2.tmp"
+    for p in (orphan, tmp):
+        p.write_bytes(b"x")
+        past = time.time() - 7200
+        os.utime(p, (past, past))
+    assert rc.evict() == 0
+    assert not orphan.exists() and not tmp.exists()
+    assert len(_entries(cache)) == 1
+
+
+def test_save_triggers_eviction(cache, monkeypatch):
+    monkeypatch.setattr(rc, "EVICT_INTERVAL", 0)
+    monkeypatch.setattr(rc, "MAX_BYTES", 1)
+    q, calls = _counter()
+    q("A")
+    q("A")
+    assert calls == ["A", "A"]   # cada escritura deja el directorio arriba del tope y se expulsa
@@ -0,0 +1,62 @@
+import functools
+
+import pandas as pd
+import pytest
+
+import sql_replay
+
+# lo que regresaría ALL_TAB_COLUMNS para SIAPII (DATA_TYPE con espacios como en CHAR)
+ALL_TAB_COLUMNS = pd.DataFrame([
+    ("SIAPII", "V_RENDIMIENTO_CTO", "ID_PRODUCTO", "NUMBER"),
+    ("SIAPII", "V_RENDIMIENTO_PROD", "NIVEL_PRODUCTO", "VARCHAR2 "),
+    ("SIAPII", "V_TASAS_REFERENCIA", "FECHA", "date"),
+    ("SIAPII", "V_M_CONTRATO_CDM", "ID_CDM", "NUMBER"),
+    ("OTRO", "T_AUX", "FECHA", "TIMESTAMP(6)"),
+], columns=["OWNER", "TABLE_NAME", "COLUMN_NAME", "DATA_TYPE"])
+
+
+@pytest.fixture
+def catalog():
+    calls = []
+
+    def run_sql(sql, params=None):
+        calls.append(params)
+        df = ALL_TAB_COLUMNS[ALL_TAB_COLUMNS["OWNER"] == params["o"]]
+        if "c" in params:
+            df = df[(df["TABLE_NAME"] == params["t"]) & (df["COLUMN_NAME"] == params["c"])]
+            return df[["DATA_TYPE"]].reset_index(drop=True)
+        tables = {v for k, v in params.items() if k != "o"}
+        return df[df["TABLE_NAME"].isin(tables)][["TABLE_NAME", "COLUMN_NAME", "DATA_TYPE"]]
+
+    ns = sql_replay.app_namespace(["_col_exists", "schema_catalog"], {"run_sql": run_sql})
+    ns["schema_catalog"] = functools.cache(ns["schema_catalog"])   # st.cache_resource en la app
+    ns["calls"] = calls
+    return ns
+
+
+def test_catalog_views_cost_one_query(catalog):
+    checks = [
+        ("SIAPII", "V_RENDIMIENTO_CTO", "ID_PRODUCTO", True),
+        ("siapii", "v_rendimiento_cto", "descripcion_producto", False),
+        ("SIAPII", "V_RENDIMIENTO_PROD", "NIVEL_PRODUCTO", True),
+        ("SIAPII", "V_M_CONTRATO_CDM", "ID_CDM", True),
+        ("SIAPII", "V_RENDIMIENTO_PROD", "ID_CDM", False),
+    ]
+    for owner, table, col, exists in checks:
+        assert catalog["_col_exists"](owner, table, col) is exists
+    assert catalog["_col_type"]("SIAPII", "V_TASAS_REFERENCIA", "fecha") == "DATE"
+    assert catalog["_col_type"]("SIAPII", "V_RENDIMIENTO_PROD", "NIVEL_PRODUCTO") == "VARCHAR2"
+    assert len(catalog["calls"]) == 1
+    binds = catalog["calls"][0]
+    assert binds["o"] == "SIAPII"
+    assert sorted(v for k, v in binds.items() if k != "o") == sorted(catalog["SCHEMA_VIEWS"])
+
+
+def test_outside_catalog_falls_back_to_query(catalog):
+    assert catalog["_col_type"]("otro", "t_aux", "fecha") == "TIMESTAMP(6)"
+    assert catalog["_col_exists"]("OTRO", "T_AUX", "NADA") is False
+    assert catalog["calls"] == [{"o": "OTRO", "t": "T_AUX", "c": "FECHA"},
+                                {"o": "OTRO", "t": "T_AUX", "c": "NADA"}]
+    # misma vista pero de otro owner: no la resuelve el catálogo de SIAPII
+    assert catalog["_col_exists"]("OTRO", "V_RENDIMIENTO_CTO", "ID_PRODUCTO") is False
+    assert len(catalog["calls"]) == 3
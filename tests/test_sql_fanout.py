@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import sql_replay
+
+
+class FakeAsyncDB:
+    """read_sql_many de AsyncOracle: registra cada despacho; 'FALLA' en el SQL simula un error de esa consulta."""
+
+    def __init__(self):
+        self.calls = []
+
+    def read_sql_many(self, queries, timeout=None, return_exceptions=False):
+        self.calls.append(dict(queries))
+        out = {}
+        for name, (sql, params) in queries.items():
+            err = RuntimeError(f"ORA-00942: {sql}") if "FALLA" in sql else None
+            if err is not None and not return_exceptions:
+                raise err
+            out[name] = err or pd.DataFrame({"SQL": [sql], "P": [(params or {}).get("p")]})
+        return out
+
+
+@pytest.fixture
+def fanout_cls():
+    return sql_replay.app_namespace(["SqlFanOut"], {"perf_record": lambda *a, **k: None})["SqlFanOut"]
+
+
+def _concurrent(fan, queries):
+    results, barrier = {}, threading.Barrier(len(queries))
+
+    def worker(name, sql):
+        barrier.wait()
+        try:
+            results[name] = fan.read_sql(sql, {"p": name})
+        except Exception as e:
+            results[name] = e
+
+    threads = [threading.Thread(target=worker, args=q) for q in queries]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_concurrent_queries_go_out_in_one_batch(fanout_cls):
+    db = FakeAsyncDB()
+    fan = fanout_cls(db, window_s=0.2)
+    res = _concurrent(fan, [(f"q{i}", f"SELECT {i} FROM DUAL") for i in range(5)])
+    assert len(db.calls) == 1 and len(db.calls[0]) == 5
+    assert fan.batches == [5]
+    for i in range(5):
+        assert res[f"q{i}"]["SQL"].iloc[0] == f"SELECT {i} FROM DUAL"
+        assert res[f"q{i}"]["P"].iloc[0] == f"q{i}"
+
+
+def test_error_only_reaches_its_caller(fanout_cls):
+    db = FakeAsyncDB()
+    fan = fanout_cls(db, window_s=0.2)
+    res = _concurrent(fan, [("ok", "SELECT 1 FROM DUAL"), ("bad", "SELECT FALLA FROM DUAL")])
+    assert len(db.calls) == 1
+    assert isinstance(res["bad"], RuntimeError) and "FALLA" in str(res["bad"])
+    assert res["ok"]["SQL"].iloc[0] == "SELECT 1 FROM DUAL"
+
+
+def test_sequential_queries_open_new_windows(fanout_cls):
+    db = FakeAsyncDB()
+    fan = fanout_cls(db, window_s=0.001)
+    fan.read_sql("SELECT 1 FROM DUAL")
+    time.sleep(0.01)
+    fan.read_sql("SELECT 2 FROM DUAL")
+    assert fan.batches == [1, 1]
@@ -0,0 +1,104 @@
+import ast
+import sys
+from pathlib import Path
+
+import pytest
+
+import sql_replay
+
+APP = Path(sql_replay.LINT_APP)
+
+
+@pytest.fixture(scope="module")
+def built():
+    return sql_replay.builder_sql(APP)
+
+
+@pytest.mark.parametrize("name", [name for name, _ in sql_replay.LINT_CALLS])
+def test_builder_sql_is_sargable(built, name):
+    assert built[name], f"{name} no generó SQL"
+    for sql in built[name]:
+        assert sql_replay.non_sargable(sql) == [], sql
+
+
+def _oracle_builders() -> set:
+    """Funciones de app.py que arman un SELECT y lo mandan a run_sql."""
+    out = set()
+    for node in ast.parse(APP.read_text(encoding="utf-8")).body:
+        if not isinstance(node, ast.FunctionDef):
+            continue
+        nodes = list(ast.walk(node))
+        has_select = any(isinstance(n, ast.Constant) and isinstance(n.value, str) and "SELECT" in n.value.upper()
+                         for n in nodes)
+        calls_run_sql = any(isinstance(n, ast.Call) and getattr(n.func, "id", None) == "run_sql" for n in nodes)
+        if has_select and calls_run_sql:
+            out.add(node.name)
+    return out
+
+
+def test_lint_calls_reach_every_builder():
+    reached = set()
+
+    def on_sql(sql):
+        f = sys._getframe(1)
+        while f is not None:
+            if Path(f.f_code.co_filename) == APP:
+                reached.add(f.f_code.co_name)
+            f = f.f_back
+
+    sql_replay.builder_sql(APP, on_sql=on_sql)
+    builders = _oracle_builders()
+    assert builders, "no se encontraron constructores en app.py"
+    assert builders <= reached, f"sin cubrir en LINT_CALLS: {sorted(builders - reached)}"
+
+
+@pytest.mark.parametrize("sql, expected", [
+    # el predicado sigue después de la subconsulta del filtro de contratos
+    ("SELECT 1 FROM T e WHERE e.ID IN (SELECT COLUMN_VALUE FROM TABLE(:x))"
+     " AND TRUNC(e.FECHA_ESTADISTICA) >= TO_DATE(:a,'YYYY-MM-DD')", ["TRUNC(e.FECHA_ESTADISTICA)"]),
+    ("SELECT 1 FROM T e WHERE EXISTS (SELECT 1 FROM U c WHERE c.ID = e.ID)"
+     " AND NVL(e.REGISTRO_CONTROL, SYSDATE) < :d", ["NVL(e.REGISTRO_CONTROL, SYSDATE)"]),
+    ("SELECT 1 FROM T e WHERE ADD_MONTHS(e.FECHA, 12) >= :d", ["ADD_MONTHS(e.FECHA, 12)"]),
+    ("SELECT 1 FROM T e WHERE (e.A = 1 OR LAST_DAY(e.FECHA) = :d)", ["LAST_DAY(e.FECHA)"]),
+    ("SELECT 1 FROM T e WHERE EXTRACT(YEAR FROM e.FECHA) = 2024", ["EXTRACT(YEAR FROM e.FECHA)"]),
+    ("SELECT 1 FROM T e JOIN U u ON TRUNC(u.FECHA, 'MM') = e.X WHERE 1 = 1", ["TRUNC(u.FECHA, 'MM')"]),
+    ("SELECT 1 FROM T r WHERE :y = '2024' || r.ANIO", ["|| r.ANIO"]),
+    ("SELECT 1 FROM T r WHERE TRUNC(TO_DATE(r.ANIO || '-01-01')) >= :d", ["TRUNC(TO_DATE(r.ANIO || '-01-01'))"]),
+    # sargables: funciones fuera del WHERE, sobre binds, en comentarios o literales
+    ("SELECT EXTRACT(YEAR FROM TRUNC(e.FECHA)) FROM T e WHERE e.FECHA >= TO_DATE(:d, 'YYYY-MM-DD')"
+     " GROUP BY EXTRACT(YEAR FROM TRUNC(e.FECHA))", []),
+    ("SELECT 1 FROM T e /* TRUNC(e.FECHA) */ WHERE e.NOMBRE = 'TRUNC(e.FECHA)' AND e.FECHA < :d + 1", []),
+    ("SELECT 1 FROM (SELECT TRUNC(h.FECHA) F FROM T h WHERE h.A = 1) q WHERE q.B = 2", []),
+    ("SELECT 1 FROM T r WHERE r.ANIO BETWEEN :y0 AND :y1 AND r.ANIO * 100 + r.MES BETWEEN :a AND :b", []),
+])
+def test_non_sargable(sql, expected):
+    assert sql_replay.non_sargable(sql) == expected
+
+
+@pytest.fixture
+def app_with_trunc(tmp_path):
+    """Copia de app.py con un TRUNC(col) después del filtro de contratos de aa_hist_ultimo_5_anios."""
+    src = APP.read_text(encoding="utf-8")
+    anchor = "        {filtro_contratos}\n        {filtro_fecha}\n"
+    assert anchor in src
+    bad = src.replace(anchor, "        {filtro_contratos}\n"
+                              "        AND TRUNC(e.FECHA_ESTADISTICA) >= TO_DATE(:aah_ini,'YYYY-MM-DD')\n"
+                              "        {filtro_fecha}\n", 1)
+    path = tmp_path / "app.py"
+    path.write_text(bad, encoding="utf-8")
+    return path
+
+
+def test_builder_with_trunc_is_flagged(app_with_trunc):
+    built = sql_replay.builder_sql(app_with_trunc)
+    hits = [h for sql in built["aa_hist_ultimo_5_anios"] for h in sql_replay.non_sargable(sql)]
+    assert hits == ["TRUNC(e.FECHA_ESTADISTICA)"]
+    others = [n for n, sqls in built.items() if n != "aa_hist_ultimo_5_anios" and any(map(sql_replay.non_sargable, sqls))]
+    assert others == []
+
+
+def test_cmd_lint_exit_code(app_with_trunc, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(sql_replay, "SQL_REPLAY_DIR", tmp_path / "sin_grabacion")
+    assert sql_replay._cmd_lint(APP) == 0
+    assert sql_replay._cmd_lint(app_with_trunc) == 1
+    assert "TRUNC(e.FECHA_ESTADISTICA)" in capsys.readouterr().out
@@ -0,0 +1,84 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sql_replay
+
+
+@pytest.fixture
+def replay_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(sql_replay, "MODE", "live")
+    monkeypatch.setattr(sql_replay, "SQL_REPLAY_DIR", tmp_path / "replay")
+    monkeypatch.setattr(sql_replay, "STATS", dict.fromkeys(sql_replay.STATS, 0))
+    return tmp_path / "replay"
+
+
+def _fetch(df, calls):
+    def fetch():
+        calls.append(1)
+        return df
+    return fetch
+
+
+SQL = """
+    SELECT ANIO, MES, TASA
+    FROM SIAPII.V_RENDIMIENTO_CTO
+    WHERE ALIAS_CDM = :alias
+"""
+
+
+def test_record_then_replay(replay_dir, monkeypatch):
+    df = pd.DataFrame({"ANIO": [2024, 2024], "MES": [1, 2], "TASA": [0.051, None],
+                       "FECHA": pd.to_datetime(["2024-01-31", "2024-02-29"])})
+    calls = []
+    monkeypatch.setattr(sql_replay, "MODE", "record")
+    sql_replay.through("ora", SQL, {"alias": "A", "d": pd.Timestamp("2024-01-01")}, _fetch(df, calls))
+
+    monkeypatch.setattr(sql_replay, "MODE", "replay")
+    # mismo SQL con otro espaciado y la fecha como datetime: misma llave
+    got = sql_replay.through("ora", " ".join(SQL.split()), {"alias": "A", "d": datetime(2024, 1, 1)},
+                             _fetch(None, calls))
+    pd.testing.assert_frame_equal(got, df)
+    assert calls == [1]
+    assert sql_replay.STATS == {"served": 1, "recorded": 1}
+
+    with pytest.raises(sql_replay.ReplayMiss, match="ALIAS_CDM = :alias"):
+        sql_replay.through("ora", SQL, {"alias": "B", "d": datetime(2024, 1, 1)}, _fetch(None, calls))
+    with pytest.raises(sql_replay.ReplayMiss):   # el origen es parte de la llave
+        sql_replay.through("pg", SQL, {"alias": "A", "d": datetime(2024, 1, 1)}, _fetch(None, calls))
+
+
+def test_live_does_not_record(replay_dir):
+    calls = []
+    sql_replay.through("ora", SQL, {"alias": "A"}, _fetch(pd.DataFrame({"X": [1]}), calls))
+    assert calls == [1] and not replay_dir.exists()
+
+
+@pytest.mark.parametrize("a, b", [
+    (pd.Timestamp("2024-01-31"), date(2024, 1, 31)),
+    ((101, 102), [np.int64(101), np.int64(102)]),   # IdList / tuple de contratos
+    (np.float64(1.5), 1.5),
+])
+def test_equivalent_params_share_key(a, b):
+    assert sql_replay.query_key("ora", SQL, {"p": a}) == sql_replay.query_key("ora", SQL, {"p": b})
+
+
+def test_unparquetable_frame_falls_back_to_pickle(replay_dir, monkeypatch):
+    df = pd.DataFrame({"MONTO": [Decimal("1.10"), "N/D", 3]})
+    monkeypatch.setattr(sql_replay, "MODE", "record")
+    sql_replay.through("ora", SQL, {"alias": "A"}, lambda: df)
+    assert sorted(p.suffix for p in (replay_dir / "ora").iterdir()) == [".json", ".pkl"]   # sin .tmp
+    monkeypatch.setattr(sql_replay, "MODE", "replay")
+    got = sql_replay.through("ora", SQL, {"alias": "A"}, None)
+    assert got["MONTO"].tolist() == [Decimal("1.10"), "N/D", 3]
+
+
+def test_configure_validates_mode(monkeypatch):
+    monkeypatch.setattr(sql_replay, "MODE", "live")
+    with pytest.raises(ValueError, match="SQL_BACKEND"):
+        sql_replay.configure(mode="grabar")
+    sql_replay.configure(mode=" Replay ")
+    assert sql_replay.is_replay()
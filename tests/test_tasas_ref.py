@@ -0,0 +1,99 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sql_replay
+
+
+def _vtr(seed=9):
+    """V_TASAS_REFERENCIA: días hábiles salteados, repetidos en el día, con ids fuera de FALLBACK_IDS."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for id_tasa, nombre in [(37, "TIIE 28"), (3, "CETES 28"), (8, "UDI")]:
+        dias = pd.bdate_range("2023-06-01", "2024-03-29")
+        dias = dias[rng.random(len(dias)) < 0.6]
+        for d in dias:
+            for _ in range(int(rng.integers(1, 3))):
+                rows.append({"ID_TASA_REFERENCIA": id_tasa, "TASA_REFERENCIA": nombre,
+                             "TASA": round(rng.uniform(10, 12), 4),
+                             "FECHA": d + pd.Timedelta(hours=int(rng.integers(0, 23)))})
+    return pd.DataFrame(rows)
+
+
+VTR = _vtr()
+
+
+def _as_text(df):
+    """FECHA como VARCHAR2 en la vista: ISO con hora o DD/MM/YYYY, más basura que se descarta."""
+    txt = [f.strftime("%Y-%m-%d %H:%M:%S") if i % 2 else f.strftime("%d/%m/%Y")
+           for i, f in enumerate(df["FECHA"])]
+    out = df.assign(FECHA=txt)
+    return pd.concat([out, pd.DataFrame([{"ID_TASA_REFERENCIA": 37, "TASA_REFERENCIA": "TIIE 28",
+                                          "TASA": 99.0, "FECHA": "sin fecha"}])], ignore_index=True)
+
+
+def _naive(ids, fechas):
+    """Para cada renglón: el día exacto o el último previo del id, MAX(TASA) / MAX(nombre) de ese día."""
+    dia = VTR.assign(DIA=VTR["FECHA"].dt.normalize())
+    out = []
+    for i, f in zip(ids, fechas):
+        if pd.isna(i) or pd.isna(f) or int(i) not in (37, 3):
+            out.append((np.nan, np.nan))
+            continue
+        prev = dia[(dia["ID_TASA_REFERENCIA"] == int(i)) & (dia["DIA"] <= pd.Timestamp(f).normalize())]
+        if prev.empty:
+            out.append((np.nan, np.nan))
+            continue
+        last = prev[prev["DIA"] == prev["DIA"].max()]
+        out.append((last["TASA"].max(), last["TASA_REFERENCIA"].max()))
+    return out
+
+
+@pytest.fixture(params=["date", "texto"])
+def tasas(request):
+    vtr = VTR if request.param == "date" else _as_text(VTR)
+    calls = []
+
+    def run_sql(sql, params=None):
+        calls.append(sql)
+        ids = [int(x) for x in re.search(r"IN \(([\d,]+)\)", sql).group(1).split(",")]
+        return vtr[vtr["ID_TASA_REFERENCIA"].isin(ids)]
+
+    ns = sql_replay.app_namespace(["tasas_ref_asof", "_load_tasas_ref"], {"run_sql": run_sql})
+    series = ns["_load_tasas_ref"]()
+    ns["tasas_ref_series"] = lambda: series   # _dim_get en la app
+    ns["calls"] = calls
+    return ns
+
+
+def test_asof_matches_naive_lookup(tasas):
+    rng = np.random.default_rng(1)
+    n = 400
+    ids = pd.Series(rng.choice([37, 3, 8, None], n), index=rng.permutation(n) + 1000)
+    fechas = pd.Series(pd.Timestamp("2023-05-15") + pd.to_timedelta(rng.integers(0, 330, n), unit="D")
+                       + pd.to_timedelta(rng.integers(0, 24, n), unit="h"), index=ids.index)
+    fechas.iloc[::37] = pd.NaT
+    got = tasas["tasas_ref_asof"](ids, fechas)
+    assert got.index.equals(ids.index)
+    want = _naive(ids, fechas)
+    assert got["TASA_BASE"].tolist() == pytest.approx([w[0] for w in want], nan_ok=True)
+    assert got["TASA_REF_NAME"].fillna("-").tolist() == [w[1] if isinstance(w[1], str) else "-" for w in want]
+    assert got["TASA_BASE"].dtype == np.float64
+
+
+def test_series_loaded_in_one_query(tasas):
+    series = tasas["_load_tasas_ref"]()
+    assert set(series) == {37, 3}
+    assert len(tasas["calls"]) == 2 and "IN (37,3)" in tasas["calls"][0]   # una por carga (fixture + aquí)
+    dias, tasa, _ = series[37]
+    assert (np.diff(dias) > np.timedelta64(0)).all()   # un valor por día, ordenado para searchsorted
+    assert 99.0 not in tasa
+
+
+def test_before_history_and_empty(tasas):
+    got = tasas["tasas_ref_asof"](pd.Series([37, 3]), pd.Series(pd.to_datetime(["2020-01-01", "2024-03-31"])))
+    assert np.isnan(got["TASA_BASE"].iloc[0]) and not np.isnan(got["TASA_BASE"].iloc[1])
+    empty = tasas["tasas_ref_asof"](pd.Series([], dtype=float), pd.Series([], dtype="datetime64[ns]"))
+    assert empty.empty and list(empty.columns) == ["TASA_BASE", "TASA_REF_NAME"]